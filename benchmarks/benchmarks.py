@@ -0,0 +1,243 @@
+# coding: utf-8
+
+"""
+Benchmarks for psrqpy using `airspeed velocity <https://asv.readthedocs.io/>`_.
+
+These use synthetic catalogues (see :mod:`benchmarks.synthetic`), so can be
+run offline. By default catalogues of up to 30000 pulsars are used, which
+can be changed by setting the ``PSRQPY_BENCHMARK_MAXSIZE`` environment
+variable (larger catalogues take a long time to generate and read in).
+"""
+
+from __future__ import division
+
+import os
+
+from .synthetic import SIZES, GENERATOR_VERSION, catalogue_dir, catalogue_file
+
+#: the maximum catalogue size to benchmark
+MAXSIZE = int(os.environ.get('PSRQPY_BENCHMARK_MAXSIZE', 30000))
+
+#: the parameters returned by the queries
+PARAMS = ['JNAME', 'BNAME', 'RAJ', 'DECJ', 'F0', 'F1', 'P0', 'P1', 'DM', 'PB',
+          'A1', 'TYPE', 'ASSOC', 'BINARY', 'AGE', 'BSURF', 'EDOT']
+
+#: the centre and radius (degrees) of the cone search
+CONE = ['17:45:40.0', '-29:00:28.0', 10.]
+
+#: plot settings for the P-Pdot diagrams (without requiring LaTeX)
+RCPARAMS = {'text.usetex': False}
+
+CONDITION = '(F0 > 100 && TYPE(BINARY)) || (AGE < 1e5 && ASSOC(SNR))'
+
+
+def check_size(npulsars):
+    """
+    Skip benchmarks for catalogues larger than :data:`MAXSIZE`.
+    """
+
+    if npulsars > MAXSIZE:
+        raise NotImplementedError
+
+
+def raw_catalogue_file(npulsars):
+    """
+    Return the path to a pickled :class:`pandas.DataFrame` of a synthetic
+    catalogue without any derived parameters, creating it if required.
+    """
+
+    from psrqpy.utils import get_catalogue
+
+    fname = os.path.join(catalogue_dir(), 'raw_v{}_{}.pkl'.format(GENERATOR_VERSION,
+                                                                 npulsars))
+
+    if not os.path.isfile(fname):
+        get_catalogue(path_to_db=catalogue_file(npulsars), pandas=True).to_pickle(fname)
+
+    return fname
+
+
+def query_file(npulsars, cone=False):
+    """
+    Return the path to a saved :class:`~psrqpy.search.QueryATNF` for a
+    synthetic catalogue (optionally with a cone search), creating it if
+    required.
+    """
+
+    from psrqpy import QueryATNF
+
+    fname = os.path.join(catalogue_dir(), 'query{}_v{}_{}.dat'.format('_cone' if cone else '',
+                                                                     GENERATOR_VERSION,
+                                                                     npulsars))
+
+    if not os.path.isfile(fname):
+        if cone:
+            query = QueryATNF(params=PARAMS, circular_boundary=CONE,
+                              frompandas=QueryATNF(loadquery=query_file(npulsars)).catalogue)
+        else:
+            query = QueryATNF(params=PARAMS, loadfromdb=catalogue_file(npulsars))
+        query.save(fname)
+
+    return fname
+
+
+class Catalogue(object):
+    """
+    Base class for benchmarks using the synthetic catalogues.
+    """
+
+    params = SIZES
+    param_names = ['npulsars']
+    timeout = 3600
+    number = 1  # each timing uses a newly loaded query (with empty caches)
+
+    def setup(self, npulsars):
+        from psrqpy import QueryATNF
+
+        check_size(npulsars)
+        self.query = QueryATNF(loadquery=query_file(npulsars))
+
+
+class ReadCatalogue(object):
+    """
+    Benchmarks for reading in a database file.
+    """
+
+    params = SIZES
+    param_names = ['npulsars']
+    timeout = 3600
+    number = 1
+
+    def setup(self, npulsars):
+        check_size(npulsars)
+        catalogue_file(npulsars)
+        query_file(npulsars)
+
+    def time_get_catalogue(self, npulsars):
+        from psrqpy.utils import get_catalogue
+        get_catalogue(path_to_db=catalogue_file(npulsars), pandas=True)
+
+    def peakmem_get_catalogue(self, npulsars):
+        from psrqpy.utils import get_catalogue
+        get_catalogue(path_to_db=catalogue_file(npulsars), pandas=True)
+
+    def time_load_query(self, npulsars):
+        from psrqpy import QueryATNF
+        QueryATNF(loadquery=query_file(npulsars))
+
+
+class Derived(object):
+    """
+    Benchmarks for calculating the derived parameters.
+    """
+
+    params = SIZES
+    param_names = ['npulsars']
+    timeout = 3600
+    number = 1
+
+    def setup(self, npulsars):
+        from pandas import read_pickle
+        from psrqpy import QueryATNF
+
+        check_size(npulsars)
+        self.query = QueryATNF(frompandas=read_pickle(raw_catalogue_file(npulsars)))
+
+    def time_set_derived(self, npulsars):
+        self.query.set_derived()
+        self.query.parse_types()
+
+
+class Conditions(Catalogue):
+    """
+    Benchmarks for applying conditions.
+    """
+
+    def time_condition_mask(self, npulsars):
+        from psrqpy.utils import condition_mask
+        condition_mask(self.query.catalogue, CONDITION)
+
+    def time_batch_condition(self, npulsars):
+        self.query.batch_condition(['F0 > {}'.format(f) for f in range(0, 1000, 50)],
+                                   counts=True)
+
+    def time_query_condition(self, npulsars):
+        self.query.condition = CONDITION
+        self.query.pandas
+
+
+class Tables(Catalogue):
+    """
+    Benchmarks for creating the query tables.
+    """
+
+    def time_pandas(self, npulsars):
+        self.query.pandas
+
+    def time_table(self, npulsars):
+        self.query.table
+
+    def time_catalogue_table(self, npulsars):
+        self.query.catalogue_table
+
+    def time_sort(self, npulsars):
+        self.query.sort('P0', sort_order='desc')
+
+
+class Pulsars(Catalogue):
+    """
+    Benchmarks for getting individual pulsars.
+    """
+
+    def setup(self, npulsars):
+        super(Pulsars, self).setup(npulsars)
+        self.names = self.query.catalogue['JNAME'].values[::max(1, npulsars // 100)]
+
+    def time_get_pulsar(self, npulsars):
+        for name in self.names:
+            self.query.get_pulsar(name)
+
+    def time_get_pulsars(self, npulsars):
+        self.query.get_pulsars()
+
+
+class ConeSearch(object):
+    """
+    Benchmarks for searching within a circle on the sky.
+    """
+
+    params = SIZES
+    param_names = ['npulsars']
+    timeout = 3600
+    number = 1
+
+    def setup(self, npulsars):
+        from psrqpy import QueryATNF
+
+        check_size(npulsars)
+        self.query = QueryATNF(loadquery=query_file(npulsars, cone=True))
+
+    def time_cone_search(self, npulsars):
+        self.query.pandas
+
+
+class PPdot(Catalogue):
+    """
+    Benchmarks for making P-Pdot diagrams.
+    """
+
+    def setup(self, npulsars):
+        import matplotlib
+        matplotlib.use('Agg')
+
+        super(PPdot, self).setup(npulsars)
+
+    def teardown(self, npulsars):
+        from matplotlib import pyplot as pl
+        pl.close('all')
+
+    def time_ppdot(self, npulsars):
+        self.query.ppdot(showtypes='all', rcparams=RCPARAMS)
+
+    def time_ppdot_density(self, npulsars):
+        self.query.ppdot(density=True, rcparams=RCPARAMS)
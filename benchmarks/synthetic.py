@@ -0,0 +1,363 @@
+# coding: utf-8
+
+"""
+Generate synthetic pulsar catalogue database files, in the same format as the
+ATNF Pulsar Catalogue ``psrcat.db`` file, for benchmarking.
+
+The catalogues contain a mixture of normal and millisecond pulsars, binary
+systems, associations and types, with roughly the same coverage of
+parameters (and uncertainties and reference tags) as the real catalogue.
+Files can be created from the command line with, e.g.,
+
+.. code-block:: bash
+
+    python benchmarks/synthetic.py 30000 psrcat_30000.db
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+#: the catalogue sizes used in the benchmarks
+SIZES = [3000, 30000, 300000, 3000000]
+
+#: version of the generator (included in cached file names, so changes to the
+#: generator produce new files)
+GENERATOR_VERSION = 1
+
+# the fraction of pulsars with each optional parameter (for normal and
+# millisecond pulsars)
+COVERAGE = {'PSRB': (0.3, 0.05),
+            'PMRA': (0.15, 0.5),
+            'PX': (0.03, 0.2),
+            'F2': (0.1, 0.05),
+            'S400': (0.25, 0.3),
+            'S1400': (0.55, 0.7),
+            'W50': (0.6, 0.5),
+            'DIST_A': (0.02, 0.05),
+            'DIST_AMN': (0.02, 0.02),
+            'TYPE': (0.05, 0.1),
+            'ASSOC': (0.05, 0.15),
+            'BINARY': (0.01, 0.8),
+            'SURVEY': (0.95, 0.95)}
+
+TYPES = ['HE', 'NRAD', 'RRAT', 'AXP', 'XINS']
+ASSOCS = ['SNR:G{:05.1f}{:+04.1f}', 'GC:NGC{:04.0f}', 'XRS:{:04.0f}', 'GRS:{:04.0f}']
+BINCOMPS = ['He', 'CO', 'ONeMg', 'NS', 'MS', 'UL']
+SURVEYS = ['pksmb', 'htru_pks', 'gbncc', 'palfa', 'pks70', 'ar4', 'misc']
+
+# a pool of reference tags in the same style as the catalogue
+_TAGS = None
+
+
+def reference_tags(ntags=5000, seed=0):
+    """
+    Return a pool of synthetic reference tags, e.g., ``abc+12``.
+    """
+
+    global _TAGS
+
+    if _TAGS is None:
+        rng = np.random.RandomState(seed)
+        letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+        tags = set()
+        while len(tags) < ntags:
+            initials = ''.join(rng.choice(letters, rng.randint(2, 4)))
+            sep = '+' if rng.rand() < 0.6 else ''
+            tags.add('{}{}{:02d}'.format(initials, sep, rng.randint(0, 100)))
+        _TAGS = np.array(sorted(tags))
+
+    return _TAGS
+
+
+def _sexagesimal(values, ndp, sign=False):
+    """
+    Convert values (in hours or degrees) into sexagesimal strings.
+    """
+
+    strings = []
+    for value in values:
+        prefix = ('-' if value < 0 else '+') if sign else ''
+        value = abs(value)
+        units = int(value)
+        minutes = int((value - units)*60.)
+        seconds = ((value - units)*60. - minutes)*60.
+        strings.append('{}{:02d}:{:02d}:{:0{}.{}f}'.format(prefix, units, minutes,
+                                                          seconds, ndp + 3, ndp))
+    return strings
+
+
+def _names(ra, dec):
+    """
+    Create unique J-names from positions (appending letters to any
+    duplicates, as for pulsars in globular clusters).
+    """
+
+    from pandas import Series
+
+    rah = (ra/15.).astype(int)
+    ram = ((ra/15. - rah)*60.).astype(int)
+    decd = np.abs(dec).astype(int)
+    decm = ((np.abs(dec) - decd)*60.).astype(int)
+
+    names = np.array(['J{:02d}{:02d}{}{:02d}{:02d}'.format(h, m, '-' if d < 0 else '+', dd, dm)
+                      for h, m, d, dd, dm in zip(rah, ram, dec, decd, decm)])
+
+    rank = Series(names).groupby(names).cumcount().values
+
+    for i in np.flatnonzero(rank > 0):
+        suffix = ''
+        n = rank[i]
+        while n > 0:
+            n, r = divmod(n - 1, 26)
+            suffix = chr(ord('A') + r) + suffix
+        names[i] += suffix
+
+    return names
+
+
+def _line(name, value, error=None, ref=None):
+    """
+    Format a single line of the database file.
+    """
+
+    line = '{:<9s}{:<25s}'.format(name, value)
+    if error is not None:
+        line += ' {:<6s}'.format(error)
+    if ref is not None:
+        line += ' {}'.format(ref)
+
+    return line.rstrip() + '\n'
+
+
+def _chunk(rng, npsr):
+    """
+    Generate the database entries for a chunk of pulsars.
+    """
+
+    from astropy.coordinates import SkyCoord
+    import astropy.units as aunits
+
+    tags = reference_tags()
+
+    def ref():
+        return tags[rng.randint(len(tags))]
+
+    def err(low=1, high=50):
+        # an uncertainty on the last digits of a value
+        return str(rng.randint(low, high))
+
+    msp = rng.rand(npsr) < 0.1
+
+    def has(par):
+        frac = np.where(msp, COVERAGE[par][1], COVERAGE[par][0])
+        return rng.rand(npsr) < frac
+
+    # sky positions concentrated towards the Galactic plane (millisecond
+    # pulsars are more isotropic)
+    gl = rng.uniform(0., 360., npsr)
+    gb = np.where(msp, np.degrees(np.arcsin(rng.uniform(-1., 1., npsr))),
+                  rng.laplace(0., 3., npsr))
+    gb = np.clip(gb, -89.9, 89.9)
+    coords = SkyCoord(gl*aunits.deg, gb*aunits.deg, frame='galactic').icrs
+    ra = coords.ra.deg
+    dec = coords.dec.deg
+
+    names = _names(ra, dec)
+    rastrs = _sexagesimal(ra/15., 4)
+    decstrs = _sexagesimal(dec, 3, sign=True)
+
+    # spin parameters
+    period = np.where(msp, 10**rng.normal(-2.4, 0.3, npsr),
+                      10**rng.normal(-0.2, 0.35, npsr))
+    pdot = np.where(msp, 10**rng.normal(-19.7, 0.5, npsr),
+                    10**rng.normal(-14.6, 1., npsr))
+    haspdot = rng.rand(npsr) < np.where(msp, 0.9, 0.85)
+    usep0 = rng.rand(npsr) < 0.2  # some pulsars have P0 rather than F0
+    dm = 10**rng.normal(np.where(msp, 1.4, 2.), 0.4)
+    epoch = rng.uniform(48000., 59000., npsr)
+    dist = 10**rng.normal(0.3, 0.35, npsr)
+
+    has_b = has('PSRB') & ~msp
+    has_pm = has('PMRA')
+    has_px = has('PX')
+    has_f2 = has('F2')
+    has_s400 = has('S400')
+    has_s1400 = has('S1400')
+    has_w50 = has('W50')
+    has_dista = has('DIST_A')
+    has_distlims = has('DIST_AMN')
+    has_type = has('TYPE')
+    has_assoc = has('ASSOC')
+    has_binary = has('BINARY')
+    has_survey = has('SURVEY')
+
+    lines = []
+    for i in range(npsr):
+        lines.append(_line('PSRJ', names[i], ref=ref()))
+
+        if has_b[i]:
+            lines.append(_line('PSRB', 'B' + names[i][1:8], ref=ref()))
+
+        lines.append(_line('RAJ', rastrs[i], err(), ref()))
+        lines.append(_line('DECJ', decstrs[i], err(), ref()))
+
+        if has_pm[i]:
+            lines.append(_line('PMRA', '{:.2f}'.format(rng.normal(0., 15.)),
+                               err(1, 300), ref()))
+            lines.append(_line('PMDEC', '{:.2f}'.format(rng.normal(0., 15.)),
+                               err(1, 300), ref()))
+
+        if has_px[i]:
+            lines.append(_line('PX', '{:.3f}'.format(1./dist[i]),
+                               err(10, 500), ref()))
+
+        if usep0[i]:
+            lines.append(_line('P0', '{:.12f}'.format(period[i]), err(),
+                               ref()))
+            if haspdot[i]:
+                lines.append(_line('P1', '{:.5E}'.format(pdot[i]), err(),
+                                   ref()))
+        else:
+            lines.append(_line('F0', '{:.13f}'.format(1./period[i]), err(),
+                               ref()))
+            if haspdot[i]:
+                lines.append(_line('F1', '{:.5E}'.format(-pdot[i]/period[i]**2),
+                                   err(), ref()))
+            if has_f2[i]:
+                lines.append(_line('F2', '{:.3E}'.format(rng.normal(0., 1e-25)),
+                                   err(), ref()))
+
+        lines.append(_line('DM', '{:.3f}'.format(dm[i]), err(), ref()))
+        lines.append(_line('PEPOCH', '{:.0f}'.format(epoch[i]), ref=ref()))
+        lines.append(_line('POSEPOCH', '{:.0f}'.format(epoch[i]), ref=ref()))
+        lines.append(_line('DMEPOCH', '{:.0f}'.format(epoch[i]), ref=ref()))
+
+        if has_s400[i]:
+            lines.append(_line('S400', '{:.1f}'.format(10**rng.normal(1., 0.5)),
+                               err(1, 10), ref()))
+        if has_s1400[i]:
+            lines.append(_line('S1400', '{:.2f}'.format(10**rng.normal(-0.3, 0.5)),
+                               err(1, 10), ref()))
+        if has_w50[i]:
+            lines.append(_line('W50', '{:.1f}'.format(period[i]*1e3*rng.uniform(0.01, 0.1)),
+                               ref=ref()))
+
+        if has_binary[i]:
+            ell1 = msp[i] and rng.rand() < 0.6
+            pb = 10**rng.normal(0.5 if msp[i] else 1.5, 0.8)
+            a1 = 10**rng.normal(0.7 if msp[i] else 1.2, 0.6)
+            lines.append(_line('BINARY', 'ELL1' if ell1 else rng.choice(['BT', 'DD']),
+                               ref=ref()))
+            lines.append(_line('PB', '{:.10f}'.format(pb), err(), ref()))
+            lines.append(_line('A1', '{:.7f}'.format(a1), err(), ref()))
+            if ell1:
+                lines.append(_line('TASC', '{:.8f}'.format(epoch[i]), err(),
+                                   ref()))
+                lines.append(_line('EPS1', '{:.2E}'.format(rng.normal(0., 1e-5)),
+                                   err(), ref()))
+                lines.append(_line('EPS2', '{:.2E}'.format(rng.normal(0., 1e-5)),
+                                   err(), ref()))
+            else:
+                lines.append(_line('T0', '{:.6f}'.format(epoch[i]), err(),
+                                   ref()))
+                lines.append(_line('ECC', '{:.7f}'.format(rng.uniform(0., 0.9)),
+                                   err(), ref()))
+                lines.append(_line('OM', '{:.4f}'.format(rng.uniform(0., 360.)),
+                                   err(), ref()))
+            if rng.rand() < 0.5:
+                lines.append(_line('BINCOMP', rng.choice(BINCOMPS), ref=ref()))
+
+        if has_type[i]:
+            lines.append(_line('TYPE', rng.choice(TYPES), ref=ref()))
+
+        if has_assoc[i]:
+            assoc = ASSOCS[rng.randint(len(ASSOCS))]
+            if assoc.startswith('SNR'):
+                assoc = assoc.format(gl[i], gb[i])
+            else:
+                assoc = assoc.format(rng.randint(1, 9999))
+            lines.append(_line('ASSOC', assoc, ref=ref()))
+
+        if has_dista[i]:
+            lines.append(_line('DIST_A', '{:.2f}'.format(dist[i]), ref=ref()))
+        if has_distlims[i]:
+            lines.append(_line('DIST_AMN', '{:.2f}'.format(0.7*dist[i]), ref=ref()))
+            lines.append(_line('DIST_AMX', '{:.2f}'.format(1.3*dist[i]), ref=ref()))
+
+        if has_survey[i]:
+            nsurveys = rng.randint(1, 4)
+            lines.append(_line('SURVEY', ','.join(rng.choice(SURVEYS, nsurveys,
+                                                             replace=False))))
+
+        lines.append('@' + '-'*65 + '\n')
+
+    return ''.join(lines)
+
+
+def generate_catalogue(fname, npulsars, seed=None, chunksize=10000):
+    """
+    Write a synthetic catalogue database file.
+
+    Args:
+        fname (str): the output file name.
+        npulsars (int): the number of pulsars in the catalogue.
+        seed (int): the random seed. Defaults to None, in which case
+            `npulsars` is used, so that catalogues of a given size are always
+            the same.
+        chunksize (int): the number of pulsars to generate at once.
+    """
+
+    rng = np.random.RandomState(npulsars if seed is None else seed)
+
+    tmpfile = fname + '.tmp'
+    with open(tmpfile, 'w') as fp:
+        fp.write('#CATALOGUE synthetic-{}\n'.format(GENERATOR_VERSION))
+        fp.write('# A synthetic catalogue of {} pulsars for benchmarking\n'.format(npulsars))
+        for start in range(0, npulsars, chunksize):
+            fp.write(_chunk(rng, min(chunksize, npulsars - start)))
+
+    os.rename(tmpfile, fname)
+
+
+def catalogue_dir():
+    """
+    The directory in which generated catalogues are stored. This can be set
+    with the ``PSRQPY_BENCHMARK_DIR`` environment variable, otherwise a
+    directory in the system temporary directory is used.
+    """
+
+    path = os.environ.get('PSRQPY_BENCHMARK_DIR',
+                          os.path.join(tempfile.gettempdir(), 'psrqpy_benchmarks'))
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    return path
+
+
+def catalogue_file(npulsars):
+    """
+    Return the path to a synthetic catalogue with the given number of
+    pulsars, generating it if it does not already exist.
+    """
+
+    fname = os.path.join(catalogue_dir(), 'psrcat_v{}_{}.db'.format(GENERATOR_VERSION,
+                                                                   npulsars))
+
+    if not os.path.isfile(fname):
+        generate_catalogue(fname, npulsars)
+
+    return fname
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: {} npulsars outfile'.format(sys.argv[0]))
+        sys.exit(1)
+
+    generate_catalogue(sys.argv[2], int(sys.argv[1]))
@@ -310,5 +310,4 @@ intersphinx_mapping = {'python': ('http://docs.python.org/', None),
                        'astropy': ('http://docs.astropy.org/en/latest/', None),
                        'requests': ('http://docs.python-requests.org/en/master/', None),
                        'ads': ('https://ads.readthedocs.io/en/latest/', None),
-                       'bs4': ('https://www.crummy.com/software/BeautifulSoup/bs4/doc/', None),
                        'pandas': ('http://pandas.pydata.org/pandas-docs/stable/', None)}
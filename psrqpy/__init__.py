@@ -2,10 +2,9 @@
 
 """ A Python tool for interacting with the ATNF pulsar catalogue """
 
+import sys
 import warnings
-from .search import QueryATNF
-from .pulsar import Pulsar, Pulsars
-from .utils import *
+from importlib import import_module
 
 __version__ = "1.0.0"
 
@@ -23,6 +22,67 @@ __citation__ = """@article{psrqpy,
 }
 """
 
+# the public objects of the package and the modules that they are in. These
+# modules (and their dependencies, e.g., astropy and pandas) are only imported
+# when one of their objects is first used
+_LAZY_OBJECTS = {
+    'search': ['QueryATNF', 'shared_catalogue', 'evict_shared_catalogue'],
+    'pulsar': ['Pulsar', 'Pulsars'],
+    'utils': ['ADSSearch', 'B_field', 'B_field_lc', 'B_field_pdot', 'LoadStats',
+              'PPdotTemplate', 'RateLimiter', 'ReferenceIndex', 'age_pdot',
+              'batch_condition', 'cache_dir', 'characteristic_age', 'check_update',
+              'companion_mass', 'condition', 'condition_mask', 'death_line',
+              'download_file', 'extract_bundle', 'get_catalogue',
+              'get_glitch_catalogue', 'get_references', 'get_session',
+              'glitch_aggregates', 'label_line', 'parse_glitch_table',
+              'parse_reference', 'propagate_uncertainties', 'resolve_ads_references',
+              'spin_down_flux', 'spin_down_luminosity', 'BUNDLE_MEMBERS',
+              'DOWNLOAD_CHUNK_SIZE', 'GLITCH_COLUMNS', 'LOGEXPRS', 'LOGEXPRS_REGEX',
+              'MC_DERIVED', 'MC_INPUTS', 'PROB_REFS', 'YEAR_SECONDS'],
+    'serve': ['CatalogueServer', 'query_server'],
+    'config': ['ADS_URL', 'ATNF_BASE_URL', 'ATNF_TARBALL', 'GLITCH_URL', 'PSR_ALL',
+               'PSR_ALL_PARS'],
+}
+
+_LAZY = {name: module for module, names in _LAZY_OBJECTS.items() for name in names}
+
+__all__ = sorted(_LAZY)
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ is not available, so import everything
+    from .search import QueryATNF, shared_catalogue, evict_shared_catalogue
+    from .pulsar import Pulsar, Pulsars
+    from .serve import CatalogueServer, query_server
+    from .utils import *
+else:
+    def __getattr__(name):
+        if name in _LAZY_OBJECTS:
+            # a submodule, e.g., psrqpy.utils
+            return import_module('.' + name, __name__)
+
+        if name in _LAZY:
+            value = getattr(import_module('.' + _LAZY[name], __name__), name)
+        elif not name.startswith('_'):
+            # anything else previously exported from psrqpy.utils
+            try:
+                value = getattr(import_module('.utils', __name__), name)
+            except AttributeError:
+                value = None
+
+            if value is None:
+                raise AttributeError("module '{}' has no attribute '{}'".format(__name__,
+                                                                                name))
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+        # store the object so that it is found directly next time
+        globals()[name] = value
+
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY) | set(_LAZY_OBJECTS))
+
 
 # set formatting of warnings to not include line number and code (see
 # e.g. https://pymotw.com/3/warnings/#formatting)
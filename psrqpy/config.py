@@ -259,6 +259,19 @@ PSR_DERIVED['B_LC'] =    {'ref': False, 'err': False, 'units': 'G'}   # Magnetic
 
 PSR_DERIVED_PARS = list(PSR_DERIVED.keys())
 
+# parameters from the Jodrell Bank glitch catalogue (added with QueryATNF.add_glitches()). These
+# are not ATNF Pulsar Catalogue parameters, so are not included in PSR_ALL
+PSR_GLITCH = OrderedDict()
+PSR_GLITCH['GLITCH_N'] =        {'ref': False, 'err': False, 'units': None}   # Number of glitches
+PSR_GLITCH['GLITCH_DF'] =       {'ref': False, 'err': False, 'units': None}   # Total fractional frequency change
+PSR_GLITCH['GLITCH_MAXDF'] =    {'ref': False, 'err': False, 'units': None}   # Largest fractional frequency change
+PSR_GLITCH['GLITCH_DF1'] =      {'ref': False, 'err': False, 'units': None}   # Total fractional frequency derivative change
+PSR_GLITCH['GLITCH_FIRST'] =    {'ref': False, 'err': False, 'units': 'd'}   # MJD of the first glitch
+PSR_GLITCH['GLITCH_LAST'] =     {'ref': False, 'err': False, 'units': 'd'}   # MJD of the most recent glitch
+PSR_GLITCH['GLITCH_INTERVAL'] = {'ref': False, 'err': False, 'units': 'd'}   # Mean time between glitches
+
+PSR_GLITCH_PARS = list(PSR_GLITCH.keys())
+
 # a list of all allowed parameters for querying
 PSR_ALL = OrderedDict(itertools.chain(PSR_GENERAL.items(), PSR_TIMING.items(),
                                       PSR_BINARY.items(), PSR_DERIVED.items()))
@@ -6,8 +6,11 @@ or an interable list of pulsars.
 from __future__ import print_function, division
 
 import warnings
+from collections import OrderedDict
 
-from six import string_types, iteritems
+import numpy as np
+from pandas import isna
+from six import string_types, integer_types, iteritems
 
 from .config import PSR_ALL_PARS, PSR_ALL
 
@@ -24,11 +27,19 @@ class Pulsar(object):
     Additional keyword arguments are any of the valid queriable pulsar
     parameters.
 
+    Any parameters that are not given are fetched from the catalogue when
+    first requested (if no query is given the process-wide shared catalogue,
+    see :func:`~psrqpy.search.shared_catalogue`, is used). The pulsar's
+    whole catalogue row is fetched (and cached) in one go, so subsequent
+    requests for other parameters do not need to access the catalogue again.
+
     """
 
     def __init__(self, psrname, query=None, **kwargs):
         self._name = psrname
         self._query = query
+        self._row = None  # cached catalogue row
+        self._row_revision = None  # catalogue revision of the cached row
 
         for key, value in iteritems(kwargs):
             setattr(self, key, value)
@@ -47,15 +58,71 @@ class Pulsar(object):
         """
 
         keys = PSR_ALL_PARS+[par+'_ERR' for par in PSR_ALL_PARS]
-        return [key for key in self.__dict__ if key in keys]
+        attrs = [key for key in self.__dict__ if key in keys]
+
+        # add parameters from any cached catalogue row
+        if self.__dict__.get('_row', None) is not None:
+            attrs += [key for key in self._row if key in keys and
+                      key not in attrs]
+
+        return attrs
 
     def items(self):
         """
         Return a list of the class attribute values.
         """
 
-        keys = PSR_ALL_PARS+[par+'_ERR' for par in PSR_ALL_PARS]
-        return [value for key, value in iteritems(self.__dict__) if key in keys]
+        return [self[key] for key in self.keys()]
+
+    def prefetch(self, params=None):
+        """
+        Fetch and cache the pulsar's catalogue row, so that any parameter
+        values can be returned without further access to the catalogue.
+
+        Args:
+            params (list, str): a list of parameter names to return. Defaults
+                to None, in which case all the pulsar's parameters are
+                returned.
+
+        Returns:
+            dict: a dictionary of the requested parameter values.
+        """
+
+        self._get_row()
+
+        if params is None:
+            params = self.keys()
+        elif isinstance(params, string_types):
+            params = [params]
+
+        return {param: self[param] for param in params}
+
+    def _get_row(self):
+        """
+        Return the cached catalogue row for the pulsar, fetching it from the
+        catalogue if it has not yet been fetched, or the catalogue has since
+        changed.
+        """
+
+        if self._query is None:
+            # use the shared catalogue
+            try:
+                from .search import shared_catalogue
+                self._query = shared_catalogue()
+            except IOError:
+                raise Exception('Problem querying ATNF catalogue')
+
+        revision = getattr(self._query, '_catalogue_revision', 0)
+        if self.__dict__.get('_row', None) is None or self._row_revision != revision:
+            row = self._query._pulsar_row(self.name)
+
+            if row is None:
+                raise Exception('Pulsar "{}" is unknown'.format(self.name))
+
+            self._row = row
+            self._row_revision = revision
+
+        return self._row
 
     @property
     def name(self):
@@ -75,9 +142,7 @@ class Pulsar(object):
         """
 
         ukey = key.upper()
-        pulsarname = self.name
 
-        param = None
         if key in self.__dict__:
             return self.__dict__[key]
         elif ukey in self.__dict__:
@@ -91,31 +156,13 @@ class Pulsar(object):
             if tkey not in PSR_ALL_PARS:
                 raise KeyError('"{}" is not a recognised pulsar '
                                'parameter'.format(tkey))
-            else:
-                # generate a query for the key and add it
-                if self._query is None:
-                    try:
-                        from .search import QueryATNF
-                        self._query = QueryATNF()
-                    except IOError:
-                        raise Exception('Problem querying ATNF catalogue')
-
-            psrrow = self._query.get_pulsar(pulsarname)
 
-            if psrrow is None:
-                raise Exception('Pulsar "{}" is unknown'.format(pulsarname))
+            row = self._get_row()
 
-            param = psrrow[ukey][0]     # required output parameter
-            setattr(self, ukey, param)   # set output parameter value
+            if ukey not in row:
+                raise KeyError('"{}" is not in the catalogue'.format(ukey))
 
-            # set parameter value if an error value was requested
-            if PSR_ALL[tkey]['err']:
-                if tkey != ukey:  # asking for error, so set actual value
-                    setattr(self, tkey, psrrow[tkey][0])
-                else:  # asking for value, so set error
-                    setattr(self, tkey+'_ERR', psrrow[tkey+'_ERR'][0])
-
-        return param
+        return row[ukey]
 
     def __getattr__(self, key):
         """
@@ -175,7 +222,7 @@ class Pulsar(object):
         name.
         """
 
-        if not isinstance(other, Pulsar):
+        if not isinstance(other, (Pulsar, PulsarRow)):
             return False
 
         return bool(self.name == other.name)
@@ -185,7 +232,7 @@ class Pulsar(object):
         Define '!=' rich comparison methods. False if pulsars have the same name.
         """
 
-        if not isinstance(other, Pulsar):
+        if not isinstance(other, (Pulsar, PulsarRow)):
             return True
 
         return bool(self.name != other.name)
@@ -203,14 +250,178 @@ class Pulsar(object):
         return newpsr
 
 
+class PulsarRow(object):
+    """
+    A lightweight object holding a single pulsar from a
+    :class:`~psrqpy.search.QueryATNF` catalogue. Rather than storing the
+    pulsar's parameters, it holds the pulsar's row in the catalogue and
+    parameter values are read directly from the catalogue's columns. These
+    are created by :class:`~psrqpy.pulsar.Pulsars` and provide the same
+    parameter access as a :class:`~psrqpy.pulsar.Pulsar`.
+
+    Args:
+        query (:class:`psrqpy.QueryATNF`): the query containing the pulsar.
+        psrname (str): the pulsar name.
+        row (int): the row of the pulsar in the query's catalogue.
+    """
+
+    __slots__ = ('_query', '_name', '_row', '_revision')
+
+    def __init__(self, query, psrname, row):
+        self._query = query
+        self._name = psrname
+        self._row = row
+        self._revision = getattr(query, '_catalogue_revision', 0)
+
+    @property
+    def name(self):
+        """
+        Return the pulsar name
+        """
+
+        return self._name
+
+    @property
+    def row(self):
+        """
+        Return the pulsar's row in the catalogue (which is found again if the
+        catalogue has changed).
+        """
+
+        revision = getattr(self._query, '_catalogue_revision', 0)
+        if self._revision != revision:
+            self._row = self._query._pulsar_index(self._name)
+            self._revision = revision
+
+            if self._row is None:
+                raise Exception('Pulsar "{}" is unknown'.format(self._name))
+
+        return self._row
+
+    def keys(self):
+        """
+        Return a list of the query parameter names for the pulsar.
+        """
+
+        keys = PSR_ALL_PARS+[par+'_ERR' for par in PSR_ALL_PARS]
+        return [key for key in self._query._query_columns() if key in keys]
+
+    def items(self):
+        """
+        Return a list of the query parameter values for the pulsar.
+        """
+
+        return [self[key] for key in self.keys()]
+
+    def prefetch(self, params=None):
+        """
+        Return a dictionary of parameter values for the pulsar (provided for
+        compatibility with :meth:`psrqpy.pulsar.Pulsar.prefetch`).
+
+        Args:
+            params (list, str): a list of parameter names to return. Defaults
+                to None, in which case all the query parameters are returned.
+
+        Returns:
+            dict: a dictionary of the requested parameter values.
+        """
+
+        if params is None:
+            params = self.keys()
+        elif isinstance(params, string_types):
+            params = [params]
+
+        return {param: self[param] for param in params}
+
+    def __getitem__(self, key):
+        ukey = key.upper()
+
+        tkey = ukey[:-4] if ukey[-4:] == '_ERR' else ukey
+        if tkey not in PSR_ALL_PARS:
+            raise KeyError('"{}" is not a recognised pulsar '
+                           'parameter'.format(tkey))
+
+        if ukey not in self._query.columns:
+            raise KeyError('"{}" is not in the catalogue'.format(ukey))
+
+        value = self._query.catalogue[ukey].values[self.row]
+
+        return np.ma.masked if isna(value) else value
+
+    def __getattr__(self, key):
+        if key.upper() in PSR_ALL_PARS:
+            try:
+                return self[key]
+            except KeyError:
+                pass
+
+        raise AttributeError(key)
+
+    def __getstate__(self):
+        """
+        Define to allow pickling.
+        """
+
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, d):
+        """
+        Define to allow pickling.
+        """
+
+        for slot, value in iteritems(d):
+            object.__setattr__(self, slot, value)
+
+    def __dir__(self):
+        return self.keys()
+
+    def __repr__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        if not isinstance(other, (Pulsar, PulsarRow)):
+            return False
+
+        return bool(self.name == other.name)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+
 class Pulsars(object):
     """
     Class to contain multiple :class:`~psrqpy.pulsar.Pulsar` objects.
+
+    If created from a query (see :meth:`psrqpy.QueryATNF.get_pulsars`) the
+    pulsars are not copied, but are held as their rows in the query's
+    catalogue, and :class:`~psrqpy.pulsar.PulsarRow` objects are only created
+    when individual pulsars are accessed. Giving a parameter name, rather
+    than a pulsar name, returns an array of that parameter's values for all
+    the pulsars, e.g., ``psrs['F0']``.
+
+    Args:
+        query (:class:`psrqpy.QueryATNF`): a query containing the pulsars.
+        rows (array_like): the rows of the pulsars in the query's catalogue.
     """
 
-    def __init__(self):
+    def __init__(self, query=None, rows=None):
         self._num_pulsars = 0  # number of pulsars in the object
         self._psrs = {}        # dictionary of Pulsar objects in the object, keyed to the name
+        self._query = query    # query containing any pulsar rows
+
+        if query is not None and rows is not None:
+            # store catalogue rows for each pulsar (keyed to the name)
+            names = query.catalogue['JNAME'].values[rows]
+            self._psrs = OrderedDict(zip(names, np.asarray(rows).tolist()))
+            self._num_pulsars = len(self._psrs)
+
+        self._revision = getattr(query, '_catalogue_revision', 0)
 
     def __iter__(self):
         """
@@ -221,14 +432,112 @@ class Pulsars(object):
 
     def __getitem__(self, key):
         """
-        Define getitem to get a Pulsar object from the _psrs dictionary
+        Define getitem to get a Pulsar object from the _psrs dictionary, or
+        an array of parameter values for all pulsars.
         """
 
         if key in self._psrs.keys():
-            return self._psrs[key]
+            return self._get_pulsar(key)
+
+        if isinstance(key, string_types):
+            ukey = key.upper()
+            tkey = ukey[:-4] if ukey[-4:] == '_ERR' else ukey
+            if tkey in PSR_ALL_PARS:
+                return self.column(ukey)
 
         return None
 
+    def _get_pulsar(self, psrname):
+        """
+        Return a pulsar, creating a :class:`~psrqpy.pulsar.PulsarRow` for it
+        if only its catalogue row is stored.
+        """
+
+        self._check_rows()
+
+        psr = self._psrs[psrname]
+
+        if isinstance(psr, integer_types):
+            psr = PulsarRow(self._query, psrname, psr)
+            self._psrs[psrname] = psr
+
+        return psr
+
+    def _check_rows(self):
+        """
+        Find the catalogue rows of any pulsars again if the query's catalogue
+        has changed (e.g., been re-sorted).
+        """
+
+        revision = getattr(self._query, '_catalogue_revision', 0)
+        if self.__dict__.get('_revision', revision) != revision:
+            for psrname, psr in iteritems(self._psrs):
+                if isinstance(psr, integer_types):
+                    row = self._query._pulsar_index(psrname)
+                    if row is None:
+                        raise Exception('Pulsar "{}" is unknown'.format(psrname))
+                    self._psrs[psrname] = row
+
+        self._revision = revision
+
+    def column(self, param):
+        """
+        Return an array of a parameter's values for all the pulsars. For
+        pulsars held as catalogue rows the values are taken directly from the
+        catalogue column.
+
+        Args:
+            param (str): the parameter name.
+
+        Returns:
+            :class:`~numpy.ndarray`: an array of values, in which missing
+            values are NaN.
+        """
+
+        ukey = param.upper()
+
+        values = None
+        if self._query is not None and ukey in self._query.columns:
+            values = self._query.catalogue[ukey].values
+
+        self._check_rows()
+
+        rows = np.full(self._num_pulsars, -1, dtype=int)
+        for i, psrname in enumerate(self._psrs):
+            psr = self._psrs[psrname]
+            if isinstance(psr, PulsarRow) and psr._query is self._query:
+                psr = psr.row
+
+            if isinstance(psr, integer_types):
+                rows[i] = psr
+
+        if values is not None and np.all(rows >= 0):
+            # all values come from the catalogue column
+            return values[rows]
+
+        # otherwise get values one pulsar at a time
+        column = []
+        for i, psrname in enumerate(self._psrs):
+            if rows[i] >= 0 and values is not None:
+                value = values[rows[i]]
+            else:
+                try:
+                    value = self._get_pulsar(psrname)[ukey]
+                except KeyError:
+                    value = np.ma.masked
+
+            column.append(np.nan if value is np.ma.masked else value)
+
+        column = np.array(column)
+        if column.dtype == object:
+            try:
+                # convert numerical values to floats
+                column = column.astype(float)
+            except (TypeError, ValueError):
+                pass
+
+        return column
+
     def __getstate__(self):
         """
         Define to allow pickling.
@@ -243,6 +552,9 @@ class Pulsars(object):
 
         self.__dict__.update(d)
 
+        if '_query' not in d:
+            self._query = None
+
     def __len__(self):
         """
         Define len method as the number of pulsars in the object
@@ -260,9 +572,9 @@ class Pulsars(object):
                 object
         """
 
-        assert isinstance(psr, (Pulsar, Pulsars)), 'psr is not a Pulsar type'
+        assert isinstance(psr, (Pulsar, PulsarRow, Pulsars)), 'psr is not a Pulsar type'
 
-        if isinstance(psr, Pulsar):
+        if isinstance(psr, (Pulsar, PulsarRow)):
             if psr.name not in self._psrs:
                 self._num_pulsars += 1  # add one pulsar
                 self._psrs[psr.name] = psr
@@ -271,7 +583,7 @@ class Pulsars(object):
             # check for duplicates
             for psrname in psr:
                 if psrname not in self._psrs.keys():  # don't add duplicates
-                    self._psrs[psrname] = psr[psrname]
+                    self._psrs[psrname] = psr._get_pulsar(psrname)
                     self._num_pulsars += 1
 
     def remove_pulsar(self, psrname):
@@ -298,8 +610,10 @@ class Pulsars(object):
         assert isinstance(psrname, string_types), 'psrname is not a string'
 
         if psrname in self._psrs:
+            psr = self._get_pulsar(psrname)
             self._num_pulsars -= 1
-            return self._psrs.pop(psrname)
+            del self._psrs[psrname]
+            return psr
 
         return None
 
@@ -308,4 +622,4 @@ class Pulsars(object):
         Define string method
         """
 
-        return '\n'.join([self._psrs[psr].name for psr in self._psrs])
+        return '\n'.join([psr for psr in self._psrs])
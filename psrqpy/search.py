@@ -6,8 +6,11 @@ information.
 
 from __future__ import print_function, division
 
+import os
 import warnings
+import threading
 from collections import OrderedDict
+import numbers
 import re
 import six
 
@@ -18,13 +21,25 @@ import numpy as np
 from astropy.coordinates import SkyCoord, ICRS, BarycentricTrueEcliptic, Galactic
 import astropy.units as aunits
 from astropy.constants import c, GM_sun
-from astropy.table import Table
+from astropy.table import Table, MaskedColumn
 
-from pandas import DataFrame, Series
-from copy import deepcopy
+from pandas import DataFrame, Series, factorize, isna
 
 from .config import ATNF_BASE_URL, PSR_ALL, PSR_ALL_PARS, PSR_TYPE, PSR_ASSOC_TYPE, PSR_BINARY_TYPE
-from .utils import condition, age_pdot, B_field_pdot
+from .config import PSR_GLITCH, PSR_GLITCH_PARS
+from .utils import condition, age_pdot, B_field_pdot, LoadStats, _NULL_STAGE
+
+
+# identifier at the start of files written by QueryATNF.save()
+_COLUMNS_MAGIC = b'PSRQPYCOLS\x00\x01'
+
+# alignment (in bytes) of column data in files written by QueryATNF.save()
+_COLUMNS_ALIGN = 64
+
+# process-wide shared catalogues (see shared_catalogue())
+_SHARED_CATALOGUES = {}
+_SHARED_LOCKS = {}
+_SHARED_LOCK = threading.Lock()
 
 
 class QueryATNF(object):
@@ -110,6 +125,33 @@ class QueryATNF(object):
         fromtable (:class:`astropy.table.Table`): create a new
             :class:`psrqpy.QueryATNF` object from an existing
             :class:`astropy.table.Table`.
+        fromarrow (:class:`pyarrow.Table`, str): create a new
+            :class:`psrqpy.QueryATNF` object from an existing
+            :class:`pyarrow.Table`, or a Feather file (e.g., as written by
+            :meth:`~psrqpy.QueryATNF.to_feather`). The Arrow table is kept
+            and, until the catalogue is changed, used directly by
+            :meth:`~psrqpy.QueryATNF.to_arrow`. Queries are still performed
+            on a pandas DataFrame copy of the catalogue.
+        shared (bool): if True use the process-wide shared catalogue for the
+            database given by `loadfromdb` (see
+            :func:`~psrqpy.search.shared_catalogue`) rather than loading a
+            new copy of the catalogue. The shared catalogue is copied if it
+            is changed with :meth:`~psrqpy.QueryATNF.update`. Defaults to
+            False.
+        server (str): the address of a :class:`~psrqpy.serve.CatalogueServer`
+            (e.g., ``'http://127.0.0.1:8765'`` or ``'unix:/path/to/socket'``)
+            from which to get the prepared catalogue, rather than loading
+            it. The catalogue is stored in the psrqpy cache directory and
+            memory mapped, so is only transferred when it has changed (see
+            :func:`~psrqpy.serve.get_server_catalogue`). Defaults to None.
+        stats (bool, :class:`~psrqpy.utils.LoadStats`): if True record the
+            time taken by each stage of loading the catalogue (downloading,
+            parsing, calculating derived parameters, etc.) in the
+            :attr:`~psrqpy.QueryATNF.load_stats` attribute. A
+            :class:`~psrqpy.utils.LoadStats` object (e.g., with hooks) can
+            also be given. Defaults to False, although statistics are
+            recorded if any global hooks have been added with
+            :meth:`~psrqpy.utils.LoadStats.add_hook`.
     """
 
     def __init__(self, params=None, condition=None, psrtype=None, assoc=None,
@@ -118,14 +160,23 @@ class QueryATNF(object):
                  include_refs=False, adsref=False, loadfromfile=None,
                  loadquery=None, loadfromdb=None, cache=True,
                  checkupdate=False, circular_boundary=None, coord1=None,
-                 coord2=None, radius=0., frompandas=None, fromtable=None):
+                 coord2=None, radius=0., frompandas=None, fromtable=None,
+                 fromarrow=None, shared=False, stats=False, server=None):
         if loadfromfile is not None and loadquery is None:
             loadquery = loadfromfile
         if loadquery:
             self.load(loadquery)
             return
 
+        if isinstance(stats, LoadStats):
+            self.load_stats = stats
+        else:
+            self.load_stats = LoadStats(enabled=stats)
+
         self.__dataframe = DataFrame()
+        self._catalogue_revision = 0  # incremented when the catalogue changes
+        self._shared = False  # True if using a shared catalogue
+        self._sort_cache = None  # cached sort orders of the catalogue
         self.include_errs = include_errs
         self._include_refs = include_refs
         self._savefile = None  # file to save class to
@@ -134,7 +185,7 @@ class QueryATNF(object):
         self.exactmatch = exactmatch
         self.psrs = psrs
         self._sort_order = sort_order
-        self.sort_key = sort_attr.upper()
+        self.sort_key = sort_attr
         self._useads = adsref
 
         # conditions for finding pulsars within a circular boundary
@@ -180,6 +231,7 @@ class QueryATNF(object):
 
         self.query_params = params
         self._refs = None  # set of pulsar references
+        self._adsrefs = None  # set of pulsar reference ADS URLs
         self._pulsars = None  # gets set to a Pulsars object by get_pulsars()
 
         # store passed pandas DataFrame
@@ -192,15 +244,46 @@ class QueryATNF(object):
             self.__dataframe = fromtable.to_pandas()
             return
 
-        # download and cache (if requested) the database file
-        try:
-            _ = self.get_catalogue(path_to_db=loadfromdb, cache=cache,
-                                   update=checkupdate)
-        except IOError:
-            raise IOError("Could not get catalogue database file")
+        # store passed pyarrow Table or Feather file
+        if fromarrow is not None:
+            self._from_arrow(fromarrow)
+            return
 
-        # perform requested sorting
-        _ = self.sort(inplace=True)
+        # use the catalogue prepared by a server
+        if server is not None:
+            from .serve import get_server_catalogue
+
+            with self.load_stats.stage('server'):
+                self.__dataframe = get_server_catalogue(server)
+            self._catalogue_changed()
+        elif shared:
+            # use the process-wide shared catalogue
+            with self.load_stats.stage('shared_catalogue'):
+                query = shared_catalogue(loadfromdb=loadfromdb, cache=cache,
+                                         refresh=checkupdate)
+            self.__dataframe = query.catalogue
+            self._shared = True
+
+            # use the shared catalogue's cached sort orders, which stay valid
+            # until the catalogue is changed (when it is copied)
+            self._catalogue_revision = getattr(query, '_catalogue_revision', 0)
+            if getattr(query, '_sort_cache', None) is None:
+                query._sort_cache = {'revision': self._catalogue_revision}
+            self._sort_cache = query._sort_cache
+            self._dbfile = loadfromdb
+            self._checkupdate = checkupdate
+            self._cache = cache
+        else:
+            # download and cache (if requested) the database file
+            try:
+                _ = self.get_catalogue(path_to_db=loadfromdb, cache=cache,
+                                       update=checkupdate)
+            except IOError:
+                raise IOError("Could not get catalogue database file")
+
+        # check the requested sorting (the sort order is only computed when
+        # the query results are first required)
+        _ = self._parse_sort(self.sort_key, self._sort_order)
 
     def get_references(self, useads=False, cache=True):
         """
@@ -262,27 +345,13 @@ class QueryATNF(object):
         if not hasattr(refs, '__iter__'):
             raise ValueError("Reference tags must be a string or array like")
 
-        refstrs = []
-        for ref in refs:
-            if isinstance(ref, string_types):
-                if ref in self._refs:
-                    if useadst:
-                        if ref in self._adsrefs:
-                            refstrs.append((self._refs[ref], self._adsrefs[ref]))
-                        else:
-                            refstrs.append((self._refs[ref], None))
-                    else:
-                        refstrs.append(self._refs[ref])
-                else:
-                    if useadst:
-                        refstrs.append((None, None))
-                    else:
-                        refstrs.append(None)
-            else:
-                if useadst:
-                    refstrs.append((None, None))
-                else:
-                    refstrs.append(None)
+        codes = self._reference_codes(list(refs))
+        _, refstrings, refurls = self._reference_table()
+
+        if useadst:
+            refstrs = list(zip(refstrings[codes], refurls[codes]))
+        else:
+            refstrs = list(refstrings[codes])
 
         # just return a single value if only one input
         if singleref:
@@ -290,6 +359,165 @@ class QueryATNF(object):
 
         return refstrs
 
+    def _reference_table(self):
+        """
+        Return a (cached) index of the reference tags and arrays of the full
+        reference strings and NASA ADS URLs for each tag. The arrays have an
+        additional final entry of None for unknown tags.
+        """
+
+        # the table is kept with the reference dictionaries it was made from
+        # (rather than their ids, which can be reused once they are freed)
+        reftable = getattr(self, '_ref_table', None)
+
+        if (reftable is None or reftable[0] is not self._refs or
+                reftable[1] is not self._adsrefs):
+            from pandas import Index
+
+            tags = Index(list(self._refs.keys()), dtype=object)
+            adsrefs = self._adsrefs if self._adsrefs is not None else {}
+
+            refstrings = np.empty(len(tags) + 1, dtype=object)
+            refstrings[:-1] = [self._refs[tag] for tag in tags]
+            refurls = np.empty(len(tags) + 1, dtype=object)
+            refurls[:-1] = [adsrefs.get(tag, None) for tag in tags]
+
+            reftable = (self._refs, self._adsrefs, (tags, refstrings, refurls))
+            self._ref_table = reftable
+
+        return reftable[2]
+
+    def _reference_codes(self, tags):
+        """
+        Convert an array of reference tags into integer positions in the
+        arrays returned by :meth:`~psrqpy.search.QueryATNF._reference_table`.
+        Unknown tags, or missing values, are given the position of the final
+        None entry.
+        """
+
+        tagindex = self._reference_table()[0]
+
+        values = np.empty(len(tags), dtype=object)
+        values[:] = tags
+        codes = tagindex.get_indexer(values)
+        codes[codes < 0] = len(tagindex)
+
+        return codes
+
+    def resolve_refs(self, params=None, useads=False, selected=True):
+        """
+        Convert reference tag columns (i.e., those with a ``_REF`` suffix)
+        into columns of full reference strings, and, if requested, NASA ADS
+        URLs. All the tags are converted in one go using a lookup table built
+        from the reference dictionary.
+
+        Args:
+            params (str, list): the parameter(s) for which to convert the
+                reference tags, e.g., ``'F0'`` or ``'F0_REF'``. Defaults to
+                None, in which case all reference columns in the query (or
+                catalogue if `selected` is False) are converted.
+            useads (bool): Set whether to also return columns of NASA ADS
+                URLs. Defaults to False.
+            selected (bool): If True (the default) return values for the
+                pulsars in the query, otherwise return values for all pulsars
+                in the catalogue.
+
+        Returns:
+            :class:`pandas.DataFrame`: a table with a ``PARAM_REFSTR`` column
+            of reference strings for each parameter (and a ``PARAM_REFURL``
+            column of URLs if `useads` is True), with rows in the same order
+            as the query table (or the catalogue).
+
+        Example:
+            Add the full references to a query table
+
+            >>> q = QueryATNF(params=['F0', 'F1'], include_refs=True)
+            >>> table = q.pandas.join(q.resolve_refs())
+        """
+
+        useadst = useads or self._useads
+
+        if self._refs is None or (self._adsrefs is None and useadst):
+            self.get_references(useads=useadst)
+
+        if selected:
+            columns = self._query_columns()
+        else:
+            columns = self.columns
+
+        if params is None:
+            refcols = [col for col in columns if col.endswith('_REF')]
+        else:
+            if isinstance(params, string_types):
+                params = [params]
+
+            refcols = []
+            for par in params:
+                refcol = par.upper()
+                if not refcol.endswith('_REF'):
+                    refcol += '_REF'
+                if refcol not in self.columns:
+                    raise KeyError("Reference column '{}' is not in the "
+                                   "catalogue".format(refcol))
+                refcols.append(refcol)
+
+        if selected:
+            idx = self._query_indices()
+            if idx is None:
+                idx = np.array([], dtype=int)
+        else:
+            idx = np.arange(self.catalogue_len)
+
+        # look up the tags for all columns at once
+        values = np.empty((len(idx), len(refcols)), dtype=object)
+        for i, refcol in enumerate(refcols):
+            values[:, i] = self.catalogue[refcol].values[idx]
+
+        codes = self._reference_codes(values.ravel()).reshape(values.shape)
+        _, refstrings, refurls = self._reference_table()
+
+        output = OrderedDict()
+        for i, refcol in enumerate(refcols):
+            output[refcol+'STR'] = refstrings[codes[:, i]]
+            if useadst:
+                output[refcol+'URL'] = refurls[codes[:, i]]
+
+        return DataFrame(output)
+
+    def get_reference_index(self, cache=True):
+        """
+        Return a :class:`~psrqpy.utils.ReferenceIndex` of the catalogue
+        references, which can be used to find references by author, year or
+        title, and the pulsars and parameters that use them. The index is only
+        built once for each version of the catalogue.
+
+        Args:
+            cache (bool): The flag sets whether or not to use a pre-cached
+                database of references. Defaults to True.
+
+        Returns:
+            :class:`~psrqpy.utils.ReferenceIndex`: the reference index.
+        """
+
+        from .utils import ReferenceIndex
+
+        if self._refs is None:
+            self.get_references(cache=cache)
+
+        # the index is kept with the catalogue revision and reference
+        # dictionary it was made from
+        revision = getattr(self, '_catalogue_revision', 0)
+        refindex = getattr(self, '_ref_index', None)
+
+        if (refindex is None or refindex[0] != revision or
+                refindex[1] is not self._refs):
+            refindex = (revision, self._refs,
+                        ReferenceIndex(self._refs, self.catalogue,
+                                       version=self.get_version))
+            self._ref_index = refindex
+
+        return refindex[2]
+
     def get_catalogue(self, path_to_db=None, cache=True, update=False,
                       overwrite=True):
         """
@@ -315,9 +543,13 @@ class QueryATNF(object):
         """
         from .utils import get_catalogue
 
+        stats = getattr(self, 'load_stats', None)
+        if stats is None:
+            stats = self.load_stats = LoadStats(enabled=False)
+
         try:
             dbtable = get_catalogue(path_to_db=path_to_db, cache=cache,
-                                    update=update, pandas=True)
+                                    update=update, pandas=True, stats=stats)
         except Exception as e:
             raise RuntimeError("Problem getting catalogue: {}".format(str(e)))
 
@@ -339,13 +571,18 @@ class QueryATNF(object):
         # update current catalogue
         self.__dataframe = DataFrame(dbtable)
         self.__dataframe.version = dbtable.version
+        self._catalogue_changed()
+        self._shared = False
         self._dbfile = path_to_db
         self._checkupdate = update
         self._cache = cache
 
         # calculate derived parameters
-        self.set_derived()
-        self.parse_types()
+        with stats.stage('set_derived'):
+            self.set_derived()
+
+        with stats.stage('parse_types'):
+            self.parse_types()
 
         return self
 
@@ -357,6 +594,27 @@ class QueryATNF(object):
 
         return self.__dataframe.columns
 
+    def _catalogue_changed(self):
+        """
+        Record that the catalogue has changed, so that any cached information
+        derived from it (e.g., sort orders) is no longer used.
+        """
+
+        self._catalogue_revision = getattr(self, '_catalogue_revision', 0) + 1
+
+    def _unshare(self):
+        """
+        If the catalogue is shared (see
+        :func:`~psrqpy.search.shared_catalogue`), replace it with a copy
+        before it is changed.
+        """
+
+        if getattr(self, '_shared', False):
+            version = self.get_version
+            self.__dataframe = self.__dataframe.copy()
+            self.__dataframe.version = version
+            self._shared = False
+
     def update(self, column, name=None, overwrite=False):
         """
         Update a column in the internal :class:`pandas.DataFrame` table using
@@ -373,6 +631,8 @@ class QueryATNF(object):
                will not be overwritten.
         """
 
+        self._unshare()
+
         # get column name to update/add
         if name is not None:
             # use input `name` by default
@@ -402,6 +662,8 @@ class QueryATNF(object):
         else:
             raise ValueError("No column name given")
 
+        self._catalogue_changed()
+
     @property
     def sort_key(self):
         return self._sort_attr
@@ -409,25 +671,119 @@ class QueryATNF(object):
     @sort_key.setter
     def sort_key(self, value):
         """
-        Set the parameter to sort on.
+        Set the parameter, or list of parameters, to sort on.
+        """
+
+        if isinstance(value, string_types):
+            self._sort_attr = value.upper()
+        elif (isinstance(value, (list, tuple)) and len(value) > 0 and
+              np.all([isinstance(v, string_types) for v in value])):
+            self._sort_attr = [v.upper() for v in value]
+        else:
+            raise ValueError("Sort parameter must be a string or list of "
+                             "strings")
+
+    def _parse_sort(self, sort_attr, sort_order):
+        """
+        Check the sort parameters and orders, returning a list of parameters
+        and a list of booleans that are True for an ascending sort.
         """
 
-        if not isinstance(value, string_types):
-            raise ValueError("Sort parameter must be a string")
+        keys = [sort_attr] if isinstance(sort_attr, string_types) else list(sort_attr)
+        keys = [key.upper() for key in keys]
 
-        self._sort_attr = value
+        for key in keys:
+            if key not in self.columns:
+                raise KeyError("Sorting by attribute '{}' is not possible as "
+                               "it is not in the table".format(key))
+
+        if isinstance(sort_order, string_types):
+            orders = [sort_order] * len(keys)
+        else:
+            orders = list(sort_order)
+            if len(orders) != len(keys):
+                raise ValueError("The number of sort orders must be the same "
+                                 "as the number of sort parameters")
+
+        ascending = []
+        for order in orders:
+            # check sort order is either 'asc' or 'desc' (or some synonyms)
+            if order.lower() in ['asc', 'ascending', 'up', '^']:
+                ascending.append(True)
+            elif order.lower() in ['desc', 'descending', 'down', 'v']:
+                ascending.append(False)
+            else:
+                warnings.warn("Unrecognised sort order '{}', defaulting to "
+                              "'ascending'".format(order), UserWarning)
+                ascending.append(True)
+
+        return keys, ascending
+
+    @staticmethod
+    def _sort_codes(values, ascending=True):
+        """
+        Convert an array of values into an array of floats that sort in the
+        required order, with any missing values always placed last.
+        """
+
+        if np.issubdtype(values.dtype, np.number):
+            codes = values.astype(float)
+        else:
+            codes, _ = factorize(values, sort=True)
+            codes = codes.astype(float)
+            codes[codes == -1] = np.nan
+
+        if not ascending:
+            codes = -codes
+
+        codes[np.isnan(codes)] = np.inf
+
+        return codes
+
+    def _sort_permutation(self, keys, ascending):
+        """
+        Return the (cached) array of catalogue row indices that give the
+        catalogue sorted on the given parameters.
+        """
+
+        sortcache = getattr(self, '_sort_cache', None)
+        revision = getattr(self, '_catalogue_revision', 0)
+
+        if sortcache is None or sortcache.get('revision') != revision:
+            # catalogue has changed so cached orders are no longer valid
+            self._sort_cache = sortcache = {'revision': revision}
+
+        cachekey = (tuple(keys), tuple(ascending))
+        if cachekey not in sortcache:
+            stats = getattr(self, 'load_stats', None)
+            with (stats.stage('sort') if stats is not None else _NULL_STAGE):
+                # np.lexsort uses the last key as the primary key
+                codes = [self._sort_codes(self.catalogue[key].values, asc)
+                         for key, asc in zip(keys, ascending)]
+                sortcache[cachekey] = np.lexsort(codes[::-1])
+
+        return sortcache[cachekey]
 
     def sort(self, sort_attr='JNAME', sort_order='asc', inplace=False):
         """
         Sort the generated catalogue :class:`~pandas.DataFrame` on a given
-        attribute and in either ascending or descending order.
+        attribute, or list of attributes, and in either ascending or
+        descending order.
+
+        The sort order of the catalogue is cached, so sorting on the same
+        parameters again will not require the catalogue to be re-sorted unless
+        it has been changed with :meth:`~psrqpy.QueryATNF.update`. Missing
+        values are always placed at the end.
 
         Args:
-            sort_attr (str): The parameter on which to perform the sorting of
-                the query output. Defaults to 'JNAME'.
-            sort_order (str): Set to 'asc' to sort the parameter values in
-                ascending order, or 'desc' to sort in descending order.
-                Defaults to ascending.
+            sort_attr (str, list): The parameter, or list of parameters, on
+                which to perform the sorting of the query output. If a list is
+                given the catalogue is sorted on the first parameter, with ties
+                sorted on the second parameter, and so on. Defaults to 'JNAME'.
+            sort_order (str, list): Set to 'asc' to sort the parameter values
+                in ascending order, or 'desc' to sort in descending order. A
+                list of orders can be given for each of the parameters in
+                `sort_attr`. Defaults to ascending.
             inplace (bool): If True, and sorting the class' internal
                 :class:`~pandas.DataFrame`, then the sorting will be done
                 in place without returning a copy of the table, otherwise
@@ -438,36 +794,82 @@ class QueryATNF(object):
             catalogue.
         """
 
-        if sort_attr is not None:
-            self.sort_key = sort_attr.upper()
+        if sort_attr is None:
+            sort_attr = self.sort_key
 
-        if self.sort_key not in self.columns:
-            raise KeyError("Sorting by attribute '{}' is not possible as it "
-                           "is not in the table".format(self.sort_key))
+        keys, ascending = self._parse_sort(sort_attr, sort_order)
 
-        self._sort_order = sort_order
-
-        # check sort order is either 'asc' or 'desc' (or some synonyms)
-        if self._sort_order.lower() in ['asc', 'ascending', 'up', '^']:
-            self._sort_order = 'asc'
-        elif self._sort_order.lower() in ['desc', 'descending', 'down', 'v']:
-            self._sort_order = 'desc'
-        else:
-            warnings.warn("Unrecognised sort order '{}', defaulting to "
-                          "'ascending'".format(sort_order), UserWarning)
-            self._sort_order = 'asc'
+        self.sort_key = keys[0] if len(keys) == 1 else keys
+        self._sort_order = ['asc' if asc else 'desc' for asc in ascending]
+        if len(keys) == 1:
+            self._sort_order = self._sort_order[0]
 
-        sortorder = True if self._sort_order == 'asc' else False
+        order = self._sort_permutation(keys, ascending)
 
         if inplace:
             # sort the stored dataframe
-            _ = self.__dataframe.sort_values(self.sort_key,
-                                             ascending=sortorder,
-                                             inplace=inplace)
+            version = self.get_version
+            self.__dataframe = self.__dataframe.iloc[order]
+            self.__dataframe.version = version
+            self._catalogue_changed()
             return self.__dataframe
         else:
-            return self.__dataframe.sort_values(self.sort_key,
-                                                ascending=sortorder)
+            return self.__dataframe.iloc[order]
+
+    def top(self, num, sort_attr=None, sort_order='desc'):
+        """
+        Return the first `num` pulsars returned by the query when sorted on a
+        given attribute (by default the largest values). Only pulsars
+        satisfying the query are ordered, and if `num` is smaller than the
+        number of pulsars they are first partially sorted, so the whole
+        catalogue never needs to be sorted. Pulsars with equal values keep
+        their catalogue order.
+
+        Args:
+            num (int): the number of pulsars to return.
+            sort_attr (str, list): The parameter, or list of parameters, on
+                which to sort the pulsars. Defaults to the query's current
+                sort parameter.
+            sort_order (str, list): The order in which to sort, either 'asc'
+                or 'desc'. Defaults to 'desc', i.e., the pulsars with the
+                largest values are returned.
+
+        Returns:
+            :class:`~pandas.DataFrame`: a table of the query parameters for
+            the selected pulsars.
+
+        Example:
+            The 50 fastest spinning millisecond pulsars would be
+
+            >>> query = QueryATNF(condition='P0 < 0.03')
+            >>> fastest = query.top(50, 'F0')
+        """
+
+        if not isinstance(num, numbers.Integral) or num < 1:
+            raise ValueError("The number of pulsars must be a positive integer")
+
+        if sort_attr is None:
+            sort_attr = self.sort_key
+
+        keys, ascending = self._parse_sort(sort_attr, sort_order)
+
+        idx = self._query_indices(sort=False)
+        if idx is None:
+            return DataFrame()
+
+        if len(idx) > num:
+            # partially sort on the primary key, keeping any ties at the
+            # boundary so that the final sort is stable
+            primary = self._sort_codes(self.catalogue[keys[0]].values[idx],
+                                       ascending[0])
+            kth = np.partition(primary, num - 1)[num - 1]
+            idx = idx[primary <= kth]
+
+        codes = [self._sort_codes(self.catalogue[key].values[idx], asc)
+                 for key, asc in zip(keys, ascending)]
+        idx = idx[np.lexsort(codes[::-1])][:num]
+
+        return self._project(self.catalogue.iloc[idx])
 
     def __getitem__(self, key):
         if key not in self.pandas.columns:
@@ -482,17 +884,26 @@ class QueryATNF(object):
         See, e.g., https://stackoverflow.com/a/2050357/1862861.
         """
 
-        # Pulsars() object can cause pickling issues (in Python 2.7), so have
-        # workaround
+        state = self.__dict__.copy()
+
+        # Pulsars() object can cause pickling issues (in Python 2.7), so just
+        # store whether it existed (it will be recreated when required)
         from .pulsar import Pulsars
         if isinstance(self._pulsars, Pulsars):
-            del self._pulsars
-            self._pulsars = True
+            state['_pulsars'] = True
+
+        # reference lookup tables are rebuilt when required rather than
+        # stored
+        state.pop('_ref_table', None)
+        state.pop('_ref_index', None)
+
+        # the Arrow table is only kept for exports, so is not stored
+        state.pop('_arrow_table', None)
 
         # save ATNF version information from DataFrame separately
-        self._atnf_version = self.catalogue.version
+        state['_atnf_version'] = self.catalogue.version
 
-        return self.__dict__
+        return state
 
     def __setstate__(self, d):
         """
@@ -504,58 +915,545 @@ class QueryATNF(object):
         # restore ATNF version info to catalogue
         self.__dataframe.version = self._atnf_version
 
-        # Pulsars() object can cause pickling issues (in Python 2.7), so have
-        # workaround
+        # the Pulsars() object is recreated when next requested by
+        # get_pulsars()
         if isinstance(self._pulsars, bool):
-            from .pulsar import Pulsars
+            self._pulsars = None
 
-            if self._pulsars:
-                # get the Pulsars() object
-                self._pulsars = None
-                _ = self.get_pulsars()
+        # objects pickled by older versions do not have load statistics
+        if 'load_stats' not in d:
+            self.load_stats = LoadStats(enabled=False)
 
-    def save(self, fname):
+    def save(self, fname, legacy=False):
         """
-        Output the :class:`~psrqpy.search.QueryATNF` instance to a pickle file
-        for future loading.
+        Output the :class:`~psrqpy.search.QueryATNF` instance to a file for
+        future loading. The catalogue is written as a binary file of columns,
+        along with the query state (parameters, conditions, sorting, etc.),
+        which can be quickly memory mapped when loaded.
 
         Args:
-            fname (str): the filename to output the pickle to
+            fname (str): the filename to output to
+            legacy (bool): if True output the class to a pickle file (as was
+                done in previous versions). Defaults to False.
         """
 
+        if legacy:
+            try:
+                fp = open(fname, 'wb')
+                pickle.dump(self, fp, 2)
+                fp.close()
+                self._savefile = fname
+            except IOError:
+                raise IOError("Error outputing class to pickle file")
+            return
+
+        state = {'params': self.query_params,
+                 'condition': self.condition,
+                 'exactmatch': self.exactmatch,
+                 'sort_attr': self.sort_key,
+                 'sort_order': self._sort_order,
+                 'psrs': self.psrs,
+                 'include_errs': self.include_errs,
+                 'include_refs': self._include_refs,
+                 'adsref': self._useads,
+                 'coord1': self._coord1,
+                 'coord2': self._coord2,
+                 'radius': float(self._radius)}
+
         try:
-            fp = open(fname, 'wb')
-            pickle.dump(self, fp, 2)
-            fp.close()
+            _write_columns(fname, self.catalogue, state,
+                           version=getattr(self.catalogue, 'version', None))
             self._savefile = fname
         except IOError:
-            raise IOError("Error outputing class to pickle file")
+            raise IOError("Error outputing class to file")
 
     def load(self, fname):
         """
-        Load a previously saved pickle of this class.
+        Load a previously saved instance of this class. Files written with
+        :meth:`~psrqpy.QueryATNF.save` have their catalogue columns memory
+        mapped (using copy-on-write, so changes are not written back to the
+        file), while older pickle files are also read.
 
         Args:
-            fname (str): the filename of the pickled object
+            fname (str): the filename of the saved object
         """
 
         try:
-            fp = open(fname, 'rb')
-            tmpdict = pickle.load(fp)
-            fp.close()
-            self.__dict__.clear()  # clear current self
-            self.__dict__.update(tmpdict.__dict__)
-            self._loadfile = fname
+            with open(fname, 'rb') as fp:
+                magic = fp.read(len(_COLUMNS_MAGIC))
         except IOError:
-            raise IOError("Error reading in pickle")
+            raise IOError("Error reading in file")
+
+        if magic != _COLUMNS_MAGIC:
+            try:
+                fp = open(fname, 'rb')
+                tmpdict = pickle.load(fp)
+                fp.close()
+                self.__dict__.clear()  # clear current self
+                self.__dict__.update(tmpdict.__dict__)
+                self._loadfile = fname
+            except IOError:
+                raise IOError("Error reading in pickle")
+            return
+
+        try:
+            dftable, state, version = _read_columns(fname)
+        except (IOError, ValueError, KeyError) as e:
+            raise IOError("Error reading in file: {}".format(str(e)))
 
-    def as_array(self):
+        self.__dict__.clear()  # clear current self
+        self.__init__(frompandas=DataFrame(), **state)
+
+        self.__dataframe = dftable
+        self.__dataframe.version = version
+        self._catalogue_changed()
+        self._loadfile = fname
+
+    @classmethod
+    def prefetch(cls, progress=None, **kwargs):
         """
+        Start creating a :class:`~psrqpy.search.QueryATNF` in a background
+        thread, e.g., downloading, parsing and calculating the derived
+        parameters of the catalogue, and return a future that is resolved
+        with the query when it is ready. Downloads in the loading thread
+        share a :class:`requests.Session` (see
+        :func:`~psrqpy.utils.get_session`), so connections are reused.
+
+        Cancelling the future (with its ``cancel()`` method) stops the
+        loading at the start of the next stage (see
+        :class:`~psrqpy.utils.LoadStats`).
+
+        Args:
+            progress (callable): a function called (from the loading thread)
+                at the start and end of each loading stage, and with the
+                progress of downloads, as a :class:`~psrqpy.utils.LoadStats`
+                hook, i.e., with the event (``'start'``, ``'progress'`` or
+                ``'end'``), the stage name and a dictionary of information.
+            kwargs: keyword arguments for :class:`~psrqpy.search.QueryATNF`.
+
+        Returns:
+            :class:`concurrent.futures.Future`: a future that gives the
+            :class:`~psrqpy.search.QueryATNF` object as its result. The
+            future's ``load_stats`` attribute contains the
+            :class:`~psrqpy.utils.LoadStats` object for the loading.
+
+        Example:
+            Start loading the catalogue and do something else in the
+            meantime
+
+            >>> future = QueryATNF.prefetch(params=['JNAME', 'F0'])
+            >>> ...
+            >>> query = future.result()
+        """
+
+        try:
+            from concurrent.futures import Future
+        except ImportError:
+            raise ImportError("The 'futures' package is required for prefetching")
+
+        stats = kwargs.pop('stats', None)
+        if not isinstance(stats, LoadStats):
+            stats = LoadStats(enabled=bool(stats))
+
+        if progress is not None:
+            if not callable(progress):
+                raise TypeError("Progress callback must be callable")
+            stats._hooks.append(progress)
+
+        # the future is kept pending until loading is complete, so that it
+        # can always be cancelled, and cancelling it stops the loading
+        future = Future()
+        future.load_stats = stats
+        future.add_done_callback(lambda f: stats.cancel() if f.cancelled() else None)
+
+        def load():
+            try:
+                query = cls(stats=stats, **kwargs)
+            except BaseException as e:
+                setter, value = future.set_exception, e
+            else:
+                setter, value = future.set_result, query
+            finally:
+                # later stages (e.g., sorting) are not passed to the callback
+                if progress is not None:
+                    stats._hooks.remove(progress)
+
+            if not future.cancelled():
+                try:
+                    setter(value)
+                except Exception:
+                    # the future has been cancelled in the meantime
+                    pass
+
+        thread = threading.Thread(target=load, name='psrqpy-prefetch')
+        thread.daemon = True
+        thread.start()
+
+        return future
+
+    @classmethod
+    def load_async(cls, progress=None, loop=None, **kwargs):
+        """
+        Create a :class:`~psrqpy.search.QueryATNF` without blocking an
+        :mod:`asyncio` event loop. The loading is performed in a background
+        thread using :meth:`~psrqpy.search.QueryATNF.prefetch`, and
+        cancelling the returned future (or the task awaiting it) stops the
+        loading. This requires Python 3.
+
+        Args:
+            progress (callable): a function called (in the event loop's
+                thread) at the start and end of each loading stage, and with
+                the progress of downloads (see
+                :meth:`~psrqpy.search.QueryATNF.prefetch`).
+            loop: the event loop. Defaults to the running (or current) event
+                loop.
+            kwargs: keyword arguments for :class:`~psrqpy.search.QueryATNF`.
+
+        Returns:
+            :class:`asyncio.Future`: an awaitable future that gives the
+            :class:`~psrqpy.search.QueryATNF` object.
+
+        Example:
+            >>> query = await QueryATNF.load_async(params=['JNAME', 'F0'])
+        """
+
+        import asyncio
+
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except (AttributeError, RuntimeError):
+                loop = asyncio.get_event_loop()
+
+        callback = None
+        if progress is not None:
+            if not callable(progress):
+                raise TypeError("Progress callback must be callable")
+
+            def callback(event, name, info):
+                loop.call_soon_threadsafe(progress, event, name, info)
+
+        return asyncio.wrap_future(cls.prefetch(progress=callback, **kwargs), loop=loop)
+
+    def as_array(self, masked=True):
+        """
+        Return the query output as a structured :class:`~numpy.ndarray`. The
+        array is created directly from the catalogue with each parameter
+        value only copied once.
+
+        Args:
+            masked (bool): if True (the default) return a
+                :class:`~numpy.ma.MaskedArray` in which missing values are
+                masked, otherwise return a standard array in which missing
+                floating point values are NaN.
+
         Returns:
             :class:`~numpy.ndarray`: the output table as an array.
         """
 
-        return self.table.as_array()
+        rows, columns = self._export_rows()
+
+        # get parameter values (only copying values that need conversion)
+        values = [(col, self._export_column(self.catalogue[col].values, rows))
+                  for col in columns]
+
+        dtypes = []
+        for col, value in values:
+            dtype = value.dtype
+            if dtype == object:
+                # use fixed length strings if there are no missing values
+                isstr = [isinstance(v, string_types) for v in value]
+                if len(value) > 0 and np.all(isstr):
+                    dtype = np.dtype('U{}'.format(max([len(v) for v in value])))
+            dtypes.append((col, dtype))
+
+        array = np.empty(self._export_length(rows), dtype=dtypes)
+        if masked:
+            mask = np.zeros(len(array), dtype=[(col, bool) for col in columns])
+
+        for col, value in values:
+            if value.dtype == object:
+                array[col] = value
+            elif isinstance(rows, slice):
+                array[col] = value[rows]
+            else:
+                np.take(value, rows, out=array[col], mode='clip')
+
+            if masked:
+                mask[col] = isna(array[col])
+
+        if masked:
+            return np.ma.MaskedArray(array, mask=mask)
+
+        return array
+
+    def as_dict(self, masked=False):
+        """
+        Return the query output as a dictionary of :class:`~numpy.ndarray`
+        arrays keyed on parameter name. If the queried pulsars are a
+        contiguous set of rows in the catalogue (e.g., no conditions are
+        applied and the catalogue is already in the requested sort order) the
+        arrays are views of the catalogue and no values are copied, otherwise
+        each array is a single copy of the required values.
+
+        Note: if arrays are views of the catalogue then changing their values
+        will change the values in the catalogue.
+
+        Args:
+            masked (bool): if True return :class:`~numpy.ma.MaskedArray`
+                arrays in which missing values are masked. Defaults to False,
+                in which case missing floating point values are NaN.
+
+        Returns:
+            dict: a dictionary of parameter value arrays.
+        """
+
+        rows, columns = self._export_rows()
+
+        arrays = {}
+        for col in columns:
+            value = self.catalogue[col].values
+            if value.dtype != object:
+                value = value[rows]
+            else:
+                value = self._export_column(value, rows)
+
+            if masked:
+                value = np.ma.MaskedArray(value, mask=isna(value))
+
+            arrays[col] = value
+
+        return arrays
+
+    def _export_rows(self):
+        """
+        Return the catalogue rows and parameters required for exporting the
+        query output. If the rows are contiguous then a slice is returned,
+        otherwise an array of row indices is returned.
+        """
+
+        idx = self._query_indices()
+        if idx is None or len(self.columns) == 0:
+            return np.array([], dtype=int), self._query_columns()
+
+        if len(idx) > 0 and idx[-1] - idx[0] == len(idx) - 1:
+            if np.all(np.diff(idx) == 1):
+                return slice(idx[0], idx[-1] + 1), self._query_columns()
+
+        return idx, self._query_columns()
+
+    @staticmethod
+    def _export_column(value, rows):
+        """
+        Return the values of a catalogue column to be exported. Non-object
+        arrays are returned unchanged (and are copied when the output is
+        created), while object arrays are copied and missing values set to
+        None.
+        """
+
+        if value.dtype != object:
+            return value
+
+        value = value[rows]
+        if isinstance(rows, slice):
+            value = value.copy()
+
+        value[isna(value)] = None
+
+        return value
+
+    @staticmethod
+    def _export_length(rows):
+        """
+        Return the number of rows to be exported.
+        """
+
+        if isinstance(rows, slice):
+            return rows.stop - rows.start
+
+        return len(rows)
+
+    def to_arrow(self, selected=True, dictionary=True, pandas=False):
+        """
+        Return the query output, or whole catalogue, as a
+        :class:`pyarrow.Table`. Numeric parameters are stored as contiguous
+        Arrow buffers (with missing values as nulls) and string parameters
+        are dictionary encoded. If the query was created from an Arrow table
+        (using the `fromarrow` argument), and the catalogue has not since been
+        changed, the columns of that table are used without conversion. This
+        requires the `pyarrow <https://arrow.apache.org/docs/python/>`_
+        package.
+
+        Args:
+            selected (bool): if True (the default) return the pulsars and
+                parameters returned by the query, otherwise return the whole
+                unsorted catalogue.
+            dictionary (bool): if True (the default) dictionary encode any
+                string parameters.
+            pandas (bool): if True return a :class:`pandas.DataFrame` with
+                :class:`pandas.ArrowDtype` columns backed by the Arrow table,
+                rather than the :class:`pyarrow.Table` itself (this requires
+                pandas version 1.5 or later). Defaults to False.
+
+        Returns:
+            :class:`pyarrow.Table`: the Arrow table.
+        """
+
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Cannot create Arrow table as pyarrow is not "
+                              "available")
+
+        if selected:
+            rows, columns = self._export_rows()
+        else:
+            rows, columns = slice(0, self.catalogue_len), list(self.columns)
+
+        # use the stored Arrow table (see the fromarrow argument of
+        # QueryATNF) while the catalogue is unchanged, so that its columns
+        # are used without conversion
+        source = self._arrow_source(columns)
+        if source is not None:
+            if isinstance(rows, slice):
+                source = source.slice(rows.start, rows.stop - rows.start)
+            else:
+                source = source.take(pa.array(rows))
+
+        arrays = []
+        fields = []
+        for col in columns:
+            if source is not None:
+                array = source.column(col)
+            else:
+                array = pa.array(self.catalogue[col].values[rows], from_pandas=True)
+
+            if dictionary and pa.types.is_string(array.type):
+                array = array.dictionary_encode()
+            elif not dictionary and pa.types.is_dictionary(array.type):
+                array = array.cast(array.type.value_type)
+
+            metadata = {}
+            par = col[:-4] if col.endswith('_ERR') else col
+            if par in PSR_ALL_PARS and PSR_ALL[par]['units']:
+                metadata['unit'] = PSR_ALL[par]['units']
+            elif col in PSR_GLITCH_PARS and PSR_GLITCH[col]['units']:
+                metadata['unit'] = PSR_GLITCH[col]['units']
+
+            arrays.append(array)
+            fields.append(pa.field(col, array.type, metadata=metadata))
+
+        metadata = {'ATNF Pulsar Catalogue': ATNF_BASE_URL}
+        version = getattr(self.catalogue, 'version', None)
+        if version is not None:
+            metadata['version'] = version
+
+        table = pa.Table.from_arrays(arrays, schema=pa.schema(fields,
+                                                              metadata=metadata))
+
+        if pandas:
+            from pandas import ArrowDtype
+            return table.to_pandas(types_mapper=ArrowDtype)
+
+        return table
+
+    def to_feather(self, fname, selected=True, compression=None):
+        """
+        Write the query output, or whole catalogue, to a `Feather
+        <https://arrow.apache.org/docs/python/feather.html>`_ (Arrow IPC)
+        file. The file can be memory mapped by other programs, or read back in
+        using the `fromarrow` argument of :class:`~psrqpy.search.QueryATNF`.
+        This requires the `pyarrow <https://arrow.apache.org/docs/python/>`_
+        package.
+
+        Args:
+            fname (str): the file name to output to.
+            selected (bool): if True (the default) output the pulsars and
+                parameters returned by the query, otherwise output the whole
+                catalogue.
+            compression (str): the compression to use ('lz4' or 'zstd').
+                Defaults to None, so that files are uncompressed and can be
+                memory mapped.
+        """
+
+        table = self.to_arrow(selected=selected)
+
+        from pyarrow import feather
+
+        try:
+            feather.write_feather(table, fname,
+                                  compression=compression or 'uncompressed')
+        except IOError:
+            raise IOError("Error writing Feather file '{}'".format(fname))
+
+    def _from_arrow(self, table):
+        """
+        Set the catalogue from a :class:`pyarrow.Table` or Feather file.
+
+        Args:
+            table (:class:`pyarrow.Table`, str): an Arrow table, or the path
+                to a Feather file.
+        """
+
+        try:
+            import pyarrow as pa
+            from pyarrow import feather
+        except ImportError:
+            raise ImportError("Cannot read Arrow table as pyarrow is not "
+                              "available")
+
+        if isinstance(table, string_types):
+            try:
+                table = feather.read_table(table, memory_map=True)
+            except (IOError, pa.ArrowInvalid):
+                raise IOError("Error reading Feather file '{}'".format(table))
+        elif not isinstance(table, pa.Table):
+            raise TypeError("Must be a pyarrow Table or a file name")
+
+        columns = OrderedDict()
+        for col in table.column_names:
+            column = table.column(col)
+            if pa.types.is_dictionary(column.type):
+                column = column.cast(column.type.value_type)
+
+            value = column.to_numpy(zero_copy_only=False)
+            if value.dtype == object:
+                value[isna(value)] = np.nan
+            columns[col] = value
+
+        dftable = DataFrame(columns)
+        metadata = table.schema.metadata or {}
+        dftable.version = metadata.get(b'version', b'').decode() or None
+
+        self.__dataframe = dftable
+        self._catalogue_changed()
+
+        # keep the Arrow table as the storage for exports while the catalogue
+        # is unchanged
+        self._arrow_table = (table, self._catalogue_revision)
+
+    def _arrow_source(self, columns):
+        """
+        Return the Arrow table that the catalogue was created from (see the
+        `fromarrow` argument of :class:`~psrqpy.search.QueryATNF`), with just
+        the given columns, if the catalogue has not changed since.
+
+        Args:
+            columns (list): the required columns.
+
+        Returns:
+            :class:`pyarrow.Table`: the Arrow table, or None if not available.
+        """
+
+        stored = getattr(self, '_arrow_table', None)
+        if stored is None or stored[1] != getattr(self, '_catalogue_revision', 0):
+            return None
+
+        table = stored[0]
+        if not set(columns).issubset(table.column_names):
+            return None
+
+        return table.select(columns)
 
     @property
     def psrs(self):
@@ -605,23 +1503,7 @@ class QueryATNF(object):
         Return a :class:`astropy.table.Table` based on the query.
         """
 
-        # convert to astropy table
-        thistable = Table.from_pandas(self.pandas)
-
-        # add units if known
-        for key in PSR_ALL_PARS:
-            if key in thistable.colnames:
-                if PSR_ALL[key]['units']:
-                    thistable.columns[key].unit = PSR_ALL[key]['units']
-
-                    if (PSR_ALL[key]['err'] and
-                            key+'_ERR' in thistable.colnames):
-                        thistable.columns[key+'_ERR'].unit = PSR_ALL[key]['units']
-
-        # add catalogue version to metadata
-        thistable.meta['version'] = self.get_version
-
-        return thistable
+        return self._to_table(self.pandas)
 
     @property
     def catalogue_table(self):
@@ -634,8 +1516,17 @@ class QueryATNF(object):
         tags.
         """
 
-        # convert catalogue to astropy table
-        thistable = Table.from_pandas(self.catalogue)
+        return self._to_table(self.catalogue)
+
+    def _to_table(self, dftable):
+        """
+        Convert a :class:`pandas.DataFrame` containing catalogue rows into an
+        :class:`astropy.table.Table`, with units and the catalogue version
+        added.
+        """
+
+        # convert to astropy table
+        thistable = Table.from_pandas(dftable)
 
         # add units if known
         for key in PSR_ALL_PARS:
@@ -647,6 +1538,11 @@ class QueryATNF(object):
                             key+'_ERR' in thistable.colnames):
                         thistable.columns[key+'_ERR'].unit = PSR_ALL[key]['units']
 
+        # add units of any glitch catalogue values
+        for key in PSR_GLITCH_PARS:
+            if key in thistable.colnames and PSR_GLITCH[key]['units']:
+                thistable.columns[key].unit = PSR_GLITCH[key]['units']
+
         # add catalogue version to metadata
         thistable.meta['version'] = self.get_version
 
@@ -733,6 +1629,10 @@ class QueryATNF(object):
                     if PSR_ALL[key]['err'] and key+'_ERR' in table.colnames:
                         table.columns[key+'_ERR'].unit = PSR_ALL[key]['units']
 
+            for key in PSR_GLITCH_PARS:
+                if key in table.colnames and PSR_GLITCH[key]['units']:
+                    table.columns[key].unit = PSR_GLITCH[key]['units']
+
             # add catalogue version to metadata
             table.meta['version'] = self.get_version
             table.meta['ATNF Pulsar Catalogue'] = ATNF_BASE_URL
@@ -746,15 +1646,160 @@ class QueryATNF(object):
                 # get seperations
                 d2d = self._coord.separation(catalog)
 
-                # find seperations within required radius
-                catalogmsk = d2d < self._radius*aunits.deg
+                # find seperations within required radius
+                catalogmsk = d2d < self._radius*aunits.deg
+
+                table = table[catalogmsk]
+
+            return table
+        else:
+            # return an empty table
+            return Table()
+
+    def batch_condition(self, conditions, counts=False, usecondition=True):
+        """
+        Evaluate a list of logical conditions against the queried pulsars in
+        one go using :func:`psrqpy.utils.batch_condition`. Any string columns
+        and ``TYPE(...)``, ``ASSOC(...)`` or ``BINCOMP(...)`` terms that are
+        used by more than one condition are only evaluated once.
+
+        Args:
+            conditions (list): a list of condition strings.
+            counts (bool): if True return the number of pulsars satisfying
+                each condition rather than a boolean array. Defaults to False.
+            usecondition (bool): if True the conditions will be evaluated for
+                the pulsars returned by the query (i.e., in the same order as
+                the rows of :attr:`~psrqpy.QueryATNF.pandas`), otherwise they
+                will be evaluated for the whole sorted catalogue. Defaults to
+                True.
+
+        Returns:
+            :class:`~numpy.ndarray`: a boolean array of shape (number of
+            conditions, number of pulsars), or, if `counts` is True, an array
+            containing the number of pulsars satisfying each condition.
+
+        Example:
+            Count the number of pulsars with frequencies above a range of
+            values
+
+            >>> query = QueryATNF()
+            >>> thresholds = np.logspace(0, 3, 50)
+            >>> conds = ['F0 > {}'.format(f) for f in thresholds]
+            >>> numpsrs = query.batch_condition(conds, counts=True)
+        """
+
+        from .utils import batch_condition
+
+        if isinstance(conditions, string_types):
+            conditions = [conditions]
+
+        if usecondition:
+            dftable = self._query_dataframe()
+        else:
+            dftable = self.sort(self.sort_key, self._sort_order)
+
+        if len(dftable) == 0:
+            if counts:
+                return np.zeros(len(conditions), dtype=int)
+            return np.zeros((len(conditions), 0), dtype=bool)
+
+        return batch_condition(dftable, conditions,
+                               exactMatch=self._exactmatch, counts=counts)
+
+    def iter_batches(self, chunksize=1000, astype='pandas'):
+        """
+        Iterate over the pulsars returned by the query in batches of a fixed
+        number of rows. The query conditions and sorting are applied once,
+        when this method is called, and each batch then only contains copies
+        of the required rows and parameters, so the whole query result never
+        needs to be held in memory at once (e.g., when writing it to disk).
+
+        Args:
+            chunksize (int): the (maximum) number of pulsars in each batch.
+                Defaults to 1000.
+            astype (str): the type of each batch. If 'pandas' (the default)
+                each batch is a :class:`pandas.DataFrame` indexed by the row
+                number within the full query result, or if 'numpy' each batch
+                is a dictionary of :class:`~numpy.ndarray` arrays keyed on
+                parameter name.
+
+        Returns:
+            generator: a generator yielding each batch.
+
+        Example:
+            Write out pulsar frequencies to a file in batches of 500 pulsars
+
+            >>> query = QueryATNF(params=['JNAME', 'F0'])
+            >>> for i, batch in enumerate(query.iter_batches(chunksize=500)):
+            ...     batch.to_csv('psrs.csv', mode='a', header=(i == 0))
+        """
+
+        if not isinstance(chunksize, numbers.Integral) or chunksize < 1:
+            raise ValueError("Chunk size must be a positive integer")
+
+        if astype not in ['pandas', 'numpy']:
+            raise ValueError("Batch type must be 'pandas' or 'numpy'")
+
+        idx = self._query_indices()
+        if idx is None or len(self.columns) == 0:
+            idx = np.array([], dtype=int)
+
+        # check all columns exist (as for the query table) before iterating
+        columns = self._query_columns()
+        missing = [col for col in columns if col not in self.columns]
+        if len(missing) > 0:
+            raise KeyError("{} not in index".format(missing))
+
+        return self._iter_batches(idx, columns, chunksize, astype)
+
+    def _iter_batches(self, idx, columns, chunksize, astype):
+        """
+        Generator for :meth:`~psrqpy.QueryATNF.iter_batches`.
+        """
+
+        dftable = self.catalogue
+
+        if astype == 'pandas':
+            colidx = dftable.columns.get_indexer(columns)
+        else:
+            colvalues = [(col, dftable[col].values) for col in columns]
+
+        for start in range(0, len(idx), chunksize):
+            rows = idx[start:start + chunksize]
+
+            if astype == 'pandas':
+                batch = dftable.iloc[rows, colidx]
+                batch.index = np.arange(start, start + len(rows))
+            else:
+                batch = {col: values[rows] for col, values in colvalues}
+
+            yield batch
+
+    def iter_rows(self, chunksize=1000):
+        """
+        Iterate over the pulsars returned by the query one at a time. Rows are
+        extracted from the catalogue in batches (see
+        :meth:`~psrqpy.QueryATNF.iter_batches`), so only `chunksize` rows are
+        held in memory at any time.
+
+        Args:
+            chunksize (int): the number of pulsars to extract from the
+                catalogue at a time. Defaults to 1000.
+
+        Returns:
+            generator: a generator yielding a dictionary of parameter values,
+            keyed on parameter name, for each pulsar.
+
+        Example:
+            >>> query = QueryATNF(params=['JNAME', 'F0'], condition='F0 > 100')
+            >>> for row in query.iter_rows():
+            ...     print(row['JNAME'], row['F0'])
+        """
 
-                table = table[catalogmsk]
+        batches = self.iter_batches(chunksize=chunksize, astype='numpy')
 
-            return table
-        else:
-            # return an empty table
-            return Table()
+        return (dict(zip(batch.keys(), values))
+                for batch in batches for values in zip(*batch.values()))
 
     @property
     def condition(self):
@@ -870,7 +1915,7 @@ class QueryATNF(object):
             self._query_params = list(set(self._query_params))
 
             for p in list(self._query_params):
-                if p not in PSR_ALL_PARS:
+                if p not in PSR_ALL_PARS and p not in PSR_GLITCH_PARS:
                     warnings.warn("Parameter '{}' not recognised.".format(p),
                                   UserWarning)
 
@@ -897,8 +1942,88 @@ class QueryATNF(object):
         Return the query table as a :class:`pandas.DataFrame`.
         """
 
-        # get only required parameters and sort
-        dftable = self.sort(self.sort_key, self._sort_order)
+        return self._project(self._query_dataframe())
+
+    def _project(self, dftable):
+        """
+        Return only the required query parameters (and their errors and
+        references if required) from a table, with the indices reset to
+        start from zero.
+        """
+
+        if len(dftable.columns) == 0:
+            # no pulsars were found
+            return dftable
+
+        # return only the required query parameters
+        if isinstance(self.query_params, list):
+            dftable = dftable[self._query_columns()]
+
+        # reset the indices to zero in the dataframe
+        return dftable.reset_index(drop=True)
+
+    def _query_columns(self):
+        """
+        Return a list of the required query parameters, including errors
+        and references if required.
+        """
+
+        if not isinstance(self.query_params, list):
+            return list(self.columns)
+
+        retpars = list(self.query_params)  # return parameters
+
+        # glitch catalogue values are only available once they have been added
+        missing = [par for par in retpars
+                   if par in PSR_GLITCH_PARS and par not in self.columns]
+        if len(missing) > 0:
+            raise KeyError("Glitch parameters {} have not been added to the "
+                           "catalogue, use add_glitches()".format(missing))
+
+        for par in self.query_params:
+            if par in PSR_ALL_PARS:
+                if PSR_ALL[par]['err'] and self._include_errs:
+                    retpars.append(par+'_ERR')
+
+                if PSR_ALL[par]['ref'] and self._include_refs:
+                    retpars.append(par+'_REF')
+
+        return list(set(retpars))  # remove duplicates
+
+    def _query_dataframe(self):
+        """
+        Return the sorted catalogue :class:`pandas.DataFrame` containing only
+        the pulsars that satisfy the query conditions, but with all
+        parameters.
+        """
+
+        idx = self._query_indices()
+
+        if idx is None:
+            return DataFrame()  # empty dataframe
+
+        return self.catalogue.iloc[idx]
+
+    def _query_indices(self, sort=True):
+        """
+        Return the catalogue row indices of pulsars that satisfy the query
+        conditions. The conditions are applied to the unsorted catalogue and
+        the (cached) sort order is then applied to the selected rows.
+
+        Args:
+            sort (bool): if True return the indices in the order given by the
+                query's sort parameters, otherwise return them in catalogue
+                order.
+
+        Returns:
+            :class:`~numpy.ndarray`: an array of row indices, or None if none
+            of the requested pulsars were found.
+        """
+
+        from .utils import condition_mask
+
+        dftable = self.catalogue
+        mask = np.ones(len(dftable), dtype=bool)
 
         if (self._coord is not None and 'RAJD' in dftable.columns
                 and 'DECJD' in dftable.columns):
@@ -910,57 +2035,45 @@ class QueryATNF(object):
             d2d = self._coord.separation(catalog)
 
             # find seperations within required radius
-            catalogmsk = d2d < self._radius*aunits.deg
-
-            dftable = dftable[catalogmsk]
+            mask &= np.asarray(d2d < self._radius*aunits.deg)
 
         if self._condition is not None:
             # apply condition
-            dftable = condition(dftable, self._condition, self._exactmatch)
+            condmask = condition_mask(dftable, self._condition,
+                                      self._exactmatch)
+            if condmask is None:
+                mask[:] = False
+            else:
+                mask &= condmask
 
         # return only requested pulsars
         if self.psrs is not None:
             jnames = np.zeros(len(dftable), dtype=np.bool)
             if 'JNAME' in dftable.columns:
-                jnames = np.array([psr in self.psrs
-                                   for psr in dftable['JNAME']])
+                jnames = dftable['JNAME'].isin(self.psrs).values & mask
 
             bnames = np.zeros(len(dftable), dtype=np.bool)
             if 'BNAME' in dftable.columns:
-                bnames = np.array([psr in self.psrs
-                                   for psr in dftable['BNAME']])
+                bnames = dftable['BNAME'].isin(self.psrs).values & mask
 
             if np.any(jnames) and np.any(bnames):
-                allnames = jnames | bnames
+                mask = jnames | bnames
             elif np.any(jnames):
-                allnames = jnames
+                mask = jnames
             elif np.any(bnames):
-                allnames = bnames
+                mask = bnames
             else:
                 warnings.warn("No requested pulsars '{}' were "
                               "found.".format(self.psrs), UserWarning)
-                return DataFrame()  # empty dataframe
-
-            dftable = dftable[allnames]
-
-        # return only the required query parameters
-        if isinstance(self.query_params, list):
-            retpars = list(self.query_params)  # return parameters
-
-            for par in self.query_params:
-                if par in PSR_ALL_PARS:
-                    if PSR_ALL[par]['err'] and self._include_errs:
-                        retpars.append(par+'_ERR')
+                return None
 
-                    if PSR_ALL[par]['ref'] and self._include_refs:
-                        retpars.append(par+'_REF')
+        if not sort:
+            return np.flatnonzero(mask)
 
-            retpars = list(set(retpars))  # remove duplicates
+        keys, ascending = self._parse_sort(self.sort_key, self._sort_order)
+        order = self._sort_permutation(keys, ascending)
 
-            dftable = dftable[retpars]
-
-        # reset the indices to zero in the dataframe
-        return dftable.reset_index(drop=True)
+        return order[mask[order]]
 
     def parse_types(self):
         """
@@ -1084,31 +2197,37 @@ class QueryATNF(object):
         `code <http://www.atnf.csiro.au/research/pulsar/psrcat/download.html>`_.
         """
 
-        self.define_dist()         # define the DIST and DIST1 parameters
-        self.derived_ecliptic()  # derive the ecliptic coordinates if not given
-        self.derived_equatorial()  # derive equatorial coords from ecliptic
-        self.define_galactic()     # define the galactic coordinates
-        self.derived_p0()          # derive P0 from F0 if not given
-        self.derived_f0()          # derive F0 from P0 if not given
-        self.derived_p1()          # derive P1 from F1 if not given
-        self.derived_f1()          # derive F1 from P1 if not given
-        self.derived_pb()          # derive binary period from FB0
-        self.derived_pbdot()       # derive Pbdot from FB1
-        self.derived_fb0()         # derive orbital frequency from period
-        self.derived_fb1()         # derive FB1 from PBDOT
-        self.derived_age()         # characteristic age
-        self.derived_bsurf()       # surface magnetic field
-        self.derived_b_lc()        # magnetic field at light cylinder
-        self.derived_edot()        # spin-down luminosity
-        self.derived_edotd2()      # spin-down flux at Sun
-        self.derived_pmtot()       # total proper motion
-        self.derived_vtrans()      # transverse velocity
-        self.derived_p1_i()        # instrinsic period derivative
-        self.derived_age_i()       # intrinsic age
-        self.derived_bsurf_i()     # intrinsic Bsurf
-        self.derived_edot_i()      # intrinsic luminosity
-        self.derived_flux()        # radio flux
-        self.derived_binary()      # derived binary parameters
+        stats = getattr(self, 'load_stats', None)
+        if stats is None:
+            stats = LoadStats(enabled=False)
+
+        for method in [self.define_dist,         # define the DIST and DIST1 parameters
+                       self.derived_ecliptic,    # derive the ecliptic coordinates if not given
+                       self.derived_equatorial,  # derive equatorial coords from ecliptic
+                       self.define_galactic,     # define the galactic coordinates
+                       self.derived_p0,          # derive P0 from F0 if not given
+                       self.derived_f0,          # derive F0 from P0 if not given
+                       self.derived_p1,          # derive P1 from F1 if not given
+                       self.derived_f1,          # derive F1 from P1 if not given
+                       self.derived_pb,          # derive binary period from FB0
+                       self.derived_pbdot,       # derive Pbdot from FB1
+                       self.derived_fb0,         # derive orbital frequency from period
+                       self.derived_fb1,         # derive FB1 from PBDOT
+                       self.derived_age,         # characteristic age
+                       self.derived_bsurf,       # surface magnetic field
+                       self.derived_b_lc,        # magnetic field at light cylinder
+                       self.derived_edot,        # spin-down luminosity
+                       self.derived_edotd2,      # spin-down flux at Sun
+                       self.derived_pmtot,       # total proper motion
+                       self.derived_vtrans,      # transverse velocity
+                       self.derived_p1_i,        # instrinsic period derivative
+                       self.derived_age_i,       # intrinsic age
+                       self.derived_bsurf_i,     # intrinsic Bsurf
+                       self.derived_edot_i,      # intrinsic luminosity
+                       self.derived_flux,        # radio flux
+                       self.derived_binary]:     # derived binary parameters
+            with stats.stage(method.__name__):
+                method()
 
     def define_dist(self):
         """
@@ -2024,36 +3143,36 @@ class QueryATNF(object):
 
     def derived_b_lc(self):
         """
-        Calculate the magnetic field strength at the light cylinder.
+        Calculate the magnetic field strength at the light cylinder (see
+        :func:`~psrqpy.utils.B_field_lc`).
         """
 
+        from .utils import B_field_lc
+
         if not np.all([p in self.columns for p in ['P0', 'P1']]):
             return
 
         # get period and period derivative
         P0 = self.catalogue['P0']
         P1 = self.catalogue['P1']
-
-        BLC = np.full(self.catalogue_len, np.nan)
-        idx = (P1 > 0.) & np.isfinite(P1) & np.isfinite(P0)
-        BLC[idx] = 3.0e8*np.sqrt(P1[idx])*np.abs(P0[idx])**(-5./2.)
+        BLC = B_field_lc(P0, P1)
         self.update(BLC, name='B_LC')
 
     def derived_edot(self):
         """
-        Calculate the spin-down luminosity.
+        Calculate the spin-down luminosity (see
+        :func:`~psrqpy.utils.spin_down_luminosity`).
         """
 
+        from .utils import spin_down_luminosity
+
         if not np.all([p in self.columns for p in ['P0', 'P1']]):
             return
 
         # get period and period derivative
         P0 = self.catalogue['P0']
         P1 = self.catalogue['P1']
-
-        EDOT = np.full(self.catalogue_len, np.nan)
-        idx = (P1 > 0.) & np.isfinite(P1) & np.isfinite(P0)
-        EDOT[idx] = 4.0 * np.pi**2 * 1e45 * P1[idx] / P0[idx]**3
+        EDOT = spin_down_luminosity(P0, P1)
         self.update(EDOT, name='EDOT')
 
     def derived_edot_i(self):
@@ -2062,6 +3181,8 @@ class QueryATNF(object):
         period derivative.
         """
 
+        from .utils import spin_down_luminosity
+
         if 'P1_I' not in self.columns:
             self.derived_p1_i()
 
@@ -2071,17 +3192,17 @@ class QueryATNF(object):
         # get period and period derivative
         P0 = self.catalogue['P0']
         P1_I = self.catalogue['P1_I']
-
-        EDOT_I = np.full(self.catalogue_len, np.nan)
-        idx = (P1_I > 0.) & np.isfinite(P1_I) & np.isfinite(P0)
-        EDOT_I[idx] = 4.0 * np.pi**2 * 1e45 * P1_I[idx] / P0[idx]**3
+        EDOT_I = spin_down_luminosity(P0, P1_I)
         self.update(EDOT_I, name='EDOT_I')
 
     def derived_edotd2(self):
         """
-        Calculate the spin-down luminosity flux at the Sun.
+        Calculate the spin-down luminosity flux at the Sun (see
+        :func:`~psrqpy.utils.spin_down_flux`).
         """
 
+        from .utils import spin_down_flux
+
         reqpars = ['P0', 'P1', 'DIST']
         if not np.all([p in self.columns for p in reqpars]):
             return
@@ -2090,10 +3211,7 @@ class QueryATNF(object):
         P0 = self.catalogue['P0']
         P1 = self.catalogue['P1']
         DIST = self.catalogue['DIST']
-
-        EDOTD2 = np.full(self.catalogue_len, np.nan)
-        idx = (P0 > 0.) & np.isfinite(P1) & np.isfinite(P0) & np.isfinite(DIST)
-        EDOTD2[idx] = 4.0*np.pi**2*1e45*((P1[idx]/P0[idx]**3)/DIST[idx]**2)
+        EDOTD2 = spin_down_flux(P0, P1, DIST)
         self.update(EDOTD2, name='EDOTD2')
 
     def derived_pmtot(self):
@@ -2227,6 +3345,151 @@ class QueryATNF(object):
         R_LUM14[idx] = S1400[idx] * DIST[idx]**2
         self.update(R_LUM14, name='R_LUM14')
 
+    def propagate_uncertainties(self, params=None, nsamples=1000,
+                                quantiles=None, chunksize=256, nprocs=None,
+                                seed=None, selected=True, update=True):
+        """
+        Propagate parameter uncertainties through to the derived parameters
+        using Monte Carlo sampling (see
+        :func:`~psrqpy.utils.propagate_uncertainties`).
+
+        Args:
+            params (str, list): the derived parameter(s) for which to propagate
+                the uncertainties (see :data:`~psrqpy.utils.MC_DERIVED`).
+                Defaults to None, in which case all are used.
+            nsamples (int): the number of samples per pulsar. Defaults to 1000.
+            quantiles (list): a list of quantiles (between 0 and 1) to return.
+                Defaults to None.
+            chunksize (int): the number of pulsars to sample at once. Defaults
+                to 256.
+            nprocs (int): the number of processes to use. Defaults to None,
+                in which case only the current process is used.
+            seed (int): a seed for the random number generator.
+            selected (bool): If True (the default) only propagate the
+                uncertainties for the pulsars in the query, otherwise use all
+                pulsars in the catalogue.
+            update (bool): If True (the default) add the ``_ERR`` and
+                quantile columns to the catalogue, replacing the values of
+                any existing columns for the sampled pulsars.
+
+        Returns:
+            :class:`pandas.DataFrame`: a table of the uncertainties (and
+            quantiles), with rows in the same order as the query table (or
+            the catalogue).
+
+        Example:
+            Get the uncertainties on the spin-down luminosity of millisecond
+            pulsars
+
+            >>> query = QueryATNF(params=['JNAME', 'EDOT'], condition='P0 < 0.03')
+            >>> errs = query.propagate_uncertainties('EDOT', quantiles=[0.05, 0.95])
+        """
+
+        from .utils import propagate_uncertainties
+
+        if selected:
+            idx = self._query_indices()
+            if idx is None:
+                idx = np.array([], dtype=int)
+        else:
+            idx = np.arange(self.catalogue_len)
+
+        table = propagate_uncertainties(self.catalogue.iloc[idx],
+                                        params=params, nsamples=nsamples,
+                                        quantiles=quantiles,
+                                        chunksize=chunksize, nprocs=nprocs,
+                                        seed=seed)
+
+        if update:
+            self._unshare()
+
+            for colname in table.columns:
+                if colname in self.columns:
+                    column = self.__dataframe[colname].values.astype(float)
+                else:
+                    column = np.full(self.catalogue_len, np.nan)
+                column[idx] = table[colname].values
+
+                self.__dataframe[colname] = column
+
+            self._catalogue_changed()
+
+        return table.reset_index(drop=True)
+
+    def add_glitches(self, glitches=None, **kwargs):
+        """
+        Add per-pulsar aggregate values from the `Jodrell Bank pulsar glitch
+        catalogue <http://www.jb.man.ac.uk/pulsar/glitches/gTable.html>`_ to
+        the catalogue (see :func:`~psrqpy.utils.glitch_aggregates` for the
+        values). Glitching pulsars are matched on their J-name, or on their
+        B-name if the J-names differ. Pulsars not in the glitch catalogue have
+        a ``GLITCH_N`` value of zero. Once added, the values can be used in
+        query conditions, e.g., ``'GLITCH_N > 5'``. Calling this again
+        replaces any previously added values.
+
+        Args:
+            glitches (:class:`~astropy.table.Table`): a glitch catalogue
+                table. Defaults to None, in which case the table is obtained
+                using :func:`~psrqpy.utils.get_glitch_catalogue`.
+            kwargs: keyword arguments passed to
+                :func:`~psrqpy.utils.get_glitch_catalogue`.
+
+        Example:
+            Find pulsars that have glitched more than ten times
+
+            >>> query = QueryATNF(params=['JNAME', 'GLITCH_N', 'GLITCH_LAST'])
+            >>> query.add_glitches()
+            >>> query.condition = 'GLITCH_N > 10'
+        """
+
+        from pandas import Index
+        from .utils import get_glitch_catalogue, glitch_aggregates
+
+        if glitches is None:
+            glitches = get_glitch_catalogue(**kwargs)
+
+            if glitches is None:
+                warnings.warn("No glitch catalogue values have been added",
+                              UserWarning)
+                return
+
+        aggregates = glitch_aggregates(glitches)
+
+        # match catalogue rows to the glitching pulsars
+        nrows = self.catalogue_len
+        idx = np.full(nrows, -1, dtype=int)
+        for catcol, glitchcol in [('JNAME', 'JNAME'), ('BNAME', 'NAME'),
+                                  ('JNAME', 'NAME')]:
+            if catcol not in self.columns:
+                continue
+
+            unmatched = idx < 0
+            if not np.any(unmatched):
+                break
+
+            # use the first glitching pulsar with any given name
+            first = np.flatnonzero(~aggregates[glitchcol].duplicated().values)
+            names = Index(aggregates[glitchcol].values[first])
+
+            found = names.get_indexer(self.catalogue[catcol].values[unmatched])
+            idx[unmatched] = np.where(found >= 0, first[found], -1)
+
+        matched = idx >= 0
+
+        self._unshare()
+
+        for par in PSR_GLITCH_PARS:
+            values = aggregates[par].values
+            if par == 'GLITCH_N':
+                column = np.zeros(nrows, dtype=values.dtype)
+            else:
+                column = np.full(nrows, np.nan)
+            column[matched] = values[idx[matched]]
+
+            self.__dataframe[par] = column
+
+        self._catalogue_changed()
+
     def get_pulsar(self, psr, selected=False):
         """
         Return the table row for a particular pulsar for all the catalogue
@@ -2242,23 +3505,91 @@ class QueryATNF(object):
             :class:`astropy.table.Table`: a table row
         """
 
+        idx = self._pulsar_index(psr)
+
+        if idx is None:
+            return None
+
+        # only convert the pulsar's row into a table
+        psrrow = self._to_table(self.catalogue.iloc[[idx]])
+
+        # use masked columns for any parameters that have missing values in
+        # the catalogue, as when converting the whole catalogue
+        revision = getattr(self, '_catalogue_revision', 0)
+        maskedcols = getattr(self, '_masked_columns', None)
+        if maskedcols is None or maskedcols[0] != revision:
+            hasnull = self.catalogue.isna().any(axis=0)
+            maskedcols = (revision, set(hasnull.index[hasnull.values]))
+            self._masked_columns = maskedcols
+
+        for col in psrrow.colnames:
+            if col in maskedcols[1] and not isinstance(psrrow[col], MaskedColumn):
+                psrrow[col] = MaskedColumn(psrrow[col])
+
+        if selected:
+            return psrrow[self.query_params]
+        else:
+            return psrrow
+
+    def _pulsar_index(self, psr):
+        """
+        Return the catalogue row index of a pulsar given its name. A
+        dictionary of pulsar names is created on first use and cached until
+        the catalogue is changed.
+
+        Args:
+            psr (str): The name of a pulsar.
+
+        Returns:
+            int: the row index, or None if the pulsar is not found.
+        """
+
         namepars = ['PSRJ', 'PSRB', 'BNAME', 'JNAME', 'NAME']
         if not np.any([p in self.columns for p in namepars]):
             warnings.warn("No 'NAME' parameter in table!")
             return None
 
-        # try searching for the name in each potential name-type
-        for namepar in namepars:
-            if namepar in self.columns:
-                names = self.catalogue[namepar]
-                if np.any(psr == names):
-                    psrrow = self.catalogue_table[(psr == names).tolist()]
-                    if selected:
-                        return psrrow[self.query_params]
-                    else:
-                        return psrrow
+        revision = getattr(self, '_catalogue_revision', 0)
+        nameindex = getattr(self, '_name_index', None)
 
-        return None
+        if nameindex is None or nameindex[0] != revision:
+            # search for names in each potential name-type in turn, with
+            # earlier name-types and rows taking precedence
+            names = {}
+            for namepar in namepars:
+                if namepar in self.columns:
+                    for i, name in enumerate(self.catalogue[namepar].values):
+                        if isinstance(name, string_types):
+                            names.setdefault(name, i)
+
+            self._name_index = nameindex = (revision, names)
+
+        return nameindex[1].get(psr, None)
+
+    def _pulsar_row(self, psr):
+        """
+        Return all the catalogue parameter values for a pulsar.
+
+        Args:
+            psr (str): The name of a pulsar.
+
+        Returns:
+            dict: a dictionary of parameter values keyed on parameter name,
+            with missing values given as :data:`numpy.ma.masked`, or None if
+            the pulsar is not found.
+        """
+
+        idx = self._pulsar_index(psr)
+
+        if idx is None:
+            return None
+
+        row = {}
+        for col in self.columns:
+            value = self.catalogue[col].values[idx]
+            row[col] = np.ma.masked if isna(value) else value
+
+        return row
 
     def get_ephemeris(self, psr, precision=15, selected=False):
         """
@@ -2277,110 +3608,261 @@ class QueryATNF(object):
             str: an ephemeris
         """
 
-        psr = self.get_pulsar(psr, selected=selected)
+        idx = self._pulsar_index(psr)
 
-        if psr is None:
+        if idx is None:
             return None
 
-        ephemstr = ''
+        return self._ephemeris_strings([idx], precision=precision,
+                                       selected=selected)[0]
+
+    def _ephemeris_strings(self, rows, precision=15, selected=False):
+        """
+        Create ephemeris strings for a set of catalogue rows. Values are
+        formatted a whole parameter column at a time.
+
+        Args:
+            rows (array_like): the catalogue row indices of the pulsars.
+            precision (int): The precision (number of decimal places) at which
+                to output numbers. Defaults to 15.
+            selected (bool): If True only output the parameters specified by
+                :meth:`~psrqpy.QueryATNF.query_params`, otherwise output all
+                parameters. Defaults to False.
+
+        Returns:
+            list: a list of ephemeris strings.
+        """
+
+        rows = np.asarray(rows, dtype=int)
+        npsrs = len(rows)
+
+        if selected and isinstance(self.query_params, list):
+            columns = self.query_params
+        else:
+            columns = self.columns
+
+        pars = [par for par in PSR_ALL_PARS if par in columns]
 
-        # get variables that are set
-        variables = []
+        # get parameter values and errors
         values = []
         errors = []
-        for par in PSR_ALL_PARS:
-            if par in psr.columns:
-                parval = psr[par]
+        present = np.zeros((len(pars), npsrs), dtype=bool)
+        for i, par in enumerate(pars):
+            values.append(self.catalogue[par].values[rows])
+            present[i] = ~isna(values[-1])
 
-                if not parval.mask[0]:
-                    variables.append(par)
-                    values.append(parval[0])
+            if par+'_ERR' in columns:
+                errors.append(self.catalogue[par+'_ERR'].values[rows])
+            else:
+                errors.append(None)
 
-                    if par+'_ERR' in psr.columns:
-                        errval = psr[par+'_ERR']
+        # max key length for output alignment for each pulsar
+        parlens = np.array([len(par) for par in pars])
+        mkls = np.where(present, parlens[:, np.newaxis], 0).max(axis=0) + 2
+        vlb = precision + 10  # allow extra space for minus sign/exponents
 
-                        if not errval.mask[0]:
-                            errors.append(errval[0])
-                        else:
-                            errors.append(None)
-                    else:
-                        errors.append(None)
+        lines = np.full((len(pars), npsrs), None, dtype=object)
+        for i, par in enumerate(pars):
+            if not np.any(present[i]):
+                continue
 
-        mkl = max([len(kn) for kn in variables])+2  # max key length for output alignment
-        vlb = precision + 10  # allow extra space for minus sign/exponents
-        outputstr = '{{name: <{0}}}{{value: <{1}}}\t{{error}}'.format(mkl, vlb)
+            value = values[i][present[i]]
+            error = None if errors[i] is None else errors[i][present[i]]
 
-        for varname, varval, varerr in zip(variables, values, errors):
-            outputdic = {}
-            outputdic['name'] = varname
+            valstrs, errstrs = self._ephemeris_format(value, error, precision)
+            # pad values (np.char.ljust would truncate longer values)
+            padding = np.maximum(vlb - np.char.str_len(valstrs), 0)
+            valstrs = np.char.add(valstrs, np.char.multiply(' ', padding))
 
-            if isinstance(varval, float):
-                if varval.is_integer():
-                    precstr = '{0:.0f}'  # print out an integer
-                else:
-                    precstr = '{{0:.{}f}}'.format(precision)  # print out float
+            for mkl in np.unique(mkls[present[i]]):
+                mklidx = mkls[present[i]] == mkl
+                parlines = np.char.add(np.char.add(par.ljust(mkl),
+                                                   valstrs[mklidx]),
+                                       np.char.add('\t', errstrs[mklidx]))
+                lines[i, np.flatnonzero(present[i])[mklidx]] = np.char.rstrip(parlines)
 
-                if abs(varval) < 1e-6 or abs(varval) > 1e6:
-                    # print out float in scientific notation
-                    precstr = '{{0:.{}e}}'.format(precision)
+        return [''.join([line + '\n' for line in lines[:, j] if line is not None])
+                for j in range(npsrs)]
 
-                if varerr is not None:
-                    if varerr.is_integer():
-                        precstre = '{0:.0f}'  # print out an integer
-                else:
-                    precstre = '{{0:.{}f}}'.format(precision)  # print out float
+    @staticmethod
+    def _ephemeris_format(values, errors, precision):
+        """
+        Format arrays of parameter values and errors for output in an
+        ephemeris. Floating point values are output as integers if they have
+        integer values, or in scientific notation if they are smaller than
+        1e-6 or larger than 1e6.
 
-                if varerr is not None:
-                    if abs(varerr) < 1e-6 or abs(varerr) > 1e6:
-                        # print out float in scientific notation
-                        precstre = '{{0:.{}e}}'.format(precision)
+        Args:
+            values (:class:`~numpy.ndarray`): an array of parameter values.
+            errors (:class:`~numpy.ndarray`): an array of parameter errors
+                (or None).
+            precision (int): the number of decimal places for floats.
 
-                outputdic['value'] = precstr.format(varval)
-                outputdic['error'] = precstre.format(varerr) if varerr is not None else ''
-            else:
-                outputdic['value'] = varval
+        Returns:
+            tuple: arrays of the value and error strings.
+        """
 
-                if isinstance(varerr, float):
-                    precstre = '{{0:.{}f}}'.format(precision)  # print out float
-                    if abs(varerr) < 1e-6 or abs(varerr) > 1e6:
-                        # print out float in scientific notation
-                        precstre = '{{0:.{}e}}'.format(precision)
+        def floatstrs(floats, checkint=True):
+            floats = np.asarray(floats, dtype=float)
+            strs = np.char.mod('%.{}f'.format(precision), floats).astype(object)
 
-                    outputdic['error'] = precstre.format(varerr)
-                else:
-                    outputdic['error'] = ''
+            if checkint:
+                isint = floats == np.floor(floats)
+                strs[isint] = np.char.mod('%.0f', floats[isint])
+
+            sci = (np.abs(floats) < 1e-6) | (np.abs(floats) > 1e6)
+            strs[sci] = np.char.mod('%.{}e'.format(precision), floats[sci])
+
+            return strs
+
+        if np.issubdtype(values.dtype, np.floating):
+            isfloat = np.ones(len(values), dtype=bool)
+        else:
+            isfloat = np.array([isinstance(v, float) for v in values],
+                               dtype=bool)
+
+        valstrs = np.array([str(v) for v in values], dtype=object)
+        if np.any(isfloat):
+            valstrs[isfloat] = floatstrs(values[isfloat])
+
+        errstrs = np.full(len(values), '', dtype=object)
+        if errors is not None:
+            haserr = ~isna(errors)
+            if np.any(haserr & isfloat):
+                errstrs[haserr & isfloat] = floatstrs(errors[haserr & isfloat])
+            if np.any(haserr & ~isfloat):
+                errstrs[haserr & ~isfloat] = floatstrs(errors[haserr & ~isfloat],
+                                                       checkint=False)
+
+        return valstrs.astype(str), errstrs.astype(str)
+
+    def write_ephemerides(self, outdir=None, archive=None, precision=15,
+                          selected=False, suffix='.par', nthreads=None,
+                          chunksize=1000):
+        """
+        Write out ephemerides for all the pulsars returned by the query, with
+        each in a file called after the pulsar's J-name, e.g.,
+        ``J0534+2200.par``. The ephemerides are in the same format as from
+        :meth:`~psrqpy.QueryATNF.get_ephemeris`, but are created in batches of
+        pulsars with the values for each parameter being formatted together.
+        Files can either be written into a directory (using a pool of threads)
+        or streamed into a single tar archive.
+
+        Args:
+            outdir (str): the directory in which to write the files (this
+                will be created if it does not exist).
+            archive (str): the name of a tar archive file in which to write
+                the ephemerides (if the name ends in '.gz', '.tgz' or '.bz2'
+                it will be compressed). If given `outdir` is ignored.
+            precision (int): The precision (number of decimal places) at which
+                to output numbers. Defaults to 15.
+            selected (bool): If True only output the parameters specified by
+                :meth:`~psrqpy.QueryATNF.query_params`, otherwise output all
+                parameters. Defaults to False.
+            suffix (str): the file name extension. Defaults to '.par'.
+            nthreads (int): the number of threads with which to write files
+                to `outdir`. Defaults to None, in which case the number of
+                CPUs is used.
+            chunksize (int): the number of ephemerides to create at once.
+                Defaults to 1000.
+
+        Returns:
+            list: a list of the paths of the written files, or the names of
+            the files within the archive.
+
+        Example:
+            Write out par files for all millisecond pulsars
 
-            ephemstr += outputstr.format(**outputdic).strip()+'\n'
+            >>> query = QueryATNF(condition='P0 < 0.03')
+            >>> files = query.write_ephemerides(outdir='msps')
+        """
+
+        import io
+        import tarfile
+        from multiprocessing.pool import ThreadPool
+
+        if outdir is None and archive is None:
+            raise ValueError("An output directory or archive must be given")
+
+        if 'JNAME' not in self.columns:
+            raise KeyError("No 'JNAME' parameter in table")
+
+        idx = self._query_indices()
+        if idx is None:
+            idx = np.array([], dtype=int)
+
+        def chunks():
+            for start in range(0, len(idx), chunksize):
+                rows = idx[start:start + chunksize]
+                names = self.catalogue['JNAME'].values[rows]
+                ephems = self._ephemeris_strings(rows, precision=precision,
+                                                 selected=selected)
+                yield [(name + suffix, ephem) for name, ephem in zip(names, ephems)]
+
+        written = []
+
+        if archive is not None:
+            mode = 'w'
+            if archive.endswith(('.gz', '.tgz')):
+                mode = 'w:gz'
+            elif archive.endswith('.bz2'):
+                mode = 'w:bz2'
 
-        return ephemstr
+            try:
+                with tarfile.open(archive, mode) as tar:
+                    for chunk in chunks():
+                        for fname, ephem in chunk:
+                            data = ephem.encode('utf-8')
+                            info = tarfile.TarInfo(name=fname)
+                            info.size = len(data)
+                            tar.addfile(info, io.BytesIO(data))
+                            written.append(fname)
+            except (IOError, tarfile.TarError):
+                raise IOError("Error writing ephemeris archive "
+                              "'{}'".format(archive))
+
+            return written
+
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        def write(item):
+            fname = os.path.join(outdir, item[0])
+            with io.open(fname, 'w', encoding='utf-8') as fp:
+                fp.write(six.text_type(item[1]))
+            return fname
+
+        pool = ThreadPool(nthreads)
+        try:
+            for chunk in chunks():
+                written.extend(pool.map(write, chunk))
+        except IOError:
+            raise IOError("Error writing ephemeris files to "
+                          "'{}'".format(outdir))
+        finally:
+            pool.close()
+            pool.join()
+
+        return written
 
     def get_pulsars(self):
         """
         Returns:
             :class:`psrqpy.pulsar.Pulsars`: the queried pulsars returned as a
             :class:`~psrqpy.pulsar.Pulsars` object, which is a dictionary of
-            :class:`~psrqpy.pulsar.Pulsar` objects.
+            :class:`~psrqpy.pulsar.PulsarRow` objects that read their values
+            from the catalogue.
         """
 
         if not self._pulsars:
-            from .pulsar import Pulsar, Pulsars
-
-            self._pulsars = Pulsars()
-
-            # add pulsars one by one
-            qparams = deepcopy(self.query_params)
-            if isinstance(qparams, list):
-                if 'JNAME' not in qparams:
-                    self.query_params = self.query_params + ['JNAME']
-            else:
-                self.query_params = ['JNAME']
+            from .pulsar import Pulsars
 
-            psrtable = self.table
-            for row in psrtable:
-                P = Pulsar(row['JNAME'], query=self)
-                self._pulsars.add_pulsar(P)
+            # the pulsars are stored as their rows in the catalogue
+            idx = self._query_indices()
+            if idx is None or 'JNAME' not in self.columns:
+                idx = np.array([], dtype=int)
 
-            self.query_params = qparams  # revert to previous query parameters
+            self._pulsars = Pulsars(query=self, rows=idx)
 
         return self._pulsars
 
@@ -2393,7 +3875,7 @@ class QueryATNF(object):
             str: the ATNF version number.
         """
 
-        return self.catalogue.version
+        return getattr(self.catalogue, 'version', None)
 
     def parse_conditions(self, psrtype=None, assoc=None, bincomp=None):
         """
@@ -2578,7 +4060,9 @@ class QueryATNF(object):
               showGCs=False, showSNRs=False, markertypes={}, deathline=True,
               deathmodel='Ip', filldeath=True, filldeathtype={}, showtau=True,
               brakingidx=3, tau=None, showB=True, Bfield=None, pdotlims=None,
-              periodlims=None, usecondition=True, rcparams={}):
+              periodlims=None, usecondition=True, rcparams={}, density=False,
+              bins=100, cmap='Greys', typedensity=False, rasterized=None,
+              template=None):
         """
         Draw a lovely period vs period derivative diagram.
 
@@ -2626,6 +4110,29 @@ class QueryATNF(object):
                 Defaults to True.
             rcparams (dict): a dictionary of :py:obj:`matplotlib.rcParams`
                 setup parameters for the plot.
+            density (bool): rather than plotting a marker for each pulsar,
+                show the number of pulsars in logarithmically spaced bins of
+                period and period derivative as an image. This is useful for
+                very large numbers of pulsars, e.g., from population
+                synthesis. Defaults to False.
+            bins (int, list): the number of bins, or a list of the number of
+                period and period derivative bins, for the density image.
+                Defaults to 100.
+            cmap (str): the colour map for the density image. Defaults to
+                ``'Greys'``.
+            typedensity (bool): if `density` is True, show the pulsar types
+                given by `showtypes` as contours of their density rather than
+                with markers. Defaults to False.
+            rasterized (bool): rasterize the markers for each pulsar (and the
+                density image) when saving the figure in a vector format.
+                Defaults to None, in which case they are rasterized if
+                `density` is True.
+            template (:class:`~psrqpy.utils.PPdotTemplate`): a template
+                containing the background of the diagram. If given, then the
+                plot limits, death line, characteristic age and magnetic field
+                lines, and rcparams, are all taken from the template rather
+                than the other arguments. Using the same template for many
+                diagrams means the background is only created once.
 
         Returns:
             :class:`matplotlib.figure.Figure`: the figure object
@@ -2633,12 +4140,11 @@ class QueryATNF(object):
 
         try:
             import matplotlib as mpl
-            from matplotlib import pyplot as pl
         except ImportError:
             raise ImportError('Cannot produce P-Pdot plot as Matplotlib is '
                               'not available')
 
-        from .utils import death_line, label_line
+        from .utils import PPdotTemplate
 
         # get table containing all required parameters
         table = self.query_table(usecondition=usecondition,
@@ -2652,7 +4158,7 @@ class QueryATNF(object):
         if isinstance(showtypes, string_types):
             nshowtypes = [showtypes]
         else:
-            nshowtypes = showtypes
+            nshowtypes = list(showtypes)
 
         for stype in list(nshowtypes):
             if 'ALL' == stype.upper():
@@ -2667,118 +4173,124 @@ class QueryATNF(object):
             if 'SGR' == stype.upper():  # synonym for AXP
                 nshowtypes[nshowtypes.index(stype)] = 'AXP'
 
-        # set plot parameters
-        rcparams['figure.figsize'] = rcparams['figure.figsize'] if \
-            'figure.figsize' in rcparams else (9, 9.5)
-        rcparams['figure.dpi'] = rcparams['figure.dpi'] if \
-            'figure.dpi' in rcparams else 250
-        rcparams['text.usetex'] = rcparams['text.usetex'] if \
-            'text.usetex' in rcparams else True
-        rcparams['axes.linewidth'] = rcparams['axes.linewidth'] if \
-            'axes.linewidth' in rcparams else 0.5
-        rcparams['axes.grid'] = rcparams['axes.grid'] if \
-            'axes.grid' in rcparams else False
-        rcparams['font.family'] = rcparams['font.family'] if \
-            'font.family' in rcparams else 'sans-serif'
-        rcparams['font.sans-serif'] = rcparams['font.sans-serif'] if \
-            'font.sans-serif' in rcparams else \
-            'Avant Garde, Helvetica, Computer Modern Sans serif'
-        rcparams['font.size'] = rcparams['font.size'] if \
-            'font.size' in rcparams else 20
-        rcparams['legend.fontsize'] = rcparams['legend.fontsize'] if \
-            'legend.fontsize' in rcparams else 16
-        rcparams['legend.frameon'] = rcparams['legend.frameon'] if \
-            'legend.frameon' in rcparams else False
-
-        mpl.rcParams.update(rcparams)
-
-        fig, ax = pl.subplots()
+        if rasterized is None:
+            rasterized = density
 
         # extract periods and period derivatives
-        periods = table['P0']
-        pdots = table['P1']
+        periods = np.ma.filled(np.ma.asarray(table['P0'], dtype=float), np.nan)
+        pdots = np.ma.filled(np.ma.asarray(table['P1'], dtype=float), np.nan)
         if intrinsicpdot:  # use instrinsic period derivatives if requested
-            ipdotidx = np.isfinite(table['P1_I'])
-            pdots[ipdotidx] = table['P1_I'][ipdotidx]
+            ipdots = np.ma.filled(np.ma.asarray(table['P1_I'], dtype=float),
+                                  np.nan)
+            ipdotidx = np.isfinite(ipdots)
+            pdots[ipdotidx] = ipdots[ipdotidx]
 
-        # get only finite values
-        pidx = (np.isfinite(periods)) & (np.isfinite(pdots))
-        periods = periods[pidx]
-        pdots = pdots[pidx]
-
-        if 'ASSOC' in table.columns:
-            assocs = table['ASSOC'][pidx]     # associations
-        if 'TYPE' in table.columns:
-            types = table['TYPE'][pidx]       # pulsar types
-        if 'BINARY' in nshowtypes:
-            binaries = table['BINARY'][pidx]  # binary pulsars
-
-        # now get only positive pdot values
-        pidx = pdots > 0.
-        periods = periods[pidx]
-        pdots = pdots[pidx]
+        # string values of the associations and types (only created once)
+        assocs = None
         if 'ASSOC' in table.columns:
-            assocs = assocs[pidx]      # associations
+            assocs = np.array(table['ASSOC'].tolist(), dtype=str)
+        types = None
         if 'TYPE' in table.columns:
-            types = types[pidx]        # pulsar types
-        if 'BINARY' in nshowtypes:
-            binaries = binaries[pidx]  # binary pulsars
+            types = np.array(table['TYPE'].tolist(), dtype=str)
+
+        # get only finite and positive values
+        keep = np.isfinite(periods) & np.isfinite(pdots)
+        keep[keep] = pdots[keep] > 0.
 
         # check whether to exclude globular cluster pulsars that could have
         # contaminated spin-down value
-        if excludeGCs:
-            # use '!=' to find GC indexes
-            nongcidxs = np.flatnonzero(
-                np.char.find(np.array(assocs.tolist(),
-                                      dtype=np.str), 'GC:') == -1)
-            periods = periods[nongcidxs]
-            pdots = pdots[nongcidxs]
-            if 'ASSOC' in table.columns:
-                assocs = assocs[nongcidxs]
-            if 'TYPE' in table.columns:
-                types = types[nongcidxs]
-            if 'BINARY' in nshowtypes:
-                binaries = binaries[nongcidxs]
-
-        # plot pulsars
-        ax.loglog(periods, pdots, marker='.', color='dimgrey',
-                  linestyle='none')
-        ax.set_xlabel(r'Period (s)')
-        ax.set_ylabel(r'Period Derivative')
-
-        # get limits
-        if periodlims is None:
-            periodlims = [10**np.floor(np.min(np.log10(periods))),
-                          10.*int(np.ceil(np.max(pdots)/10.))]
-        if pdotlims is None:
-            pdotlims = [10**np.floor(np.min(np.log10(pdots))),
-                        10**np.ceil(np.max(np.log10(pdots)))]
-        ax.set_xlim(periodlims)
-        ax.set_ylim(pdotlims)
-
-        if deathline:
-            deathpdots = 10**death_line(np.log10(periodlims),
-                                        linemodel=deathmodel)
-            ax.loglog(periodlims, deathpdots, 'k--', linewidth=0.5)
-
-            if filldeath:
-                if not filldeathtype:
-                    filldeathtype = {}
-
-                filldeathtype['linestyle'] = filldeathtype['linestyle'] if \
-                    'linestyle' in filldeathtype else '-'
-                filldeathtype['alpha'] = filldeathtype['alpha'] if \
-                    'alpha' in filldeathtype else 0.15
-                filldeathtype['facecolor'] = filldeathtype['facecolor'] if \
-                    'facecolor' in filldeathtype else 'darkorange'
-                filldeathtype['hatch'] = filldeathtype['hatch'] if \
-                    'hatch' in filldeathtype else ''
-                ax.fill_between(periodlims, deathpdots, pdotlims[0],
-                                **filldeathtype)
-
-        # add markers for each pulsar type
-        if not markertypes:
-            markertypes = {}
+        if excludeGCs and assocs is not None:
+            keep &= np.char.find(assocs, 'GC:') == -1
+
+        periods = periods[keep]
+        pdots = pdots[keep]
+
+        def typemask(thistype):
+            # boolean mask of the pulsars of a given type
+            if thistype == 'BINARY':
+                # for binaries used the 'BINARY' column in the table
+                if 'BINARY' not in table.columns:
+                    return np.zeros(len(periods), dtype=bool)
+                return ~np.ma.getmaskarray(table['BINARY'])[keep]
+
+            values = assocs if thistype in ['GC', 'SNR'] else types
+            if values is None:
+                return np.zeros(len(periods), dtype=bool)
+            return np.char.find(values[keep], thistype) != -1
+
+        if template is None:
+            # get limits
+            if periodlims is None:
+                periodlims = [10**np.floor(np.min(np.log10(periods))),
+                              10.*int(np.ceil(np.max(pdots)/10.))]
+            if pdotlims is None:
+                pdotlims = [10**np.floor(np.min(np.log10(pdots))),
+                            10**np.ceil(np.max(np.log10(pdots)))]
+
+            template = PPdotTemplate(periodlims, pdotlims, deathline=deathline,
+                                     deathmodel=deathmodel, filldeath=filldeath,
+                                     filldeathtype=filldeathtype,
+                                     showtau=showtau, brakingidx=brakingidx,
+                                     tau=tau, showB=showB, Bfield=Bfield,
+                                     rcparams=rcparams)
+
+        periodlims = template.periodlims
+        pdotlims = template.pdotlims
+
+        # get a copy of the background figure
+        fig, ax = template.figure()
+
+        with mpl.rc_context(template.rcparams):
+            self._ppdot_pulsars(ax, periods, pdots, typemask, nshowtypes,
+                                periodlims, pdotlims, markertypes, density,
+                                bins, cmap, typedensity, rasterized,
+                                showGCs and not excludeGCs, showSNRs)
+
+        # return the figure
+        return fig
+
+    @staticmethod
+    def _ppdot_pulsars(ax, periods, pdots, typemask, nshowtypes, periodlims,
+                       pdotlims, markertypes, density, bins, cmap,
+                       typedensity, rasterized, showGCs, showSNRs):
+        """
+        Plot the pulsars on a P-Pdot diagram (see
+        :meth:`~psrqpy.search.QueryATNF.ppdot`).
+        """
+
+        from matplotlib.colors import LogNorm
+        from matplotlib.lines import Line2D
+
+        if density:
+            # bin the pulsars in logarithmically spaced bins
+            nbins = [bins, bins] if np.ndim(bins) == 0 else bins
+            pedges = np.logspace(np.log10(periodlims[0]),
+                                 np.log10(periodlims[1]), nbins[0] + 1)
+            pdedges = np.logspace(np.log10(pdotlims[0]),
+                                  np.log10(pdotlims[1]), nbins[1] + 1)
+            logpedges = np.log10(pedges)
+            logpdedges = np.log10(pdedges)
+            logperiods = np.log10(periods)
+            logpdots = np.log10(pdots)
+
+            def histogram(mask=slice(None)):
+                return np.histogram2d(logperiods[mask], logpdots[mask],
+                                      bins=[logpedges, logpdedges])[0]
+
+            counts = histogram()
+            if np.any(counts > 0):
+                ax.pcolormesh(pedges, pdedges,
+                              np.ma.masked_equal(counts.T, 0.),
+                              cmap=cmap, norm=LogNorm(),
+                              rasterized=rasterized)
+        else:
+            # plot pulsars
+            ax.loglog(periods, pdots, marker='.', color='dimgrey',
+                      linestyle='none', rasterized=rasterized)
+
+        # add markers for each pulsar type (copying any user defined markers)
+        markertypes = {key: dict(value) for key, value in markertypes.items()} if \
+            markertypes else {}
 
         # check if markers have been defined by the user or not
         markertypes['AXP'] = {'marker': 's', 'markeredgecolor': 'red'} if \
@@ -2810,7 +4322,7 @@ class QueryATNF(object):
         typelegstring['RRAT'] = r'RRAT'
 
         # show globular cluster pulsars
-        if showGCs and not excludeGCs:
+        if showGCs:
             nshowtypes.append('GC')
 
         # show pulsars with associated supernova remnants
@@ -2822,19 +4334,24 @@ class QueryATNF(object):
         for stype in nshowtypes:
             if stype.upper() in PSR_TYPE + ['GC', 'SNR']:
                 thistype = stype.upper()
-                if thistype == 'BINARY':
-                    # for binaries used the 'BINARY' column in the table
-                    typeidx = np.flatnonzero(~binaries.mask)
-                elif thistype in ['GC', 'SNR']:
-                    typeidx = np.flatnonzero(
-                        np.char.find(np.array(assocs.tolist(),
-                                              dtype=np.str), thistype) != -1)
-                else:
-                    typeidx = np.flatnonzero(
-                        np.char.find(np.array(types.tolist(),
-                                              dtype=np.str), thistype) != -1)
+                typeidx = typemask(thistype)
+
+                if not np.any(typeidx):
+                    continue
 
-                if len(typeidx) == 0:
+                label = typelegstring.get(thistype, thistype)
+
+                if density and typedensity:
+                    # show contours of the density of the given type
+                    color = markertypes[thistype].get('markeredgecolor',
+                                                      markertypes[thistype].get('color', 'k'))
+                    typecounts = histogram(typeidx)
+                    levels = np.logspace(-0.3, np.log10(typecounts.max()), 4)[:-1]
+                    ax.contour(10**(0.5*(logpedges[1:] + logpedges[:-1])),
+                               10**(0.5*(logpdedges[1:] + logpdedges[:-1])),
+                               typecounts.T, levels=levels, colors=[color],
+                               linewidths=0.75)
+                    handles[label] = Line2D([], [], color=color)
                     continue
 
                 # default to empty markers with no lines between them
@@ -2843,64 +4360,266 @@ class QueryATNF(object):
                 if 'linestyle' not in markertypes[thistype]:
                     markertypes[thistype]['linestyle'] = 'none'
                 typehandle, = ax.loglog(periods[typeidx], pdots[typeidx],
-                                        label=typelegstring[thistype],
+                                        label=label, rasterized=rasterized,
                                         **markertypes[thistype])
-                if thistype in typelegstring:
-                    handles[typelegstring[thistype]] = typehandle
-                else:
-                    handles[thistype] = typehandle
+                handles[label] = typehandle
 
-                ax.legend(handles.values(), handles.keys(), loc='upper left',
-                          numpoints=1)
+        if len(handles) > 0:
+            ax.legend(handles.values(), handles.keys(), loc='upper left',
+                      numpoints=1)
 
-        # add characteristic age lines
-        tlines = OrderedDict()
-        if showtau:
-            if tau is None:
-                taus = [1e5, 1e6, 1e7, 1e8, 1e9]  # default characteristic ages
-            else:
-                taus = tau
-
-            nbrake = brakingidx
-            for tauv in taus:
-                pdots_tc = age_pdot(periodlims, tau=tauv, braking_idx=nbrake)
-                tline, = ax.loglog(periodlims, pdots_tc, 'k-.', linewidth=0.5)
-                # check if taus are powers of 10
-                taupow = np.floor(np.log10(tauv))
-                numv = tauv/10**taupow
-                if numv == 1.:
-                    tlines[r'$10^{{{0:d}}}\,{{\rm yr}}$'.format(int(taupow))] = tline
-                else:
-                    tlines[r'${{{0:.1f}}}!\times\!10^{{{1:d}}}\,{{\rm yr}}$'
-                           .format(numv, taupow)] = tline
-
-        # add magnetic field lines
-        Blines = OrderedDict()
-        if showB:
-            if Bfield is None:
-                Bs = [1e10, 1e11, 1e12, 1e13, 1e14]
-            else:
-                Bs = Bfield
-            for B in Bs:
-                pdots_B = B_field_pdot(periodlims, Bfield=B)
-                bline, = ax.loglog(periodlims, pdots_B, 'k:', linewidth=0.5)
-                # check if Bs are powers of 10
-                Bpow = np.floor(np.log10(B))
-                numv = B/10**Bpow
-                if numv == 1.:
-                    Blines[r'$10^{{{0:d}}}\,{{\rm G}}$'.format(int(Bpow))] = bline
-                else:
-                    Blines[r'${{{0:.1f}}}!\times\!10^{{{1:d}}}\,{{\rm G}}$'
-                           .format(numv, Bpow)] = bline
 
-        fig.tight_layout()
+def _shared_key(loadfromdb):
+    """
+    Return the key for a shared catalogue.
+    """
+
+    if loadfromdb is None:
+        return None
 
-        # add text for characteristic age lines and magnetic field strength lines
-        for l in tlines:
-            _ = label_line(ax, tlines[l], l, color='k', fs=18, frachoffset=0.05)
+    return os.path.realpath(loadfromdb)
 
-        for l in Blines:
-            _ = label_line(ax, Blines[l], l, color='k', fs=18, frachoffset=0.90)
 
-        # return the figure
-        return fig
+def shared_catalogue(loadfromdb=None, refresh=False, cache=True):
+    """
+    Return a process-wide shared :class:`~psrqpy.search.QueryATNF` object for
+    a catalogue database. The catalogue is only downloaded (or read in),
+    and the derived parameters calculated, the first time this is called,
+    with subsequent calls returning the same object. This is thread safe, so
+    if multiple threads request the same catalogue only one will load it.
+    The shared catalogue is used by any :class:`~psrqpy.pulsar.Pulsar`
+    objects created without a query, and by
+    :class:`~psrqpy.search.QueryATNF` objects created with
+    ``shared=True``.
+
+    Args:
+        loadfromdb (str): the path to a catalogue database file. Defaults to
+            None, in which case the ATNF Pulsar Catalogue is used. If the
+            file has been modified since it was loaded it will be reloaded.
+        refresh (bool): if True reload the catalogue (checking for an update
+            to the ATNF Pulsar Catalogue). Defaults to False.
+        cache (bool): cache the downloaded ATNF Pulsar Catalogue file.
+            Defaults to True.
+
+    Returns:
+        :class:`psrqpy.search.QueryATNF`: the shared query.
+    """
+
+    key = _shared_key(loadfromdb)
+
+    with _SHARED_LOCK:
+        lock = _SHARED_LOCKS.setdefault(key, threading.Lock())
+
+    with lock:
+        try:
+            mtime = None
+            if key is not None:
+                try:
+                    mtime = os.path.getmtime(key)
+                except OSError:
+                    raise IOError("Could not get catalogue database file")
+
+            query, qmtime = _SHARED_CATALOGUES.get(key, (None, None))
+
+            if query is None or refresh or qmtime != mtime:
+                query = QueryATNF(loadfromdb=loadfromdb, cache=cache,
+                                  checkupdate=refresh)
+                _SHARED_CATALOGUES[key] = (query, mtime)
+        except Exception:
+            # do not keep locks for catalogues that could not be loaded
+            with _SHARED_LOCK:
+                if key not in _SHARED_CATALOGUES and _SHARED_LOCKS.get(key) is lock:
+                    del _SHARED_LOCKS[key]
+            raise
+
+    return query
+
+
+def evict_shared_catalogue(loadfromdb=None, everything=False):
+    """
+    Remove a shared catalogue (see
+    :func:`~psrqpy.search.shared_catalogue`), so that it is loaded again
+    when next required. Any objects already using the catalogue will keep
+    using it.
+
+    Args:
+        loadfromdb (str): the path to the catalogue database file. Defaults to
+            None, in which case the ATNF Pulsar Catalogue is removed.
+        everything (bool): if True remove all shared catalogues. Defaults to
+            False.
+    """
+
+    # the per-catalogue locks are kept, so that a catalogue that is still
+    # being loaded is not loaded a second time by another thread
+    with _SHARED_LOCK:
+        if everything:
+            _SHARED_CATALOGUES.clear()
+        else:
+            _SHARED_CATALOGUES.pop(_shared_key(loadfromdb), None)
+
+
+def _write_columns(fname, dftable, state, version=None):
+    """
+    Write a catalogue :class:`pandas.DataFrame` and query state to a binary
+    file. The file contains an identifier, the length of a JSON header and
+    the header (containing the state and the position of each column), and
+    then the data for each column aligned to 64 bytes. All numerical
+    columns of the same type are stored together as a single block. String
+    columns are stored as UTF-8 encoded bytes along with arrays of offsets
+    and missing value flags.
+
+    Args:
+        fname (str): the file name.
+        dftable (:class:`pandas.DataFrame`): the catalogue.
+        state (dict): a dictionary of query state that can be output as JSON.
+        version (str): the catalogue version.
+    """
+
+    import json
+
+    nrows = len(dftable)
+
+    # group numerical columns by type
+    blocks = OrderedDict()
+    strings = OrderedDict()
+    columns = []
+    for col in dftable.columns:
+        values = dftable[col].values
+
+        if values.dtype == object:
+            isnull = isna(values)
+            isstr = [isinstance(v, string_types) for v in values[~isnull]]
+            if not np.all(isstr):
+                try:
+                    values = values.astype(float)
+                except (TypeError, ValueError):
+                    values = np.array([v if isnull[i] else str(v)
+                                       for i, v in enumerate(values)],
+                                      dtype=object)
+
+        if values.dtype == object:
+            strings[col] = values
+            columns.append({'name': col, 'kind': 'string'})
+        else:
+            dtype = values.dtype.newbyteorder('<').str
+            blocks.setdefault(dtype, []).append(col)
+            columns.append({'name': col, 'kind': 'numeric', 'dtype': dtype})
+
+    # create the data buffers
+    buffers = []
+    header = {'nrows': nrows, 'columns': columns, 'state': state,
+              'version': version, 'blocks': [], 'strings': []}
+
+    for dtype, cols in blocks.items():
+        data = np.empty((len(cols), nrows), dtype=dtype)
+        for i, col in enumerate(cols):
+            data[i] = dftable[col].values
+        header['blocks'].append({'dtype': dtype, 'columns': cols})
+        buffers.append(data)
+
+    for col, values in strings.items():
+        isnull = isna(values)
+        encoded = [b'' if isnull[i] else v.encode('utf-8')
+                   for i, v in enumerate(values)]
+        offsets = np.zeros(nrows + 1, dtype='<i8')
+        offsets[1:] = np.cumsum([len(v) for v in encoded])
+        header['strings'].append({'name': col})
+        buffers.extend([np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                        offsets, isnull.astype(np.uint8)])
+
+    def padding(position):
+        return (-position) % _COLUMNS_ALIGN
+
+    # work out positions of buffers
+    position = 0
+    header['buffers'] = []
+    for data in buffers:
+        header['buffers'].append({'offset': position, 'nbytes': data.nbytes})
+        position += data.nbytes + padding(data.nbytes)
+
+    headerbytes = json.dumps(header).encode('utf-8')
+    start = len(_COLUMNS_MAGIC) + 8 + len(headerbytes)
+    start += padding(start)
+
+    with open(fname, 'wb') as fp:
+        fp.write(_COLUMNS_MAGIC)
+        fp.write(np.array([len(headerbytes)], dtype='<i8').tobytes())
+        fp.write(headerbytes)
+        fp.write(b'\x00' * (start - fp.tell()))
+
+        for data in buffers:
+            fp.write(np.ascontiguousarray(data).tobytes())
+            fp.write(b'\x00' * padding(data.nbytes))
+
+
+def _read_columns(fname):
+    """
+    Read a file written by :func:`~psrqpy.search._write_columns`. The file is
+    memory mapped (with copy-on-write) and numerical columns are views of it.
+
+    Args:
+        fname (str): the file name.
+
+    Returns:
+        tuple: the catalogue :class:`pandas.DataFrame`, the query state
+        dictionary and the catalogue version.
+    """
+
+    import json
+
+    with open(fname, 'rb') as fp:
+        magic = fp.read(len(_COLUMNS_MAGIC))
+        if magic != _COLUMNS_MAGIC:
+            raise ValueError("File is not a saved query")
+
+        hlen = int(np.frombuffer(fp.read(8), dtype='<i8')[0])
+        header = json.loads(fp.read(hlen).decode('utf-8'))
+
+    start = len(_COLUMNS_MAGIC) + 8 + hlen
+    start += (-start) % _COLUMNS_ALIGN
+
+    nrows = header['nrows']
+    buffers = iter(header['buffers'])
+
+    if len(header['buffers']) > 0:
+        filemap = np.memmap(fname, dtype=np.uint8, mode='c')
+    else:
+        filemap = np.zeros(0, dtype=np.uint8)
+
+    def getbuffer(dtype):
+        buf = next(buffers)
+        offset = start + buf['offset']
+        return filemap[offset:offset + buf['nbytes']].view(dtype)
+
+    values = {}
+    frames = []
+    for block in header['blocks']:
+        data = getbuffer(block['dtype']).reshape((len(block['columns']), nrows))
+        frames.append(DataFrame(data.T, columns=block['columns'], copy=False))
+
+    for string in header['strings']:
+        data = getbuffer(np.uint8).tobytes()
+        offsets = getbuffer('<i8')
+        isnull = getbuffer(np.uint8).astype(bool)
+        strs = np.empty(nrows, dtype=object)
+        for i in range(nrows):
+            strs[i] = np.nan if isnull[i] else data[offsets[i]:offsets[i + 1]].decode('utf-8')
+        values[string['name']] = strs
+
+    if len(frames) == 1:
+        # insert strings columns in their original positions (without
+        # copying the numerical data)
+        dftable = frames[0]
+        for i, column in enumerate(header['columns']):
+            if column['kind'] == 'string':
+                dftable.insert(i, column['name'], values[column['name']])
+    else:
+        for frame in frames:
+            for col in frame.columns:
+                values[col] = frame[col].values
+
+        dftable = DataFrame(OrderedDict([(column['name'], values[column['name']])
+                                         for column in header['columns']]),
+                            index=np.arange(nrows))
+
+    return dftable, header['state'], header['version']
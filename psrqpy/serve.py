@@ -0,0 +1,738 @@
+# coding: utf-8
+
+"""
+A server that keeps a prepared catalogue (with its derived parameters and
+cached sort orders) in memory and answers queries over a local HTTP, or
+Unix socket, API. This means that short-lived scripts do not each have to
+download, parse and process the catalogue. The server can be run with,
+e.g.,
+
+    python -m psrqpy.serve --port 8765
+
+and then used with, e.g., ``QueryATNF(server='http://127.0.0.1:8765')``.
+
+The API is:
+
+ * ``GET /info``: a JSON object containing the catalogue ``version``, a
+   ``token`` identifying the catalogue contents, and the number of rows
+   (``nrows``) and columns (``ncols``).
+ * ``GET /catalogue``: the entire catalogue in the binary column format used
+   by :meth:`~psrqpy.search.QueryATNF.save`.
+ * ``POST /query``: a JSON object of :class:`~psrqpy.search.QueryATNF`
+   keyword arguments (see :data:`QUERY_ARGS`), returning a JSON object
+   containing the ``columns`` of the query table, the ``kinds`` of each
+   column (``'float'``, ``'int'``, ``'bool'`` or ``'string'``), the ``data``
+   for each column as a list (with missing values as null), the catalogue
+   ``version`` and any ``warnings``.
+ * ``POST /reload``: reload the catalogue, with an optional JSON object
+   containing ``checkupdate``, returning the same information as ``/info``.
+"""
+
+from __future__ import print_function, division
+
+import os
+import json
+import stat
+import socket
+import shutil
+import hashlib
+import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from six import string_types
+from six.moves import BaseHTTPServer, socketserver, http_client
+from six.moves.urllib.parse import urlsplit
+
+
+#: the default port of the server
+DEFAULT_PORT = 8765
+
+#: the :class:`~psrqpy.search.QueryATNF` keyword arguments that can be used in queries
+QUERY_ARGS = ['params', 'condition', 'psrtype', 'assoc', 'bincomp', 'exactmatch',
+              'sort_attr', 'sort_order', 'psrs', 'include_errs', 'include_refs',
+              'circular_boundary', 'coord1', 'coord2', 'radius']
+
+# the function to (atomically) move files into place
+_replace = getattr(os, 'replace', os.rename)
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Handle requests to a :class:`~psrqpy.serve.CatalogueServer`.
+    """
+
+    server_version = 'psrqpy'
+
+    def do_GET(self):
+        server = self.server.catalogue_server
+        path = server._count(self.path)
+
+        try:
+            if path == '/info':
+                self._send_json(server.info())
+            elif path == '/catalogue':
+                fp, token, nbytes = server._open_catalogue()
+                with fp:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/octet-stream')
+                    self.send_header('Content-Length', str(nbytes))
+                    self.send_header('X-Psrqpy-Token', token)
+                    self.end_headers()
+                    shutil.copyfileobj(fp, self.wfile)
+            else:
+                self._send_error(404, "Unknown path '{}'".format(path))
+        except Exception as e:
+            self._send_error(500, str(e))
+
+    def do_POST(self):
+        server = self.server.catalogue_server
+        path = server._count(self.path)
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length).decode('utf-8') if length > 0 else '{}'
+            kwargs = json.loads(body)
+            if not isinstance(kwargs, dict):
+                raise ValueError("Request must be a JSON object")
+        except ValueError as e:
+            self._send_error(400, "Invalid request: {}".format(str(e)))
+            return
+
+        try:
+            if path == '/query':
+                self._send_json(server._query_json(**kwargs))
+            elif path == '/reload':
+                server.reload(checkupdate=bool(kwargs.get('checkupdate', False)))
+                self._send_json(server.info())
+            else:
+                self._send_error(404, "Unknown path '{}'".format(path))
+        except (TypeError, ValueError, KeyError) as e:
+            self._send_error(400, str(e))
+        except Exception as e:
+            self._send_error(500, str(e))
+
+    def _send_json(self, output, status=200):
+        content = json.dumps(output).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self, status, message):
+        self._send_json({'error': message}, status=status)
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.catalogue_server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class CatalogueServer(object):
+    """
+    A server that keeps a prepared catalogue in memory and answers queries
+    on it over a local HTTP, or Unix socket, API (see :mod:`psrqpy.serve`).
+    The catalogue is the process-wide shared catalogue (see
+    :func:`~psrqpy.search.shared_catalogue`), so is reloaded if the database
+    file given by `loadfromdb` changes. Queries are handled concurrently,
+    and, so that their warnings can be passed on to each client, psrqpy's
+    warnings are always shown (rather than once) while queries are running.
+
+    Args:
+        host (str): the host name or address to listen on. Defaults to
+            ``'127.0.0.1'``, i.e., only local connections.
+        port (int): the port to listen on. Defaults to :data:`DEFAULT_PORT`.
+            If zero, any free port is used.
+        unix_socket (str): the path of a Unix socket to listen on instead of
+            a TCP port. Defaults to None.
+        loadfromdb (str): the path to a catalogue database file. Defaults to
+            None, in which case the ATNF Pulsar Catalogue is used.
+        cache (bool): cache the downloaded ATNF Pulsar Catalogue file.
+            Defaults to True.
+        checkupdate (bool): if True check for an update to the ATNF Pulsar
+            Catalogue when starting. Defaults to False.
+        verbose (bool): if True log each request. Defaults to False.
+
+    Example:
+        Serve a catalogue in a background thread
+
+        >>> server = CatalogueServer(port=0)
+        >>> server.start()
+        >>> query = QueryATNF(server=server.address, params=['JNAME', 'F0'])
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None,
+                 loadfromdb=None, cache=True, checkupdate=False, verbose=False):
+        self.loadfromdb = loadfromdb
+        self.cache = cache
+        self.verbose = verbose
+        self.counts = {}  # the number of requests for each path
+        self.query = None
+        self._lock = threading.RLock()
+        self._count_lock = threading.Lock()
+        self._tmpdir = tempfile.mkdtemp(prefix='psrqpy-serve-')
+        self._unix_socket = None
+        self._thread = None
+
+        try:
+            from .search import shared_catalogue
+
+            with self._lock:
+                self._prepare(shared_catalogue(loadfromdb=loadfromdb, cache=cache,
+                                               refresh=checkupdate))
+
+            if unix_socket is not None:
+                if not hasattr(socketserver, 'UnixStreamServer'):
+                    raise ValueError("Unix sockets are not available")
+
+                unix_socket = os.path.abspath(unix_socket)
+                if os.path.exists(unix_socket):
+                    # remove a socket left by a previous server
+                    if not stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+                        raise IOError("'{}' exists and is not a socket".format(unix_socket))
+                    os.remove(unix_socket)
+
+                self._httpd = _UnixHTTPServer(unix_socket, _Handler)
+                self._unix_socket = unix_socket
+                self.address = 'unix:' + unix_socket
+            else:
+                self._httpd = _HTTPServer((host, port), _Handler)
+                self.address = 'http://{}:{}'.format(*self._httpd.server_address[:2])
+        except BaseException:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            raise
+
+        self._httpd.catalogue_server = self
+
+    def reload(self, checkupdate=False):
+        """
+        Reload the catalogue.
+
+        Args:
+            checkupdate (bool): if True check for an update to the ATNF
+                Pulsar Catalogue. Defaults to False.
+        """
+
+        from .search import shared_catalogue, evict_shared_catalogue
+
+        with self._lock:
+            evict_shared_catalogue(loadfromdb=self.loadfromdb)
+            self._prepare(shared_catalogue(loadfromdb=self.loadfromdb, cache=self.cache,
+                                           refresh=checkupdate))
+
+    def _prepare(self, query):
+        """
+        Prepare a newly loaded catalogue, writing it to a file that can be
+        sent to clients and caching the default sort order.
+        """
+
+        from .search import _write_columns
+
+        # cache the default sort order (this is shared by the queries)
+        query._query_indices()
+
+        fname = os.path.join(self._tmpdir, 'catalogue.dat')
+        tmpname = fname + '.tmp'
+        _write_columns(tmpname, query.catalogue, {}, version=query.get_version)
+
+        token = hashlib.sha1()
+        with open(tmpname, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                token.update(chunk)
+
+        _replace(tmpname, fname)
+
+        self.query = query
+        self.token = token.hexdigest()[:16]
+        self._catalogue_file = fname
+
+    def _current(self):
+        """
+        Return the current catalogue and its token, preparing it again if the
+        shared catalogue has been reloaded (e.g., if the database file has
+        changed). The lock is only held while doing this, so requests are
+        otherwise handled concurrently.
+        """
+
+        from .search import shared_catalogue
+
+        with self._lock:
+            query = shared_catalogue(loadfromdb=self.loadfromdb, cache=self.cache)
+            if query is not self.query:
+                self._prepare(query)
+
+            return query, self.token
+
+    def info(self):
+        """
+        Return information on the catalogue.
+
+        Returns:
+            dict: the catalogue ``version``, the ``token`` identifying the
+            catalogue contents, and the number of rows (``nrows``) and
+            columns (``ncols``).
+        """
+
+        query, token = self._current()
+
+        return {'version': query.get_version, 'token': token,
+                'nrows': query.catalogue_nrows, 'ncols': query.catalogue_ncols}
+
+    def _open_catalogue(self):
+        """
+        Return an open file containing the catalogue, its token and its size.
+        """
+
+        # open the file with the lock held, so that it matches the token (the
+        # open file is unaffected if it is then replaced by a reload)
+        with self._lock:
+            _, token = self._current()
+            fp = open(self._catalogue_file, 'rb')
+
+        return fp, token, os.fstat(fp.fileno()).st_size
+
+    def query_table(self, **kwargs):
+        """
+        Perform a query on the catalogue.
+
+        Args:
+            kwargs: :class:`~psrqpy.search.QueryATNF` keyword arguments (see
+                :data:`QUERY_ARGS`).
+
+        Returns:
+            tuple: the query table as a :class:`pandas.DataFrame`, the
+            catalogue version and a list of any (user) warning messages.
+        """
+
+        from .search import QueryATNF
+
+        for key in kwargs:
+            if key not in QUERY_ARGS:
+                raise TypeError("Unknown query argument '{}'".format(key))
+
+        self._current()
+
+        # record the warnings given by this thread's query
+        with _WarningCapture() as messages:
+            query = QueryATNF(shared=True, loadfromdb=self.loadfromdb,
+                              cache=self.cache, **kwargs)
+            table = query.pandas
+
+        return table, query.get_version, messages
+
+    def _query_json(self, **kwargs):
+        """
+        Perform a query and return the output as a dictionary of columns that
+        can be converted to JSON.
+        """
+
+        table, version, messages = self.query_table(**kwargs)
+
+        output = {'columns': [], 'kinds': {}, 'data': {}, 'version': version,
+                  'warnings': messages}
+
+        for col in table.columns:
+            values = table[col].values
+            if values.dtype.kind == 'f':
+                kind = 'float'
+                data = [None if v != v else v for v in values.tolist()]
+            elif values.dtype.kind in 'iu':
+                kind = 'int'
+                data = values.tolist()
+            elif values.dtype.kind == 'b':
+                kind = 'bool'
+                data = values.tolist()
+            else:
+                kind = 'string'
+                data = [v if isinstance(v, string_types) else
+                        (None if v is None or v != v else str(v)) for v in values]
+
+            output['columns'].append(str(col))
+            output['kinds'][str(col)] = kind
+            output['data'][str(col)] = data
+
+        return output
+
+    def _count(self, path):
+        path = urlsplit(path).path
+        with self._count_lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+        return path
+
+    def serve_forever(self):
+        """
+        Handle requests until :meth:`~psrqpy.serve.CatalogueServer.shutdown`
+        is called.
+        """
+
+        self._httpd.serve_forever()
+
+    def start(self):
+        """
+        Handle requests in a background thread.
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.serve_forever,
+                                            name='psrqpy-serve')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def shutdown(self):
+        """
+        Stop handling requests.
+        """
+
+        self._httpd.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop handling requests (if in a background thread) and close the
+        server, removing its files.
+        """
+
+        if self._thread is not None:
+            self.shutdown()
+
+        self._httpd.server_close()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+        if self._unix_socket is not None and os.path.exists(self._unix_socket):
+            os.remove(self._unix_socket)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# the warning messages recorded for queries in each thread
+_CAPTURED = threading.local()
+_SHOWWARNING_LOCK = threading.Lock()
+
+
+def _showwarning(message, category, filename, lineno, file=None, line=None):
+    """
+    A :func:`warnings.showwarning` replacement that records user warnings
+    given in a thread that is capturing warnings (see
+    :class:`~psrqpy.serve._WarningCapture`), and passes on all others.
+    """
+
+    messages = getattr(_CAPTURED, 'messages', None)
+
+    if messages is not None:
+        # only user warnings (e.g., for unrecognised parameters) are recorded
+        if issubclass(category, UserWarning):
+            messages.append(str(message))
+        return
+
+    _showwarning.previous(message, category, filename, lineno, file=file, line=line)
+
+
+class _WarningCapture(object):
+    """
+    A context manager that records the user warning messages given in the
+    current thread, without changing how warnings are handled in other
+    threads (unlike :class:`warnings.catch_warnings`). While any thread is
+    capturing warnings psrqpy's warnings are always given (rather than once
+    for each place they are given), so that they are recorded every time.
+    """
+
+    # the number of threads capturing warnings, and the filter added for them
+    _count = 0
+    _filter = None
+
+    def __enter__(self):
+        with _SHOWWARNING_LOCK:
+            # (re)install the hook if it has been replaced
+            if warnings.showwarning is not _showwarning:
+                _showwarning.previous = warnings.showwarning
+                warnings.showwarning = _showwarning
+
+            if _WarningCapture._count == 0:
+                warnings.filterwarnings('always', category=UserWarning, module='psrqpy')
+                _WarningCapture._filter = warnings.filters[0]
+            _WarningCapture._count += 1
+
+        _CAPTURED.messages = []
+        return _CAPTURED.messages
+
+    def __exit__(self, *args):
+        _CAPTURED.messages = None
+
+        with _SHOWWARNING_LOCK:
+            _WarningCapture._count -= 1
+            if _WarningCapture._count == 0:
+                # remove the filter (unless the filters have been replaced)
+                for i, item in enumerate(warnings.filters):
+                    if item is _WarningCapture._filter:
+                        del warnings.filters[i]
+                        if hasattr(warnings, '_filters_mutated'):
+                            warnings._filters_mutated()
+                        break
+                _WarningCapture._filter = None
+
+
+class _UnixHTTPConnection(http_client.HTTPConnection):
+    """
+    An HTTP connection over a Unix socket.
+    """
+
+    def __init__(self, path, timeout=None):
+        http_client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _request(address, method, path, kwargs=None, fp=None, timeout=60.):
+    """
+    Make a request to a server, returning the response headers and content
+    (or writing the content to `fp`).
+
+    Args:
+        address (str): the server address, e.g., ``'http://127.0.0.1:8765'``,
+            ``'127.0.0.1:8765'`` or ``'unix:/path/to/socket'``.
+        method (str): the HTTP method.
+        path (str): the path of the request.
+        kwargs (dict): an object to send as JSON. Defaults to None.
+        fp (file): a file to write the content to. Defaults to None.
+        timeout (float): the connection timeout in seconds.
+    """
+
+    if not isinstance(address, string_types):
+        raise TypeError("Server address must be a string")
+
+    if address.startswith('unix:'):
+        socketpath = address[len('unix:'):]
+        if socketpath.startswith('//'):
+            socketpath = socketpath[2:]
+        connection = _UnixHTTPConnection(socketpath, timeout=timeout)
+    else:
+        parts = urlsplit(address if '://' in address else 'http://' + address)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise ValueError("Invalid server address '{}'".format(address))
+        connection = http_client.HTTPConnection(parts.hostname, parts.port or DEFAULT_PORT,
+                                                timeout=timeout)
+
+    try:
+        body, headers = None, {}
+        if kwargs is not None:
+            body = json.dumps(kwargs).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+
+        if response.status != 200:
+            content = response.read()
+            try:
+                message = json.loads(content.decode('utf-8'))['error']
+            except Exception:
+                message = content.decode('utf-8', 'replace')
+
+            if 400 <= response.status < 500:
+                raise ValueError("Server error: {}".format(message))
+            raise RuntimeError("Server error: {}".format(message))
+
+        if fp is not None:
+            shutil.copyfileobj(response, fp)
+            return response.getheaders(), None
+
+        return response.getheaders(), response.read()
+    except (socket.error, http_client.HTTPException) as e:
+        raise IOError("Problem connecting to server '{}': {}".format(address, str(e)))
+    finally:
+        connection.close()
+
+
+def server_info(address):
+    """
+    Get information on the catalogue of a server.
+
+    Args:
+        address (str): the server address, e.g., ``'http://127.0.0.1:8765'``
+            or ``'unix:/path/to/socket'``.
+
+    Returns:
+        dict: the catalogue ``version``, the ``token`` identifying the
+        catalogue contents, and the number of rows (``nrows``) and columns
+        (``ncols``).
+    """
+
+    return json.loads(_request(address, 'GET', '/info')[1].decode('utf-8'))
+
+
+def query_server(address, **kwargs):
+    """
+    Perform a query using a server, returning just the query table. Any
+    warnings produced by the query are also given.
+
+    Args:
+        address (str): the server address, e.g., ``'http://127.0.0.1:8765'``
+            or ``'unix:/path/to/socket'``.
+        kwargs: :class:`~psrqpy.search.QueryATNF` keyword arguments (see
+            :data:`QUERY_ARGS`).
+
+    Returns:
+        :class:`pandas.DataFrame`: the query table.
+
+    Example:
+        >>> table = query_server('http://127.0.0.1:8765', params=['JNAME', 'F0'],
+        ...                      condition='F0 > 100')
+    """
+
+    from pandas import DataFrame
+
+    output = json.loads(_request(address, 'POST', '/query', kwargs=kwargs)[1].decode('utf-8'))
+
+    for message in output['warnings']:
+        warnings.warn(message, UserWarning)
+
+    columns = OrderedDict()
+    for col in output['columns']:
+        data = output['data'][col]
+        kind = output['kinds'][col]
+
+        if kind == 'float':
+            columns[col] = np.array([np.nan if v is None else v for v in data],
+                                    dtype=np.float64)
+        elif kind == 'int':
+            columns[col] = np.array(data, dtype=np.int64)
+        elif kind == 'bool':
+            columns[col] = np.array(data, dtype=np.bool_)
+        else:
+            columns[col] = np.empty(len(data), dtype=object)
+            columns[col][:] = [np.nan if v is None else v for v in data]
+
+    table = DataFrame(columns, columns=output['columns'])
+    table.version = output['version']
+
+    return table
+
+
+def get_server_catalogue(address):
+    """
+    Get the catalogue prepared by a server. The catalogue is stored in the
+    psrqpy cache directory (see :func:`~psrqpy.utils.cache_dir`) and memory
+    mapped, so it is only transferred from the server when it has changed.
+
+    Args:
+        address (str): the server address, e.g., ``'http://127.0.0.1:8765'``
+            or ``'unix:/path/to/socket'``.
+
+    Returns:
+        :class:`pandas.DataFrame`: the catalogue.
+    """
+
+    import glob
+    from .search import _read_columns
+    from .utils import cache_dir
+
+    key = hashlib.sha1(address.encode('utf-8')).hexdigest()[:16]
+    prefix = os.path.join(cache_dir(), 'server_{}_'.format(key))
+
+    fname = prefix + '{}.dat'.format(server_info(address)['token'])
+
+    if not os.path.isfile(fname):
+        # download to a temporary file, so other processes never read a
+        # partial file
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir(), prefix='server_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                headers = dict((k.lower(), v) for k, v in
+                               _request(address, 'GET', '/catalogue', fp=fp)[0])
+
+            # the catalogue may have been reloaded since getting the token
+            fname = prefix + '{}.dat'.format(headers['x-psrqpy-token'])
+            _replace(tmpname, fname)
+        except BaseException:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+
+        # remove any previous catalogues from the server
+        for oldfile in glob.glob(prefix + '*.dat'):
+            if oldfile != fname:
+                try:
+                    os.remove(oldfile)
+                except OSError:
+                    pass
+
+    dftable, _, version = _read_columns(fname)
+    dftable.version = version
+
+    return dftable
+
+
+def main(args=None):
+    """
+    Run a :class:`~psrqpy.serve.CatalogueServer` from the command line.
+
+    Args:
+        args (list): the command line arguments. Defaults to None, in which
+            case :data:`sys.argv` is used.
+    """
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='python -m psrqpy.serve',
+        description='Serve queries of a pulsar catalogue kept in memory.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='the address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help='the port to listen on (default: %(default)s)')
+    parser.add_argument('--socket', default=None,
+                        help='the path of a Unix socket to listen on instead of a port')
+    parser.add_argument('--loadfromdb', default=None,
+                        help='a catalogue database file (default: the ATNF Pulsar Catalogue)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='do not cache the downloaded catalogue')
+    parser.add_argument('--checkupdate', action='store_true',
+                        help='check for an update to the catalogue')
+    parser.add_argument('--verbose', action='store_true', help='log each request')
+
+    opts = parser.parse_args(args)
+
+    server = CatalogueServer(host=opts.host, port=opts.port, unix_socket=opts.socket,
+                             loadfromdb=opts.loadfromdb, cache=opts.cache,
+                             checkupdate=opts.checkupdate, verbose=opts.verbose)
+
+    print('Serving the catalogue at {}'.format(server.address))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
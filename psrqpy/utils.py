@@ -4,24 +4,22 @@ A selection of useful functions used by the module.
 
 from __future__ import print_function, division
 
+import atexit
 import warnings
 import re
 import os
+import sys
+import time
+import threading
 import numpy as np
-import requests
 import tarfile
-from bs4 import BeautifulSoup
+from six.moves.html_parser import HTMLParser
 
+import six
 from six import string_types
 
 from collections import OrderedDict
 
-from astropy.table import Table
-from astropy.coordinates import SkyCoord, Angle
-import astropy.units as aunits
-from astropy.utils.data import download_file, clear_download_cache
-from pandas import DataFrame
-
 from .config import (ATNF_BASE_URL, ADS_URL, ATNF_TARBALL,
                      PSR_ALL, PSR_ALL_PARS, GLITCH_URL)
 
@@ -29,8 +27,625 @@ from .config import (ATNF_BASE_URL, ADS_URL, ATNF_TARBALL,
 # problematic references that are hard to parse
 PROB_REFS = ['bwck08', 'crf+18']
 
+# files extracted from the ATNF Pulsar Catalogue tarball
+BUNDLE_MEMBERS = ['psrcat_tar/psrcat.db', 'psrcat_tar/psrcat_ref']
+
+# extracted tarball files (keyed on the tarball path, modification time and
+# size)
+_BUNDLES = {}
+_BUNDLE_LOCK = threading.Lock()
+
+# the time (seconds) after which unused extracted tarballs are removed
+_BUNDLE_EXPIRY = 86400
+
+# requests sessions shared by all downloads in each thread (see get_session())
+_SESSIONS = threading.local()
+
+# the size (bytes) of the chunks in which files are downloaded
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# timers for load statistics
+_wall_time = getattr(time, 'perf_counter', time.time)
+_cpu_time = getattr(time, 'process_time', getattr(time, 'clock', time.time))
+
+
+def cache_dir():
+    """
+    Return the directory in which psrqpy caches files (e.g., files extracted
+    from the ATNF Pulsar Catalogue tarball). This is a ``psrqpy`` directory
+    within the astropy cache directory, unless the ``PSRQPY_CACHE_DIR``
+    environment variable is set. The directory is created if it does not
+    exist.
+
+    Returns:
+        str: the cache directory path.
+    """
+
+    path = os.environ.get('PSRQPY_CACHE_DIR', None)
+
+    if path is None:
+        from astropy.config.paths import get_cache_dir
+        path = os.path.join(get_cache_dir(), 'psrqpy')
+
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise IOError('Could not create cache directory')
+
+    return path
+
+
+def get_session():
+    """
+    Return a :class:`requests.Session` that is shared by all of psrqpy's
+    downloads in the current thread, so that connections to the same server
+    are reused. Each thread has its own session, as sessions are not
+    thread safe.
+
+    Returns:
+        :class:`requests.Session`: the current thread's session.
+    """
+
+    session = getattr(_SESSIONS, 'session', None)
+
+    if session is None:
+        import requests
+        session = requests.Session()
+        _SESSIONS.session = session
+
+    return session
+
+
+def download_file(remote_url, cache=False, stats=None):
+    """
+    Download a file, or get it from the astropy cache. Files are downloaded
+    in chunks using the current thread's session from
+    :func:`~psrqpy.utils.get_session`, with the progress passed to any hooks
+    of `stats` (see :meth:`~psrqpy.utils.LoadStats.progress`), and are then
+    added to the astropy cache if requested. For versions of astropy that
+    cannot add files to the cache :func:`astropy.utils.data.download_file`
+    is used instead.
+
+    Args:
+        remote_url (str): the URL of the file to download.
+        cache (bool): whether to use, or add the file to, the astropy cache.
+            Defaults to False.
+        stats (:class:`~psrqpy.utils.LoadStats`): an object to report the
+            download progress to, which can also be used to cancel the
+            download. Defaults to None.
+
+    Returns:
+        str: the local path to the file.
+    """
+
+    import tempfile
+    from astropy.utils.data import download_file as astropy_download_file
+    from astropy.utils.data import is_url_in_cache, conf
+
+    try:
+        from astropy.utils.data import import_file_to_cache
+    except ImportError:
+        return astropy_download_file(remote_url, cache=cache)
+
+    if cache and is_url_in_cache(remote_url):
+        return astropy_download_file(remote_url, cache=True)
+
+    if stats is None:
+        stats = LoadStats(enabled=False)
+
+    # HTTP errors are raised as requests.HTTPError, which is an IOError
+    response = get_session().get(remote_url, stream=True,
+                                 timeout=conf.remote_timeout)
+
+    try:
+        response.raise_for_status()
+
+        try:
+            total = int(response.headers['Content-Length'])
+        except (KeyError, ValueError):
+            total = None
+
+        fd, tmpfile = tempfile.mkstemp(prefix='psrqpy-')
+        try:
+            nbytes = 0
+            with os.fdopen(fd, 'wb') as fp:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    fp.write(chunk)
+                    nbytes += len(chunk)
+                    stats.progress(bytes=nbytes, total=total)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+    finally:
+        response.close()
+
+    if cache:
+        return import_file_to_cache(remote_url, tmpfile, remove_original=True)
+
+    return tmpfile
+
+
+def _memory_usage():
+    """
+    Return the resident memory (in bytes) of the current process, or None if
+    it cannot be found.
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as fp:
+            return int(fp.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # this is the peak memory usage (in kilobytes on Linux, bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss*1024
+
+
+class _NullStage(object):
+    """
+    A context manager that does nothing, used when statistics are disabled.
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """
+    A context manager timing a single stage for a
+    :class:`~psrqpy.utils.LoadStats` object.
+    """
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        stats = self.stats
+        stats._stack.append(self.name)
+        self.path = '/'.join(stats._stack)
+
+        # create the record on entry so that stages are listed in order
+        self.record = stats.records.setdefault(self.path, {'wall': 0., 'cpu': 0.,
+                                                           'memory': 0., 'calls': 0})
+
+        stats._call_hooks('start', self.path, None)
+
+        self.memory = _memory_usage()
+        self.cpu = _cpu_time()
+        self.wall = _wall_time()
+
+        return self
+
+    def __exit__(self, *args):
+        wall = _wall_time() - self.wall
+        cpu = _cpu_time() - self.cpu
+        memory = _memory_usage()
+        if memory is not None and self.memory is not None:
+            memory -= self.memory
+        else:
+            memory = np.nan
+
+        stats = self.stats
+        stats._stack.pop()
+
+        record = self.record
+        record['wall'] += wall
+        record['cpu'] += cpu
+        record['memory'] += memory
+        record['calls'] += 1
+
+        stats._call_hooks('end', self.path, {'wall': wall, 'cpu': cpu,
+                                             'memory': memory})
+
+        return False
+
+
+class LoadStats(object):
+    """
+    Per-stage statistics on the time taken to load (and process) a catalogue,
+    e.g., downloading, parsing and calculating the derived parameters. For
+    each stage the wall-clock time (seconds), CPU time (seconds), change in
+    the process's resident memory (bytes), and number of calls are recorded.
+    Stages can be nested, in which case they are named with their parent
+    stages, e.g., ``'set_derived/derived_age'``.
+
+    Hooks can be used to pass the stages to, e.g., logging or tracing
+    systems, or progress bars. A hook is a function taking the event
+    (``'start'``, ``'progress'`` or ``'end'``), the stage name, and a
+    dictionary that is None for ``'start'`` events, contains the progress
+    within the stage (e.g., the number of ``bytes`` downloaded and the
+    ``total`` number) for ``'progress'`` events, and contains the wall time,
+    CPU time and memory change for that call of the stage for ``'end'``
+    events. Hooks added with :meth:`~psrqpy.utils.LoadStats.add_hook` are
+    used for all :class:`~psrqpy.utils.LoadStats` objects.
+
+    Loading can be stopped from another thread with
+    :meth:`~psrqpy.utils.LoadStats.cancel`, in which case a
+    :class:`RuntimeError` is raised at the start of the next stage (or
+    progress update).
+
+    If disabled, no statistics are recorded and stages have almost no
+    overhead. Objects are enabled if they are created with ``enabled=True``,
+    or if there are any hooks.
+
+    Args:
+        enabled (bool): record statistics. Defaults to True.
+        hooks (list): a list of hook functions for this object only.
+
+    Example:
+        Log each stage when loading the catalogue
+
+        >>> import logging
+        >>> def loghook(event, name, record):
+        ...     if event == 'end':
+        ...         logging.info('%s took %.3f s', name, record['wall'])
+        >>> query = QueryATNF(stats=LoadStats(hooks=[loghook]))
+        >>> print(query.load_stats)
+    """
+
+    #: hooks used for all objects
+    hooks = []
+
+    def __init__(self, enabled=True, hooks=None):
+        self._hooks = list(hooks) if hooks is not None else []
+        self._enabled = enabled
+        self._cancelled = False
+        self._stack = []
+        self.records = OrderedDict()
+
+    @classmethod
+    def add_hook(cls, hook):
+        """
+        Add a hook for all :class:`~psrqpy.utils.LoadStats` objects.
+
+        Args:
+            hook (callable): the hook function.
+        """
+
+        if not callable(hook):
+            raise TypeError("Hook must be callable")
+
+        cls.hooks.append(hook)
+
+    @classmethod
+    def remove_hook(cls, hook):
+        """
+        Remove a hook added with :meth:`~psrqpy.utils.LoadStats.add_hook`.
+
+        Args:
+            hook (callable): the hook function.
+        """
+
+        try:
+            cls.hooks.remove(hook)
+        except ValueError:
+            raise ValueError("Hook has not been added")
+
+    @property
+    def enabled(self):
+        """
+        Return whether statistics are being recorded.
+        """
+
+        return bool(self._enabled or self._hooks or LoadStats.hooks)
+
+    def stage(self, name):
+        """
+        Return a context manager that records the statistics for a stage.
+
+        Args:
+            name (str): the stage name.
+
+        Example:
+            >>> stats = LoadStats()
+            >>> with stats.stage('parse'):
+            ...     parse_file()
+        """
+
+        self.check_cancelled()
+
+        if not self.enabled:
+            return _NULL_STAGE
+
+        return _Stage(self, name)
+
+    def progress(self, **info):
+        """
+        Report progress within the current stage to the hooks as a
+        ``'progress'`` event, e.g., the number of bytes downloaded. This also
+        checks whether loading has been cancelled.
+
+        Args:
+            info: keyword arguments giving the progress.
+        """
+
+        self.check_cancelled()
+
+        if self._hooks or LoadStats.hooks:
+            self._call_hooks('progress', '/'.join(self._stack), info)
+
+    def cancel(self):
+        """
+        Cancel the loading that is being recorded. A :class:`RuntimeError`
+        will be raised at the start of the next stage.
+        """
+
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        """
+        Return whether loading has been cancelled.
+        """
 
-def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False):
+        # objects pickled by older versions do not have the attribute
+        return getattr(self, '_cancelled', False)
+
+    def check_cancelled(self):
+        """
+        Raise a :class:`RuntimeError` if loading has been cancelled.
+        """
+
+        if self.cancelled:
+            raise RuntimeError("Loading the catalogue has been cancelled")
+
+    def _call_hooks(self, event, name, record):
+        for hook in self._hooks + LoadStats.hooks:
+            try:
+                hook(event, name, record)
+            except Exception as e:
+                warnings.warn("Error in LoadStats hook: {}".format(str(e)),
+                              UserWarning)
+
+    def __getitem__(self, name):
+        return self.records[name]
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def wall(self):
+        """
+        Return the total wall-clock time (seconds) of all the top-level
+        stages.
+        """
+
+        return sum(r['wall'] for n, r in self.records.items() if '/' not in n)
+
+    @property
+    def cpu(self):
+        """
+        Return the total CPU time (seconds) of all the top-level stages.
+        """
+
+        return sum(r['cpu'] for n, r in self.records.items() if '/' not in n)
+
+    def as_dataframe(self):
+        """
+        Return the statistics as a :class:`pandas.DataFrame` indexed on the
+        stage names.
+        """
+
+        from pandas import DataFrame
+
+        return DataFrame(list(self.records.values()),
+                         index=list(self.records.keys()),
+                         columns=['wall', 'cpu', 'memory', 'calls'])
+
+    def reset(self):
+        """
+        Remove all recorded statistics.
+        """
+
+        self.records.clear()
+
+    def __str__(self):
+        if len(self.records) == 0:
+            return 'No load statistics recorded'
+
+        lines = ['{:<40s} {:>10s} {:>10s} {:>12s} {:>6s}'.format('stage', 'wall (s)',
+                                                                 'cpu (s)', 'memory (MB)',
+                                                                 'calls')]
+        for name, record in self.records.items():
+            depth = name.count('/')
+            label = '  '*depth + name.split('/')[-1]
+            lines.append('{:<40s} {:>10.4f} {:>10.4f} {:>12.2f} {:>6d}'.format(
+                label, record['wall'], record['cpu'], record['memory']/1024.**2,
+                record['calls']))
+
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return str(self)
+
+    def __getstate__(self):
+        # hooks are not pickled
+        state = self.__dict__.copy()
+        state['_hooks'] = []
+        state['_stack'] = []
+        return state
+
+
+def extract_bundle(tarball, cache=True):
+    """
+    Extract the database and reference files from an ATNF Pulsar Catalogue
+    tarball. The tarball is only decompressed once, in a single pass, and
+    the uncompressed files are kept in the psrqpy cache directory (see
+    :func:`~psrqpy.utils.cache_dir`), so they are not extracted again unless
+    the tarball changes.
+
+    Args:
+        tarball (str): the path to the tarball.
+        cache (bool): if True keep the extracted files in the cache directory,
+            otherwise extract them to a temporary directory. Defaults to True.
+
+    Returns:
+        dict: a dictionary of extracted file paths keyed on the file names
+        (``psrcat.db`` and ``psrcat_ref``).
+    """
+
+    import hashlib
+    import shutil
+    import tempfile
+
+    try:
+        stat = os.stat(tarball)
+    except OSError:
+        raise IOError('Problem accessing ATNF catalogue tarball')
+
+    key = (os.path.realpath(tarball), stat.st_mtime, stat.st_size)
+
+    with _BUNDLE_LOCK:
+        paths = _BUNDLES.get(key, {})
+        if len(paths) > 0 and all([os.path.isfile(p) for p in paths.values()]):
+            return paths
+
+        if cache:
+            bundlesdir = os.path.join(cache_dir(), 'bundles')
+            digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            bundledir = os.path.join(bundlesdir, digest)
+            if not os.path.isdir(bundlesdir):
+                os.makedirs(bundlesdir)
+        else:
+            # use a temporary directory that is removed on exit
+            bundlesdir = None
+            bundledir = None
+
+        names = [os.path.basename(member) for member in BUNDLE_MEMBERS]
+
+        if not cache or not all([os.path.isfile(os.path.join(bundledir, name))
+                                 for name in names]):
+            # extract to a temporary directory that is then moved into place
+            tmpdir = tempfile.mkdtemp(prefix='tmp', dir=bundlesdir)
+
+            try:
+                with tarfile.open(tarball, mode='r:gz') as pulsargz:
+                    for member in pulsargz:
+                        if member.name in BUNDLE_MEMBERS:
+                            fileobj = pulsargz.extractfile(member)
+                            name = os.path.join(tmpdir, os.path.basename(member.name))
+                            with open(name, 'wb') as fp:
+                                shutil.copyfileobj(fileobj, fp)
+            except (IOError, tarfile.TarError):
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise IOError('Problem extracting the database file')
+
+            extracted = os.listdir(tmpdir)
+            if not all([name in extracted for name in names]):
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise IOError('Problem extracting the database file')
+
+            if cache:
+                _move_bundle(tmpdir, bundledir, names)
+            else:
+                bundledir = tmpdir
+                atexit.register(shutil.rmtree, tmpdir, True)
+
+        if cache:
+            # mark the files as in use, and remove any unused extracted files
+            # of other versions of the tarball
+            try:
+                os.utime(bundledir, None)
+            except OSError:
+                pass
+            _remove_stale_bundles(bundlesdir, digest)
+
+        paths = {name: os.path.join(bundledir, name) for name in names}
+        _BUNDLES[key] = paths
+
+    return paths
+
+
+def _move_bundle(tmpdir, bundledir, names):
+    """
+    Move a directory of extracted tarball files into place. If another
+    process has already moved its own extracted files there, those are used
+    instead.
+
+    Args:
+        tmpdir (str): the directory of extracted files.
+        bundledir (str): the final directory for the files.
+        names (list): the names of the extracted files.
+    """
+
+    import shutil
+
+    for _ in range(2):
+        try:
+            os.rename(tmpdir, bundledir)
+            return
+        except OSError:
+            if all([os.path.isfile(os.path.join(bundledir, name)) for name in names]):
+                # another process won the race, so use its files
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                return
+
+            # remove an incomplete directory and try again
+            shutil.rmtree(bundledir, ignore_errors=True)
+
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    raise IOError('Problem extracting the database file')
+
+
+def _remove_stale_bundles(bundlesdir, current):
+    """
+    Remove directories of extracted tarball files, other than the current
+    one, that have not been used for :data:`_BUNDLE_EXPIRY` seconds.
+    Temporary directories in which other processes are extracting files are
+    left alone.
+
+    Args:
+        bundlesdir (str): the directory containing the extracted files.
+        current (str): the name of the current directory of extracted files.
+    """
+
+    import shutil
+
+    now = time.time()
+
+    try:
+        names = os.listdir(bundlesdir)
+    except OSError:
+        return
+
+    for name in names:
+        # only remove directories named by a tarball digest
+        if name == current or re.match(r'^[0-9a-f]{40}$', name) is None:
+            continue
+
+        olddir = os.path.join(bundlesdir, name)
+        try:
+            if now - os.path.getmtime(olddir) < _BUNDLE_EXPIRY:
+                continue
+        except OSError:
+            continue
+
+        shutil.rmtree(olddir, ignore_errors=True)
+
+
+def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False,
+                  stats=None):
     """
     This function will attempt to download and cache the entire ATNF Pulsar
     Catalogue database `tarball
@@ -55,6 +670,9 @@ def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False):
         pandas (bool): if True the catalogue will be returned as a
             :class:`pandas.DataFrame` rather than the default of an
             :class:`~astropy.table.Table`.
+        stats (:class:`~psrqpy.utils.LoadStats`): an object in which to
+            record the time taken by each stage of getting the catalogue.
+            Defaults to None.
 
     Returns:
         :class:`~astropy.table.Table` or :class:`~pandas.DataFrame`: a table
@@ -62,24 +680,34 @@ def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False):
 
     """
 
+    from astropy.coordinates import SkyCoord, Angle
+    import astropy.units as aunits
+    from pandas import DataFrame
+
+    if stats is None:
+        stats = LoadStats(enabled=False)
+
     if path_to_db is None:
         # remove any cached file if requested
         if update:
-            if check_update():
-                clear_download_cache(ATNF_TARBALL)
+            with stats.stage('check_update'):
+                if check_update():
+                    from astropy.utils.data import clear_download_cache
+                    clear_download_cache(ATNF_TARBALL)
 
         # get the tarball
         try:
-            dbtarfile = download_file(ATNF_TARBALL, cache=cache)
+            with stats.stage('download'):
+                dbtarfile = download_file(ATNF_TARBALL, cache=cache, stats=stats)
         except IOError:
             raise IOError('Problem accessing ATNF catalogue tarball')
 
-        try:
-            # open tarball
-            pulsargz = tarfile.open(dbtarfile, mode='r:gz')
+        # extract (or get previously extracted) database file
+        with stats.stage('extract'):
+            bundle = extract_bundle(dbtarfile, cache=cache)
 
-            # extract the database file
-            dbfile = pulsargz.extractfile('psrcat_tar/psrcat.db')
+        try:
+            dbfile = open(bundle['psrcat.db'], 'rb')
         except IOError:
             raise IOError('Problem extracting the database file')
     else:
@@ -96,122 +724,123 @@ def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False):
 
     version = None  # catalogue version
 
-    # loop through lines in dbfile
-    for line in dbfile.readlines():
-        if isinstance(line, string_types):
-            dataline = line.split()
-        else:
-            dataline = line.decode().split()   # Splits on whitespace
+    with stats.stage('parse'):
+        # loop through lines in dbfile
+        for line in dbfile.readlines():
+            if isinstance(line, string_types):
+                dataline = line.split()
+            else:
+                dataline = line.decode().split()   # Splits on whitespace
 
-        if dataline[0][0] == commentstring:
-            # get catalogue version (should be in first comment string)
-            if dataline[0] == '#CATALOGUE' and len(dataline) == 2:
-                version = dataline[1]
-            continue
+            if dataline[0][0] == commentstring:
+                # get catalogue version (should be in first comment string)
+                if dataline[0] == '#CATALOGUE' and len(dataline) == 2:
+                    version = dataline[1]
+                continue
 
-        if dataline[0][0] == breakstring:
-            # First break comes at the end of the first object and so forth
-            psrlist.append({})  # New object!
-            continue
+            if dataline[0][0] == breakstring:
+                # First break comes at the end of the first object and so forth
+                psrlist.append({})  # New object!
+                continue
 
-        try:
-            psrlist[-1][dataline[0]] = float(dataline[1])
-        except ValueError:
-            psrlist[-1][dataline[0]] = dataline[1]
-
-        if len(dataline) > 2:
-            # check whether 3rd value is a float (so its an error value) or not
             try:
-                float(dataline[2])
-                isfloat = True
+                psrlist[-1][dataline[0]] = float(dataline[1])
             except ValueError:
-                isfloat = False
-
-            if isfloat:
-                # error values are last digit errors, so convert to actual
-                # errors by finding the number of decimal places after the
-                # '.' in the value string
-                val = dataline[1].split(':')[-1]  # account for RA and DEC strings
+                psrlist[-1][dataline[0]] = dataline[1]
 
+            if len(dataline) > 2:
+                # check whether 3rd value is a float (so its an error value) or not
                 try:
-                    float(val)
+                    float(dataline[2])
+                    isfloat = True
                 except ValueError:
-                    raise ValueError("Value with error is not convertable to a float")
-
-                if dataline[2][0] == '-' or '.' in dataline[2]:
-                    # negative errors or those with decimal points are absolute values
-                    scalefac = 1.
+                    isfloat = False
+
+                if isfloat:
+                    # error values are last digit errors, so convert to actual
+                    # errors by finding the number of decimal places after the
+                    # '.' in the value string
+                    val = dataline[1].split(':')[-1]  # account for RA and DEC strings
+
+                    try:
+                        float(val)
+                    except ValueError:
+                        raise ValueError("Value with error is not convertable to a float")
+
+                    if dataline[2][0] == '-' or '.' in dataline[2]:
+                        # negative errors or those with decimal points are absolute values
+                        scalefac = 1.
+                    else:
+                        # split on exponent
+                        valsplit = re.split('e|E|d|D', val)
+                        scalefac = 1.
+                        if len(valsplit) == 2:
+                            scalefac = 10**(-int(valsplit[1]))
+
+                        dpidx = valsplit[0].find('.')  # find position of decimal point
+                        if dpidx != -1:  # a point is found
+                            scalefac *= 10**(len(valsplit[0])-dpidx-1)
+
+                    # add error column if required
+                    psrlist[-1][dataline[0]+'_ERR'] = float(dataline[2])/scalefac  # error entry
                 else:
-                    # split on exponent
-                    valsplit = re.split('e|E|d|D', val)
-                    scalefac = 1.
-                    if len(valsplit) == 2:
-                        scalefac = 10**(-int(valsplit[1]))
-
-                    dpidx = valsplit[0].find('.')  # find position of decimal point
-                    if dpidx != -1:  # a point is found
-                        scalefac *= 10**(len(valsplit[0])-dpidx-1)
-
-                # add error column if required
-                psrlist[-1][dataline[0]+'_ERR'] = float(dataline[2])/scalefac  # error entry
-            else:
-                # add reference column if required
-                psrlist[-1][dataline[0]+'_REF'] = dataline[2]  # reference entry
-
-            if len(dataline) > 3:
-                # last entry must(!) be a reference
-                psrlist[-1][dataline[0]+'_REF'] = dataline[3]  # reference entry
+                    # add reference column if required
+                    psrlist[-1][dataline[0]+'_REF'] = dataline[2]  # reference entry
 
-    dbfile.close()   # close tar file
-    if not path_to_db:
-        pulsargz.close()
+                if len(dataline) > 3:
+                    # last entry must(!) be a reference
+                    psrlist[-1][dataline[0]+'_REF'] = dataline[3]  # reference entry
 
-    del psrlist[-1]  # Final breakstring comes at the end of the file
+        dbfile.close()   # close database file
 
-    # add RA and DEC in degs and JNAME/BNAME
-    for i, psr in enumerate(list(psrlist)):
-        if 'RAJ' in psr.keys() and 'DECJ' in psr.keys():
-            # check if the string can be converted to a float (there are a few
-            # cases where the position is just a decimal value)
-            try:
-                rad = float(psr['RAJ'])
-                ras = Angle(rad*aunits.hourangle)
-                psr['RAJ'] = ras.to_string(sep=':', pad=True)
-            except ValueError:
-                pass
+        del psrlist[-1]  # Final breakstring comes at the end of the file
 
-            try:
-                decd = float(psr['DECJ'])
-                decs = Angle(decd*aunits.deg)
-                psr['DECJ'] = decs.to_string(sep=':', pad=True, alwayssign=True)
-            except ValueError:
-                pass
+    with stats.stage('coordinates'):
+        # add RA and DEC in degs and JNAME/BNAME
+        for i, psr in enumerate(list(psrlist)):
+            if 'RAJ' in psr.keys() and 'DECJ' in psr.keys():
+                # check if the string can be converted to a float (there are a few
+                # cases where the position is just a decimal value)
+                try:
+                    rad = float(psr['RAJ'])
+                    ras = Angle(rad*aunits.hourangle)
+                    psr['RAJ'] = ras.to_string(sep=':', pad=True)
+                except ValueError:
+                    pass
 
-            coord = SkyCoord(psr['RAJ'], psr['DECJ'],
-                             unit=(aunits.hourangle, aunits.deg))
-            psrlist[i]['RAJD'] = coord.ra.deg    # right ascension in degrees
-            psrlist[i]['DECJD'] = coord.dec.deg  # declination in degrees
-
-        # add 'JNAME', 'BNAME' and 'NAME'
-        if 'PSRJ' in psr.keys():
-            psrlist[i]['JNAME'] = psr['PSRJ']
-            psrlist[i]['NAME'] = psr['PSRJ']
-            if 'PSRJ_REF' in psr.keys():
-                psrlist[i]['JNAME_REF'] = psr['PSRJ_REF']
-                psrlist[i]['NAME_REF'] = psr['PSRJ_REF']
-
-        if 'PSRB' in psr.keys():
-            psrlist[i]['BNAME'] = psr['PSRB']
-            if 'PSRB_REF' in psr.keys():
-                psrlist[i]['BNAME_REF'] = psr['PSRB_REF']
-
-            if 'NAME' not in psrlist[i].keys():
-                psrlist[i]['NAME'] = psr['PSRB']
+                try:
+                    decd = float(psr['DECJ'])
+                    decs = Angle(decd*aunits.deg)
+                    psr['DECJ'] = decs.to_string(sep=':', pad=True, alwayssign=True)
+                except ValueError:
+                    pass
+
+                coord = SkyCoord(psr['RAJ'], psr['DECJ'],
+                                 unit=(aunits.hourangle, aunits.deg))
+                psrlist[i]['RAJD'] = coord.ra.deg    # right ascension in degrees
+                psrlist[i]['DECJD'] = coord.dec.deg  # declination in degrees
+
+            # add 'JNAME', 'BNAME' and 'NAME'
+            if 'PSRJ' in psr.keys():
+                psrlist[i]['JNAME'] = psr['PSRJ']
+                psrlist[i]['NAME'] = psr['PSRJ']
+                if 'PSRJ_REF' in psr.keys():
+                    psrlist[i]['JNAME_REF'] = psr['PSRJ_REF']
+                    psrlist[i]['NAME_REF'] = psr['PSRJ_REF']
+
+            if 'PSRB' in psr.keys():
+                psrlist[i]['BNAME'] = psr['PSRB']
                 if 'PSRB_REF' in psr.keys():
-                    psrlist[i]['NAME_REF'] = psr['PSRB_REF']
+                    psrlist[i]['BNAME_REF'] = psr['PSRB_REF']
 
-    # convert to a pandas DataFrame - this will fill in empty spaces
-    dftable = DataFrame(psrlist)
+                if 'NAME' not in psrlist[i].keys():
+                    psrlist[i]['NAME'] = psr['PSRB']
+                    if 'PSRB_REF' in psr.keys():
+                        psrlist[i]['NAME_REF'] = psr['PSRB_REF']
+
+    with stats.stage('dataframe'):
+        # convert to a pandas DataFrame - this will fill in empty spaces
+        dftable = DataFrame(psrlist)
 
     if pandas:
         # return pandas DataFrame
@@ -219,17 +848,20 @@ def get_catalogue(path_to_db=None, cache=True, update=False, pandas=False):
 
         return dftable
 
-    # convert into an astropy table
-    psrtable = Table.from_pandas(dftable)
+    from astropy.table import Table
+
+    with stats.stage('table'):
+        # convert into an astropy table
+        psrtable = Table.from_pandas(dftable)
 
-    # add units if known
-    for key in PSR_ALL_PARS:
-        if key in psrtable.colnames:
-            if PSR_ALL[key]['units']:
-                psrtable.columns[key].unit = PSR_ALL[key]['units']
+        # add units if known
+        for key in PSR_ALL_PARS:
+            if key in psrtable.colnames:
+                if PSR_ALL[key]['units']:
+                    psrtable.columns[key].unit = PSR_ALL[key]['units']
 
-                if PSR_ALL[key]['err'] and key+'_ERR' in psrtable.colnames:
-                    psrtable.columns[key+'_ERR'].unit = PSR_ALL[key]['units']
+                    if PSR_ALL[key]['err'] and key+'_ERR' in psrtable.colnames:
+                        psrtable.columns[key+'_ERR'].unit = PSR_ALL[key]['units']
 
     # add metadata
     if not path_to_db:
@@ -257,7 +889,7 @@ def check_update():
 
     """
 
-    from astropy.utils.data import download_file, get_cached_urls, compute_hash
+    from astropy.utils.data import get_cached_urls, compute_hash
 
     if ATNF_TARBALL not in get_cached_urls():
         # can update cache as file is not cached yet
@@ -272,6 +904,11 @@ def check_update():
     curhash = compute_hash(cachefile)
     tmphash = compute_hash(tmpcache)
 
+    try:
+        os.remove(tmpcache)
+    except OSError:
+        pass
+
     if curhash == tmphash:
         # no update needed
         return False
@@ -280,7 +917,123 @@ def check_update():
         return True
 
 
-def get_glitch_catalogue(psr=None):
+class _GlitchTableParser(HTMLParser):
+    """
+    A streaming parser for the rows of the first table in the Jodrell Bank
+    glitch catalogue web page. Each row is stored as a list of the text
+    within each cell and the first link (if any) in each cell.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.rows = []
+        self._intable = False
+        self._done = False
+        self._row = None
+        self._cell = None
+        self._href = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._done:
+            return
+
+        if tag == 'table':
+            self._intable = True
+        elif not self._intable:
+            return
+        elif tag == 'tr':
+            self._row = []
+        elif tag in ['td', 'th'] and self._row is not None:
+            self._cell = []
+            self._href = None
+        elif tag == 'a' and self._cell is not None and self._href is None:
+            self._href = dict(attrs).get('href', None)
+
+    def handle_endtag(self, tag):
+        if not self._intable or self._done:
+            return
+
+        if tag in ['td', 'th'] and self._cell is not None:
+            self._row.append((''.join(self._cell).strip(), self._href))
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+        elif tag == 'table':
+            # only the first table is required
+            self._done = True
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+GLITCH_COLUMNS = ['NAME', 'JNAME', 'Glitch number', 'MJD', 'MJD_ERR',
+                  'DeltaF/F', 'DeltaF/F_ERR', 'DeltaF1/F1', 'DeltaF1/F1_ERR',
+                  'Reference']
+
+
+def parse_glitch_table(content):
+    """
+    Parse the HTML of the Jodrell Bank glitch catalogue web page into a
+    dictionary of column arrays (see
+    :func:`~psrqpy.utils.get_glitch_catalogue` for the columns).
+
+    Args:
+        content (str, bytes): the HTML content of the web page.
+
+    Returns:
+        dict: an ordered dictionary of :class:`~numpy.ndarray` columns.
+    """
+
+    from pandas import to_numeric
+
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', 'replace')
+
+    parser = _GlitchTableParser()
+    parser.feed(content)
+    parser.close()
+
+    # rows with glitches have their first column as an index
+    rows = [row for row in parser.rows
+            if len(row) >= 11 and len(row[0][0]) > 0 and
+            row[3][0].strip().isdigit()]
+
+    # transpose to columns
+    cells = list(zip(*[[cell[0] for cell in row[:11]] for row in rows]))
+    if len(cells) == 0:
+        cells = [()] * 11
+
+    # make sure all J-names start with a "J"
+    jnames = np.array(cells[2], dtype=np.str_)
+    jnames = np.where(np.char.startswith(jnames, 'J'), jnames,
+                      np.char.add('J', jnames))
+
+    tabledict = OrderedDict()
+    tabledict['NAME'] = np.array(cells[1], dtype=np.str_)
+    tabledict['JNAME'] = jnames
+    tabledict['Glitch number'] = np.array(cells[3], dtype=int)
+
+    for j, pname in enumerate(GLITCH_COLUMNS[3:9]):
+        tabledict[pname] = to_numeric(np.array(cells[4+j], dtype=object),
+                                      errors='coerce').astype(float)
+
+    # get reference link if present
+    tabledict['Reference'] = np.array([row[10][1] if row[10][1] is not None
+                                       else row[10][0] for row in rows],
+                                      dtype=np.str_)
+
+    # correct scaling of parameters
+    tabledict['DeltaF/F'] *= 1e-9
+    tabledict['DeltaF/F_ERR'] *= 1e-9
+    tabledict['DeltaF1/F1'] *= 1e-3
+    tabledict['DeltaF1/F1_ERR'] *= 1e-3
+
+    return tabledict
+
+
+def get_glitch_catalogue(psr=None, cache=True, maxage=86400., url=None):
     """
     Return a :class:`~astropy.table.Table` containing the `Jodrell Bank pulsar
     glitch catalogue <http://www.jb.man.ac.uk/pulsar/glitches/gTable.html>`_.
@@ -301,9 +1054,23 @@ def get_glitch_catalogue(psr=None):
      * `DeltaF1/F1_ERR`: the uncertainty on the fractional frequency derivative change
      * `Reference`: the glitch publication reference
 
+    The parsed table is cached (in the psrqpy cache directory, see
+    :func:`~psrqpy.utils.cache_dir`) along with the ``ETag`` and
+    ``Last-Modified`` headers returned by the server. These are used to make
+    a conditional request, so the web page is only downloaded, and parsed,
+    again if it has changed. If the server cannot be reached the cached table
+    is used instead.
+
     Args:
         psr (str): if a pulsar name is given then only the glitches for that
             pulsar are returned, otherwise all glitches are returned.
+        cache (bool): use, and update, the cached glitch table. Defaults to
+            True.
+        maxage (float): the age (in seconds) for which the cached table is
+            used without checking the server for changes. Defaults to 86400
+            (one day). If 0 the server is checked on every call.
+        url (str): the URL of the glitch catalogue web page. Defaults to
+            None, in which case the Jodrell Bank URL is used.
 
     Returns:
         :class:`~astropy.table.Table`: a table containing the entire glitch
@@ -319,101 +1086,182 @@ def get_glitch_catalogue(psr=None):
         27
     """
 
+    import time
+    import hashlib
+
     try:
         from astropy.table import Table
         from astropy.units import Unit
     except ImportError:
         raise ImportError('Problem importing astropy')
 
-    # get webpage
-    try:
-        gt = requests.get(GLITCH_URL)
-    except Exception as e:
-        raise RuntimeError("Error downloading glitch catalogue: {}".format(str(e)))
-
-    if gt.status_code != 200:
-        warnings.warn("Count not query the glitch catalogue.", UserWarning)
-        return None
-
-    # parse HTML
-    try:
-        soup = BeautifulSoup(gt.content, 'html.parser')
-    except Exception as e:
-        warnings.warn("Count not parse the glitch catalogue: {}".format(str(e)), UserWarning)
-        return None
+    if url is None:
+        url = GLITCH_URL
 
-    # get table rows
-    rows = soup.table.find_all('tr')
-
-    # set the table headings
-    tabledict = OrderedDict()
-    tabledict['NAME'] = []
-    tabledict['JNAME'] = []
-    tabledict['Glitch number'] = []
-    tabledict['MJD'] = []
-    tabledict['MJD_ERR'] = []
-    tabledict['DeltaF/F'] = []
-    tabledict['DeltaF/F_ERR'] = []
-    tabledict['DeltaF1/F1'] = []
-    tabledict['DeltaF1/F1_ERR'] = []
-    tabledict['Reference'] = []
-
-    # loop through rows: rows with glitches have their first column as an index
-    for row in rows:
-        tds = row.find_all('td')
-
-        if tds[0].contents[0].string is None:
-            continue
+    cachefile = None
+    cached = None
+    if cache:
+        cachefile = os.path.join(
+            cache_dir(),
+            'glitches_{}.npz'.format(hashlib.md5(url.encode('utf-8')).hexdigest()[:12]))
 
+        if os.path.isfile(cachefile):
+            try:
+                with np.load(cachefile, allow_pickle=False) as data:
+                    cached = {key: data[key] for key in data.files}
+            except (IOError, OSError, ValueError):
+                cached = None
+
+    tabledict = None
+    if cached is not None and (time.time() - os.path.getmtime(cachefile)) < maxage:
+        tabledict = cached
+    else:
+        headers = {}
+        if cached is not None:
+            if len(str(cached['_etag'])) > 0:
+                headers['If-None-Match'] = str(cached['_etag'])
+            if len(str(cached['_lastmodified'])) > 0:
+                headers['If-Modified-Since'] = str(cached['_lastmodified'])
+
+        # get webpage
         try:
-            tabledict['NAME'].append(tds[1].contents[0].string)
-            jname = 'J'+tds[2].contents[0].string if \
-                    'J' != tds[2].contents[0].string[0] else tds[2].contents[0].string
-            tabledict['JNAME'].append(jname)
-            tabledict['Glitch number'].append(int(tds[3].contents[0].string))
-
-            for j, pname in enumerate(['MJD', 'MJD_ERR', 'DeltaF/F',
-                                       'DeltaF/F_ERR', 'DeltaF1/F1',
-                                       'DeltaF1/F1_ERR']):
-                try:
-                    val = float(tds[4+j].contents[0].string)
-                except ValueError:
-                    val = np.nan
-
-                tabledict[pname].append(val)
-
-            # get reference link if present
+            gt = get_session().get(url, headers=headers)
+        except Exception as e:
+            if cached is None:
+                raise RuntimeError("Error downloading glitch catalogue: {}".format(str(e)))
+
+            warnings.warn("Could not download the glitch catalogue ({}), so using the cached "
+                          "table".format(str(e)), UserWarning)
+            gt = None
+
+        if gt is None:
+            tabledict = cached
+        elif gt.status_code == 304 and cached is not None:
+            # not modified, so use the cached table
+            tabledict = cached
+            try:
+                os.utime(cachefile, None)
+            except (IOError, OSError):
+                # a read-only cache will just be checked again next time
+                pass
+        elif gt.status_code != 200:
+            if cached is None:
+                warnings.warn("Count not query the glitch catalogue.", UserWarning)
+                return None
+
+            warnings.warn("Could not query the glitch catalogue (status {}), so using the "
+                          "cached table".format(gt.status_code), UserWarning)
+            tabledict = cached
+        else:
+            # parse HTML
             try:
-                ref = tds[10].contents[0].a.attrs['href']
-            except AttributeError:
-                ref = tds[10].contents[0].string
-            tabledict['Reference'].append(ref)
-        except RuntimeError:
-            warnings.warn("Problem parsing glitch table", UserWarning)
+                tabledict = parse_glitch_table(gt.content)
+            except Exception as e:
+                warnings.warn("Could not parse the glitch catalogue: "
+                              "{}".format(str(e)), UserWarning)
+                return None
+
+            if cache:
+                # store the parsed columns (writing to a temporary file first)
+                tmpfile = cachefile + '.tmp.npz'
+                try:
+                    np.savez(tmpfile,
+                             _etag=np.str_(gt.headers.get('ETag', '')),
+                             _lastmodified=np.str_(gt.headers.get('Last-Modified', '')),
+                             **{'col{}'.format(i): tabledict[col]
+                                for i, col in enumerate(GLITCH_COLUMNS)})
+                    if hasattr(os, 'replace'):
+                        os.replace(tmpfile, cachefile)
+                    else:
+                        if os.path.isfile(cachefile):
+                            os.remove(cachefile)
+                        os.rename(tmpfile, cachefile)
+                except (IOError, OSError):
+                    warnings.warn("Could not cache the glitch catalogue", UserWarning)
+
+    if 'col0' in tabledict:
+        # convert from cached column names
+        tabledict = OrderedDict((col, tabledict['col{}'.format(i)])
+                                for i, col in enumerate(GLITCH_COLUMNS))
+
+    if psr is not None:
+        if psr in tabledict['NAME']:
+            mask = tabledict['NAME'] == psr
+        elif psr in tabledict['JNAME']:
+            mask = tabledict['JNAME'] == psr
+        else:
+            warnings.warn("Pulsar '{}' not found in glitch catalogue".format(psr), UserWarning)
             return None
 
+        tabledict = OrderedDict((col, tabledict[col][mask]) for col in GLITCH_COLUMNS)
+
     # convert to an astropy table
     table = Table(tabledict)
     table.columns['MJD'].unit = Unit('d')     # add units of days to glitch time
     table.columns['MJD_ERR'].unit = Unit('d')
 
-    # correct scaling of parameters
-    table['DeltaF/F'] *= 1e-9
-    table['DeltaF/F_ERR'] *= 1e-9
-    table['DeltaF1/F1'] *= 1e-3
-    table['DeltaF1/F1_ERR'] *= 1e-3
+    return table
 
-    if psr is None:
-        return table
-    else:
-        if psr not in table['NAME'] and psr not in table['JNAME']:
-            warnings.warn("Pulsar '{}' not found in glitch catalogue".format(psr), UserWarning)
-            return None
-        else:
-            if psr in table['NAME']:
-                return table[table['NAME'] == psr]
-            else:
-                return table[table['JNAME'] == psr]
+
+def glitch_aggregates(glitches):
+    """
+    Calculate per-pulsar aggregate values from the glitch catalogue (see
+    :func:`~psrqpy.utils.get_glitch_catalogue`). The aggregate values are:
+
+     * `GLITCH_N`: the number of glitches
+     * `GLITCH_DF`: the total fractional frequency change of all glitches
+     * `GLITCH_MAXDF`: the largest fractional frequency change
+     * `GLITCH_DF1`: the total fractional frequency derivative change
+     * `GLITCH_FIRST`: the MJD of the first glitch
+     * `GLITCH_LAST`: the MJD of the most recent glitch
+     * `GLITCH_INTERVAL`: the mean time (days) between glitches
+
+    Args:
+        glitches (:class:`~astropy.table.Table`, :class:`pandas.DataFrame`):
+            the glitch catalogue table.
+
+    Returns:
+        :class:`pandas.DataFrame`: a table with a row for each pulsar in the
+        glitch catalogue containing its ``JNAME``, ``NAME`` and the aggregate
+        values.
+    """
+
+    from pandas import DataFrame, factorize
+
+    jnames = np.asarray(glitches['JNAME'], dtype=object)
+    codes, uniques = factorize(jnames)
+    npsrs = len(uniques)
+
+    mjd = np.asarray(glitches['MJD'], dtype=float)
+    df = np.asarray(glitches['DeltaF/F'], dtype=float)
+    df1 = np.asarray(glitches['DeltaF1/F1'], dtype=float)
+
+    # the first listed name for each pulsar
+    _, first = np.unique(codes, return_index=True)
+
+    aggregates = OrderedDict()
+    aggregates['JNAME'] = np.asarray(uniques, dtype=object)
+    aggregates['NAME'] = np.asarray(glitches['NAME'], dtype=object)[first]
+    aggregates['GLITCH_N'] = np.bincount(codes, minlength=npsrs)
+    aggregates['GLITCH_DF'] = np.bincount(codes, weights=np.nan_to_num(df),
+                                          minlength=npsrs)
+    aggregates['GLITCH_DF1'] = np.bincount(codes, weights=np.nan_to_num(df1),
+                                           minlength=npsrs)
+
+    for name, func, values in [('GLITCH_MAXDF', np.fmax, df),
+                               ('GLITCH_FIRST', np.fmin, mjd),
+                               ('GLITCH_LAST', np.fmax, mjd)]:
+        aggregates[name] = np.full(npsrs, np.nan)
+        func.at(aggregates[name], codes, values)
+
+    # mean interval between glitches (for pulsars with more than one glitch)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aggregates['GLITCH_INTERVAL'] = np.where(
+            aggregates['GLITCH_N'] > 1,
+            (aggregates['GLITCH_LAST'] - aggregates['GLITCH_FIRST']) /
+            (aggregates['GLITCH_N'] - 1), np.nan)
+
+    return DataFrame(aggregates)
 
 
 def get_references(useads=False, cache=True):
@@ -433,21 +1281,17 @@ def get_references(useads=False, cache=True):
         dict: a dictionary of references.
     """
 
-    import tempfile
-    import json
-
     # get the tarball
     try:
         dbtarfile = download_file(ATNF_TARBALL, cache=cache)
     except IOError:
         raise IOError('Problem accessing ATNF catalogue tarball')
 
-    try:
-        # open tarball
-        pulsargz = tarfile.open(dbtarfile, mode='r:gz')
+    # extract (or get previously extracted) references file
+    bundle = extract_bundle(dbtarfile, cache=cache)
 
-        # extract the references
-        reffile = pulsargz.extractfile('psrcat_tar/psrcat_ref')
+    try:
+        reffile = open(bundle['psrcat_ref'], 'rb')
     except IOError:
         raise IOError('Problem extracting the database file')
 
@@ -475,145 +1319,607 @@ def get_references(useads=False, cache=True):
             thisref += thisline.strip()
 
     reffile.close()
-    pulsargz.close()  # close tar file
 
     # if not requiring ADS references just return the current dictionary
     if not useads:
         return refdic
+
+    try:
+        searcher = ADSSearch()
+    except ImportError:
+        warnings.warn('Could not import ADS module, so no ADS information '
+                      'will be included', UserWarning)
+        return refdic, None
+
+    adsrefs = resolve_ads_references(refdic, searcher=searcher, cache=cache)
+
+    return refdic, adsrefs
+
+
+def parse_reference(refstring):
+    """
+    Parse a reference string from the ATNF Pulsar Catalogue to get the year,
+    first author and title, as used for searching NASA ADS.
+
+    Args:
+        refstring (str): the reference string.
+
+    Returns:
+        tuple: the year, first author and title, or None if the reference
+        could not be parsed.
+    """
+
+    # try getting the year from the string and split on this (allows years
+    # between 1000-2999 and followed by a lowercase letter, e.g. 2009 or
+    # 2009a)
+    match = re.match(r'.*([1-2][0-9]{3}[az]{1}|[1-2][0-9]{3})', refstring)
+    if match is None:
+        return None
+
+    # do splitting
+    spl = re.split(r'([1-2][0-9]{3}[az]{1}|[1-2][0-9]{3})', refstring)
+
+    if len(spl) != 3:
+        # more than 1 "year", so ignore!
+        return None
+
+    year = spl[1] if len(spl[1]) == 4 else spl[1][:4]
+
+    try:
+        int(year)
+    except ValueError:
+        # "year" is not an integer
+        return None
+
+    # get the authors (remove line breaks/extra spaces and final full-stop)
+    authors = spl[0].strip().strip('.')
+
+    # remove " Jr." from any author names (as it causes issues!)
+    authors = authors.replace(' Jr.', '')
+
+    # separate out authors
+    sepauthors = authors.split('.,')[:-1]
+
+    if len(sepauthors) == 0:
+        # no authors were parsed
+        return None
+
+    # remove any "'s for umlauts in author names
+    sepauthors = [a.replace(r'"', '') for a in sepauthors]
+
+    # split any authors that are seperated by an ampersand
+    if '&' in sepauthors[-1] or 'and' in sepauthors[-1]:
+        lastauthors = [a.strip() for a in re.split(r'& | and ', sepauthors.pop(-1))]
+        sepauthors = sepauthors + lastauthors
+        for i in range(len(sepauthors)-2):
+            sepauthors[i] += '.'  # re-add final full stops where needed
+        sepauthors[-1] += '.'
     else:
+        sepauthors = [a+'.' for a in sepauthors]  # re-add final full stops
+
+    # get the title
+    try:
+        # remove preceding or trailing full stops
+        title = spl[2].strip('.').split('.')[0].strip()
+    except RuntimeError:
+        # could not get title so ignore this entry
+        return None
+
+    return year, sepauthors[0], title
+
+
+class ADSSearch(object):
+    """
+    A callable object that searches NASA ADS for a paper using the
+    :mod:`ads` module, returning the bibcode of the first matching paper (or
+    None if there is no match).
+
+    Args:
+        url (str): the URL of the ADS search API. Defaults to None, in which
+            case the :mod:`ads` module default is used.
+        token (str): an ADS API token. Defaults to None, in which case the
+            :mod:`ads` module will look for a token.
+    """
+
+    def __init__(self, url=None, token=None):
         try:
             import ads
-            from ads.exceptions import APIResponseError
         except ImportError:
-            warnings.warn('Could not import ADS module, so no ADS information '
-                          'will be included', UserWarning)
-            return refdic, None
+            raise ImportError('Could not import ADS module')
 
-    # try getting cached references
-    if not cache:
-        adsrefs = {}
-    else:
-        from astropy.utils.data import is_url_in_cache
+        self._ads = ads
+        self.url = url
+        self.token = token
 
-        tmpdir = tempfile.gettempdir()  # get system "temporary" directory
-        dummyurl = 'file://{}/ads_cache'.format(tmpdir)
-        dummyfile = os.path.join('{}'.format(tmpdir), 'ads_cache')
+    def __call__(self, year, first_author, title):
+        article = self._ads.SearchQuery(year=year, first_author=first_author,
+                                        title=title, fl=['bibcode'], rows=1,
+                                        token=self.token)
 
-        # check if cached ADS refs list exists (using dummy URL)
-        if is_url_in_cache(dummyurl):
-            adsfile = download_file(dummyurl, cache=True, show_progress=False)
+        if self.url is not None:
+            article.HTTP_ENDPOINT = self.url
 
-            try:
-                fp = open(adsfile, 'r')
-            except IOError:
-                warnings.warn('Could not load ADS URL cache for references',
-                              UserWarning)
-                return refdic, None
+        try:
+            return next(article).bibcode
+        except StopIteration:
+            return None
 
-            adsrefs = json.load(fp)
-            fp.close()
 
-            return refdic, adsrefs
-        else:
-            adsrefs = {}
+class RateLimiter(object):
+    """
+    A thread safe rate limiter. Each call to
+    :meth:`~psrqpy.utils.RateLimiter.wait` blocks until the next request is
+    allowed.
 
-    # loop over references
-    j = 0
-    for reftag in refdic:
-        j = j + 1
+    Args:
+        rate (float): the maximum number of requests per second. If None, or
+            zero, then there is no limit.
+    """
 
-        if reftag in PROB_REFS:
-            continue
+    def __init__(self, rate=None):
+        self.interval = 1. / rate if rate else 0.
+        self._next = 0.
+        self._lock = threading.Lock()
 
-        refstring = refdic[reftag]
+    def wait(self):
+        """
+        Wait until the next request is allowed.
+        """
 
-        # try getting the year from the string and split on this (allows years
-        # between 1000-2999 and followed by a lowercase letter, e.g. 2009 or
-        # 2009a)
-        match = re.match(r'.*([1-2][0-9]{3}[az]{1}|[1-2][0-9]{3})', refstring)
-        if match is None:
-            continue
+        import time
 
-        # do splitting
-        spl = re.split(r'([1-2][0-9]{3}[az]{1}|[1-2][0-9]{3})', refstring)
+        if self.interval == 0.:
+            return
 
-        if len(spl) != 3:
-            # more than 1 "year", so ignore!
-            continue
+        with self._lock:
+            now = time.time()
+            wait = max(0., self._next - now)
+            self._next = max(now, self._next) + self.interval
 
-        year = spl[1] if len(spl[1]) == 4 else spl[1][:4]
+        if wait > 0.:
+            time.sleep(wait)
 
-        try:
-            int(year)
-        except ValueError:
-            # "year" is not an integer
-            continue
 
-        # get the authors (remove line breaks/extra spaces and final full-stop)
-        authors = spl[0].strip().strip('.')
+def resolve_ads_references(refdic, searcher=None, nthreads=4, rate=5.,
+                           retries=3, backoff=1., cache=True, cachefile=None,
+                           ttl=30., notfoundttl=7., checkpoint=50):
+    """
+    Find the NASA ADS URLs for a set of references. Searches are performed
+    concurrently by a pool of threads, with a limit on the rate of requests,
+    and searches that fail with an HTTP or connection error are retried with
+    an exponential backoff (a warning is given for any that still fail, and
+    any other errors are raised). Results are stored in a persistent cache,
+    with each reference kept for a given time-to-live, so that only new (or
+    changed), expired or previously failed references are searched for. The
+    cache is written out periodically, so progress is not lost if the
+    process is interrupted.
 
-        # remove " Jr." from any author names (as it causes issues!)
-        authors = authors.replace(' Jr.', '')
+    Args:
+        refdic (dict): a dictionary of reference strings keyed on reference
+            tag (see :func:`~psrqpy.utils.get_references`).
+        searcher (callable): a function taking a year, first author and title
+            and returning an ADS bibcode (or None if not found). Defaults to
+            None, in which case :class:`~psrqpy.utils.ADSSearch` is used.
+        nthreads (int): the number of concurrent searches. Defaults to 4.
+        rate (float): the maximum number of searches per second. Defaults to
+            5.
+        retries (int): the number of times to retry a failed search. Defaults
+            to 3.
+        backoff (float): the time (seconds) to wait before the first retry,
+            which doubles for each subsequent retry. Defaults to 1.
+        cache (bool): use, and update, the cache of results. Defaults to
+            True.
+        cachefile (str): the cache file. Defaults to ``ads_references.json``
+            in the psrqpy cache directory (see
+            :func:`~psrqpy.utils.cache_dir`).
+        ttl (float): the time (days) for which found references are kept in
+            the cache. Defaults to 30.
+        notfoundttl (float): the time (days) for which references that were
+            not found are kept in the cache. Defaults to 7.
+        checkpoint (int): the number of searches after which the cache is
+            written out. Defaults to 50.
 
-        # separate out authors
-        sepauthors = authors.split('.,')[:-1]
+    Returns:
+        dict: a dictionary of ADS URLs keyed on reference tag.
+    """
 
-        if len(sepauthors) == 0:
-            # no authors were parsed
-            continue
+    import json
+    import time
+    from multiprocessing.pool import ThreadPool
 
-        # remove any "'s for umlauts in author names
-        sepauthors = [a.replace(r'"', '') for a in sepauthors]
+    import requests
 
-        # split any authors that are seperated by an ampersand
-        if '&' in sepauthors[-1] or 'and' in sepauthors[-1]:
-            lastauthors = [a.strip() for a in re.split(r'& | and ', sepauthors.pop(-1))]
-            sepauthors = sepauthors + lastauthors
-            for i in range(len(sepauthors)-2):
-                sepauthors[i] += '.'  # re-add final full stops where needed
-            sepauthors[-1] += '.'
-        else:
-            sepauthors = [a+'.' for a in sepauthors]  # re-add final full stops
+    if searcher is None:
+        searcher = ADSSearch()
 
-        # get the title
-        try:
-            # remove preceding or trailing full stops
-            title = spl[2].strip('.').split('.')[0].strip()
-        except RuntimeError:
-            # could not get title so ignore this entry
-            continue
+    # errors for which searches are retried, any others are raised
+    transient = [requests.RequestException]
+    try:
+        from ads.exceptions import APIResponseError
+        transient.append(APIResponseError)
+    except ImportError:
+        pass
+    transient = tuple(transient)
+
+    if cachefile is None and cache:
+        cachefile = os.path.join(cache_dir(), 'ads_references.json')
 
-        # try getting ADS references
+    entries = {}
+    if cache and os.path.isfile(cachefile):
         try:
-            article = ads.SearchQuery(year=year, first_author=sepauthors[0],
-                                      title=title)
-        except APIResponseError:
-            warnings.warn('Could not get reference information, so no ADS '
-                          'information will be included', UserWarning)
+            with open(cachefile, 'r') as fp:
+                entries = json.load(fp)
+        except (IOError, ValueError):
+            warnings.warn('Could not load ADS URL cache for references',
+                          UserWarning)
+            entries = {}
+
+    now = time.time()
+    day = 86400.
+
+    def isvalid(tag):
+        # check if a cached entry exists and has not expired
+        entry = entries.get(tag, None)
+        if entry is None or entry.get('ref') != refdic[tag]:
+            return False
+
+        maxage = ttl if entry.get('bibcode') is not None else notfoundttl
+        return (now - entry.get('time', 0.)) < maxage * day
+
+    tosearch = []
+    for reftag in refdic:
+        if reftag in PROB_REFS or isvalid(reftag):
             continue
 
+        parsed = parse_reference(refdic[reftag])
+        if parsed is not None:
+            tosearch.append((reftag, parsed))
+
+    limiter = RateLimiter(rate)
+    lock = threading.Lock()
+    counter = [0]
+    failed = []
+
+    def save():
+        # write out cache (to a temporary file that is then renamed)
+        tmpfile = cachefile + '.tmp'
         try:
-            adsrefs[reftag] = ADS_URL.format(list(article)[0].bibcode)
-        except (IndexError, APIResponseError):
-            pass
+            with open(tmpfile, 'w') as fp:
+                json.dump(entries, fp, indent=2)
+            if hasattr(os, 'replace'):
+                os.replace(tmpfile, cachefile)
+            else:
+                if os.path.isfile(cachefile):
+                    os.remove(cachefile)
+                os.rename(tmpfile, cachefile)
+        except (IOError, OSError):
+            warnings.warn('Could not output the ADS references cache',
+                          UserWarning)
 
-    if cache:
-        # output adsrefs to cache file
+    def search(item):
+        reftag, (year, author, title) = item
+
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                bibcode = searcher(year, author, title)
+                break
+            except transient:
+                if attempt == retries:
+                    # failed searches are not cached, so will be retried
+                    with lock:
+                        failed.append(reftag)
+                    return
+                time.sleep(backoff * 2**attempt)
+
+        with lock:
+            entries[reftag] = {'ref': refdic[reftag], 'bibcode': bibcode,
+                               'time': time.time()}
+            counter[0] += 1
+            if cache and counter[0] % checkpoint == 0:
+                save()
+
+    if len(tosearch) > 0:
+        pool = ThreadPool(max(1, min(nthreads, len(tosearch))))
         try:
-            # output to dummy temporary file and then "download" to cache
-            fp = open(dummyfile, 'w')
-            json.dump(adsrefs, fp, indent=2)
-            fp.close()
-        except IOError:
-            raise IOError("Could not output the ADS references to a file")
+            pool.map(search, tosearch)
+        finally:
+            pool.close()
+            pool.join()
 
-        # cache the file
-        _ = download_file(dummyurl, cache=True, show_progress=False)
+            if cache:
+                with lock:
+                    save()
 
-        # remove the temporary file
-        os.remove(dummyfile)
+    if len(failed) > 0:
+        warnings.warn('Could not get ADS information for {} reference(s): '
+                      '{}'.format(len(failed), ', '.join(sorted(failed))),
+                      UserWarning)
 
-    return refdic, adsrefs
+    adsrefs = {}
+    for reftag in refdic:
+        entry = entries.get(reftag, None)
+        if (entry is not None and entry.get('ref') == refdic[reftag] and
+                entry.get('bibcode') is not None):
+            adsrefs[reftag] = ADS_URL.format(entry['bibcode'])
+
+    return adsrefs
+
+
+class ReferenceIndex(object):
+    """
+    An index of the references in the ATNF Pulsar Catalogue. This holds an
+    inverted index from normalised author surnames, years and title words to
+    reference tags, and an index from reference tags to the pulsars (and
+    parameters) that use them, so that, e.g., all pulsars with parameters
+    from a given paper can be found quickly.
+
+    Args:
+        refs (dict): a dictionary of reference strings keyed on reference tag
+            (see :func:`~psrqpy.utils.get_references`).
+        catalogue (:class:`pandas.DataFrame`): the catalogue table containing
+            the ``_REF`` columns of reference tags. Defaults to None, in which
+            case only the references themselves are indexed.
+        version (str): the catalogue version from which the index was built.
+
+    Example:
+        Find all pulsars with parameters from Hobbs et al. (2004)
+
+        >>> from psrqpy import QueryATNF
+        >>> query = QueryATNF()
+        >>> index = query.get_reference_index()
+        >>> index.pulsars(author='Hobbs', year=2004, firstauthor=True)
+    """
+
+    YEAR_REGEX = re.compile(r'([1-2][0-9]{3})[a-z]?')
+    INITIALS_REGEX = re.compile(r'^(?:[A-Z][a-z]{0,2}\.[\s-]*)+$')
+    WORD_REGEX = re.compile(r'[a-z0-9]+')
+
+    def __init__(self, refs, catalogue=None, version=None):
+        self.version = version
+        self.refs = refs
+
+        self._authors = {}
+        self._firstauthors = {}
+        self._years = {}
+        self._words = {}
+
+        for tag, refstring in refs.items():
+            year, authors, title = self.parse(refstring)
+
+            if year is not None:
+                self._years.setdefault(year, set()).add(tag)
+
+            for i, author in enumerate(authors):
+                self._authors.setdefault(author, set()).add(tag)
+                if i == 0:
+                    self._firstauthors.setdefault(author, set()).add(tag)
+
+            for word in title:
+                self._words.setdefault(word, set()).add(tag)
+
+        self._index_catalogue(catalogue)
+
+    @staticmethod
+    def normalise(name):
+        """
+        Normalise a name or word for indexing, i.e., convert it to lower case
+        ASCII characters without any accents or punctuation.
+
+        Args:
+            name (str): the name or word
+
+        Returns:
+            str: the normalised name
+        """
+
+        import unicodedata
+
+        if not isinstance(name, six.text_type):
+            name = name.decode('utf-8') if isinstance(name, bytes) else six.text_type(name)
+
+        name = unicodedata.normalize('NFKD', name)
+        name = ''.join(c for c in name if not unicodedata.combining(c))
+
+        return re.sub(r'[^a-z0-9]', '', name.lower())
+
+    @classmethod
+    def parse(cls, refstring):
+        """
+        Parse a reference string into its year, normalised author surnames and
+        normalised title words.
+
+        Args:
+            refstring (str): the reference string
+
+        Returns:
+            tuple: the year (or None if not found), a list of author surnames
+            (first author first) and a set of title words.
+        """
+
+        match = cls.YEAR_REGEX.search(refstring)
+
+        if match is None:
+            return None, [], set()
+
+        year = match.group(1)
+
+        # get author surnames (removing initials and "et al.")
+        authors = []
+        authorstr = refstring[:match.start()].replace(' Jr.', '')
+        for part in re.split(r'\s*(?:,|&|\band\b)\s*', authorstr):
+            part = part.strip().strip('"')
+            if (len(part) == 0 or cls.INITIALS_REGEX.match(part) or
+                    part.startswith('et al')):
+                continue
+
+            author = cls.normalise(part)
+            if len(author) > 0:
+                authors.append(author)
+
+        # get title words (ignoring very short words)
+        title = refstring[match.end():].strip(' .').split('. ')[0]
+        words = set(w for w in cls.WORD_REGEX.findall(cls.normalise_text(title))
+                    if len(w) > 2)
+
+        return year, authors, words
+
+    @classmethod
+    def normalise_text(cls, text):
+        """
+        Normalise a piece of text, keeping the spaces between words.
+        """
+
+        return ' '.join(cls.normalise(w) for w in text.split())
+
+    def _index_catalogue(self, catalogue):
+        """
+        Create the index of reference tags to catalogue rows and parameters.
+        """
+
+        from pandas import Index, factorize
+
+        self.names = np.array([], dtype=object)
+        self.params = []
+        self._tags = Index([], dtype=object)
+        self._offsets = np.zeros(1, dtype=np.intp)
+        self._rows = np.array([], dtype=np.intp)
+        self._paridx = np.array([], dtype=np.intp)
+
+        if catalogue is None:
+            return
+
+        for namecol in ['JNAME', 'NAME', 'PSRJ']:
+            if namecol in catalogue.columns:
+                self.names = np.asarray(catalogue[namecol].values, dtype=object)
+                break
+
+        refcols = [col for col in catalogue.columns if col.endswith('_REF')]
+        self.params = [col[:-4] for col in refcols]
+
+        if len(refcols) == 0:
+            return
+
+        nrows = len(catalogue)
+
+        # codes for the tags for all reference columns at once
+        values = np.empty((len(refcols), nrows), dtype=object)
+        for i, col in enumerate(refcols):
+            values[i] = catalogue[col].values
+        codes, tags = factorize(values.ravel())
+
+        # group the (row, parameter) pairs by tag
+        valid = np.flatnonzero(codes >= 0)
+        order = valid[np.argsort(codes[valid], kind='mergesort')]
+
+        self._tags = Index(tags, dtype=object)
+        counts = np.bincount(codes[valid], minlength=len(tags))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._rows = order % nrows
+        self._paridx = order // nrows
+
+    def search(self, author=None, year=None, title=None, firstauthor=False):
+        """
+        Find the tags of references matching all of the given criteria.
+
+        Args:
+            author (str, list): an author surname, or list of surnames, all of
+                which must be authors of the reference.
+            year (int, str): the year of the reference.
+            title (str): words, all of which must be in the reference title.
+            firstauthor (bool): if True the (first) given author must be the
+                first author of the reference. Defaults to False.
+
+        Returns:
+            list: a sorted list of matching reference tags.
+        """
+
+        sets = []
+
+        if author is not None:
+            if isinstance(author, string_types):
+                author = [author]
+
+            for i, name in enumerate(author):
+                index = self._firstauthors if (firstauthor and i == 0) else self._authors
+                sets.append(index.get(self.normalise(name), set()))
+
+        if year is not None:
+            sets.append(self._years.get(str(year)[:4], set()))
+
+        if title is not None:
+            for word in self.WORD_REGEX.findall(self.normalise_text(title)):
+                if len(word) > 2:
+                    sets.append(self._words.get(word, set()))
+
+        if len(sets) == 0:
+            return sorted(self.refs.keys())
+
+        # intersect starting from the smallest set
+        sets = sorted(sets, key=len)
+        tags = set(sets[0])
+        for other in sets[1:]:
+            tags &= other
+
+        return sorted(tags)
+
+    def citations(self, tags=None, **kwargs):
+        """
+        Return all the pulsars, and parameters, that use a set of references.
+
+        Args:
+            tags (str, list): a reference tag, or list of tags. If not given,
+                then the tags are found using :meth:`~psrqpy.utils.ReferenceIndex.search`
+                with any other keyword arguments.
+
+        Returns:
+            :class:`pandas.DataFrame`: a table with columns of the pulsar
+            name (``NAME``), catalogue row (``ROW``), parameter (``PARAM``) and
+            reference tag (``REF``).
+        """
+
+        from pandas import DataFrame
+
+        if tags is None:
+            tags = self.search(**kwargs)
+        elif isinstance(tags, string_types):
+            tags = [tags]
+
+        codes = self._tags.get_indexer(list(tags))
+        codes = codes[codes >= 0]
+
+        starts = self._offsets[codes]
+        counts = self._offsets[codes + 1] - starts
+
+        # positions of all (row, parameter) pairs for the tags
+        positions = (np.repeat(starts - np.cumsum(counts) + counts, counts) +
+                     np.arange(counts.sum()))
+
+        rows = self._rows[positions]
+        params = np.asarray(self.params, dtype=object)[self._paridx[positions]]
+        names = (self.names[rows] if len(self.names) > 0 else
+                 np.full(len(rows), None, dtype=object))
+
+        reftags = np.repeat(np.asarray(self._tags, dtype=object)[codes], counts)
+
+        return DataFrame(OrderedDict([('NAME', names),
+                                      ('ROW', rows),
+                                      ('PARAM', params),
+                                      ('REF', reftags)]))
+
+    def pulsars(self, tags=None, **kwargs):
+        """
+        Return the names of all pulsars with parameters from a set of
+        references. This takes the same arguments as
+        :meth:`~psrqpy.utils.ReferenceIndex.citations`.
+
+        Returns:
+            list: a list of pulsar names, in catalogue order.
+        """
+
+        rows = np.unique(self.citations(tags, **kwargs)['ROW'].values)
+
+        return list(self.names[rows])
 
 
 # string of logical expressions for use in regex parser
@@ -646,6 +1952,8 @@ LOGEXPRS = (r'(\bAND\b'        # logical AND
             r'|\bERROR\b'      # condition on parameter error
             r'|\berror\b)')    # condition on parameter error
 
+LOGEXPRS_REGEX = re.compile(LOGEXPRS)
+
 
 def condition(table, expression, exactMatch=False):
     """
@@ -715,24 +2023,95 @@ def condition(table, expression, exactMatch=False):
             if len(expression) == 0:
                 return table
 
+    if isinstance(table, Table):
+        # convert astropy table to pandas DataFrame
+        tab = table.to_pandas()
+    elif not isinstance(table, DataFrame):
+        raise TypeError("Table must be a pandas DataFrame or astropy Table")
+    else:
+        tab = table
+
+    mask = condition_mask(tab, expression, exactMatch=exactMatch)
+
+    if mask is None:
+        # a required parameter does not exist, so return an empty DataFrame
+        newtab = DataFrame(columns=tab.columns)
+    else:
+        newtab = tab[mask]
+
+    if isinstance(table, Table):
+        # convert back to an astropy table
+        newtab = Table.from_pandas(newtab)
+
+        # re-add any units/types
+        for key in table.colnames:
+            newtab.columns[key].unit = table.columns[key].unit
+            newtab[key] = newtab[key].astype(table[key].dtype)
+
+    return newtab
+
+
+def condition_mask(table, expression, exactMatch=False, cache=None):
+    """
+    Evaluate a logical expression for a table of values and return a boolean
+    array that is True for each row satisfying the expression. This takes the
+    same expressions as :func:`~psrqpy.utils.condition`.
+
+    Args:
+        table (:class:`pandas.DataFrame`): a table of pulsar data
+        expression (str): a string containing a set of logical conditions with
+            respect to pulsar parameter names.
+        exactMatch (bool): set to true to exactly match some string comparison
+            expressions (see :func:`~psrqpy.utils.condition`).
+        cache (dict): a dictionary in which to store intermediate values (e.g.,
+            the string values of the ``TYPE`` column and the result of each
+            ``TYPE(...)``, ``ASSOC(...)``, etc., term). Passing the same
+            dictionary for multiple expressions evaluated on the same table
+            means these are only calculated once.
+
+    Returns:
+        :class:`~numpy.ndarray`: a boolean array, or None if the expression
+        requires a parameter that does not exist in the table.
+    """
+
+    if cache is None:
+        cache = {}
+
+    exprcache = cache.setdefault('expressions', {})
+    key = (expression, bool(exactMatch))
+    if key in exprcache:
+        return exprcache[key]
+
     # parse the expression string and split into tokens
-    reg = re.compile(LOGEXPRS)
-    tokens = reg.split(expression)
+    tokens = LOGEXPRS_REGEX.split(expression)
     tokens = [t.strip() for t in tokens if t.strip() != '']
 
-    if isinstance(table, Table):
-        # convert astropy table to pandas DataFrame
-        tab = table.to_pandas()
-    elif not isinstance(table, DataFrame):
-        raise TypeError("Table must be a pandas DataFrame or astropy Table")
-    else:
-        tab = table
+    termcache = cache.setdefault('terms', {})
+    strcache = cache.setdefault('strings', {})
+
+    def strcolumn(name):
+        # string representation of a column (only created once)
+        if name not in strcache:
+            strcache[name] = table[name].astype(str)
+        return strcache[name]
+
+    def termmask(termtype, value):
+        # boolean mask for a TYPE/ASSOC/BINCOMP/EXIST term
+        tkey = (termtype, value)
+        if tkey not in termcache:
+            if termtype == 'EXIST' or (termtype == 'TYPE' and value == 'BINARY'):
+                column = 'BINARY' if termtype == 'TYPE' else value
+                termcache[tkey] = table[column].notna().values
+            else:
+                termcache[tkey] = strcolumn(termtype).str.contains(value, regex=False).values
+        return termcache[tkey]
 
     matchTypes = ['ASSOC', 'TYPE', 'BINCOMP', 'EXIST', 'ERROR']
 
     # parse through tokens and replace as required
     ntokens = len(tokens)
     newtokens = []
+    localdict = {}
     i = 0
     while i < ntokens:
         if tokens[i] in [r'&&', r'AND', r'and']:
@@ -745,7 +2124,7 @@ def condition(table, expression, exactMatch=False):
             # replace synonyms for '~'
             newtokens.append(r'~')
         elif tokens[i].upper() in matchTypes:
-            if ntokens < i+3:
+            if ntokens < i+4:
                 warnings.warn("A '{}' must be followed by a '(NAME)': "
                               "ignoring in query".format(tokens[i].upper()),
                               UserWarning)
@@ -754,64 +2133,45 @@ def condition(table, expression, exactMatch=False):
                               "ignoring in query".format(tokens[i].upper()),
                               UserWarning)
             else:
-                if tokens[i].upper() == 'ASSOC':
-                    if 'ASSOC' not in tab.columns:
-                        warnings.warn("'ASSOC' parameter not in table: "
-                                      "ignoring in query", UserWarning)
-                    elif exactMatch:
-                        newtokens.append(r'(ASSOC == "{}")'.format(tokens[i+2].upper()))
-                    else:
-                        assoc = np.array([tokens[i+2] in str(a) for a in table['ASSOC']])
-                        newtokens.append(r'(@assoc)')
-                        i += 1
-                elif tokens[i].upper() == 'TYPE':
-                    if tokens[i+2].upper() == 'BINARY':
-                        if 'BINARY' not in tab.keys():
-                            warnings.warn("'BINARY' parameter not in table: "
-                                          "ignoring in query", UserWarning)
-                        else:
-                            binary = ~tab['BINARY'].isna()
-                            newtokens.append(r'(@binary)')
-                            i += 1
-                    else:
-                        if 'TYPE' not in tab.keys():
-                            warnings.warn("'TYPE' parameter not in table: ignoring in query",
-                                          UserWarning)
-                        elif exactMatch:
-                            newtokens.append(r'(TYPE == "{}")'.format(tokens[i+2].upper()))
-                        else:
-                            ttype = np.array([tokens[i+2] in str(a) for a in table['TYPE']])
-                            newtokens.append(r'(@ttype)')
-                            i += 1
-                elif tokens[i].upper() == 'BINCOMP':
-                    if 'BINCOMP' not in tab.columns:
-                        warnings.warn("'BINCOMP' parameter not in table: ignoring in query",
+                # local variable name for any boolean array
+                localname = '_term{}'.format(len(localdict))
+                ttype = tokens[i].upper()
+
+                if ttype in ['ASSOC', 'BINCOMP'] or (ttype == 'TYPE' and
+                                                     tokens[i+2].upper() != 'BINARY'):
+                    if ttype not in table.columns:
+                        warnings.warn("'{}' parameter not in table: "
+                                      "ignoring in query".format(ttype),
                                       UserWarning)
                     elif exactMatch:
-                        newtokens.append(r'(BINCOMP == "{}")'.format(tokens[i+2].upper()))
+                        newtokens.append(r'({} == "{}")'.format(ttype, tokens[i+2].upper()))
+                    else:
+                        localdict[localname] = termmask(ttype, tokens[i+2])
+                        newtokens.append(r'(@{})'.format(localname))
+                elif ttype == 'TYPE':
+                    if 'BINARY' not in table.columns:
+                        warnings.warn("'BINARY' parameter not in table: "
+                                      "ignoring in query", UserWarning)
                     else:
-                        bincomp = np.array([tokens[i+2] in str(a) for a in table['BINCOMP']])
-                        newtokens.append(r'(@bincomp)')
-                        i += 1
-                elif tokens[i].upper() == 'EXIST':
-                    if tokens[i+2].upper() not in tab.columns:
+                        localdict[localname] = termmask('TYPE', 'BINARY')
+                        newtokens.append(r'(@{})'.format(localname))
+                elif ttype == 'EXIST':
+                    if tokens[i+2].upper() not in table.columns:
                         warnings.warn("'{}' does not exist for any pulsar".format(tokens[i+2]),
                                       UserWarning)
-                        # create an empty DataFrame
-                        tab = DataFrame(columns=tab.columns)
-                        break
+                        exprcache[key] = None
+                        return None
                     else:
-                        exists = ~tab[tokens[i+2].upper()].isna()
-                        newtokens.append(r'(@exists)')
-                        i += 1
-                elif tokens[i].upper() == 'ERROR':
-                    if tokens[i+2].upper()+'_ERR' not in tab.columns:
+                        localdict[localname] = termmask('EXIST', tokens[i+2].upper())
+                        newtokens.append(r'(@{})'.format(localname))
+                elif ttype == 'ERROR':
+                    if tokens[i+2].upper()+'_ERR' not in table.columns:
                         warnings.warn("Error value for '{}' not present: "
                                       "ignoring in query".format(tokens[i+2]),
                                       UserWarning)
                     else:
                         newtokens.append(r'{}_ERR'.format(tokens[i+2].upper()))
-            i += 2
+                i += 3
         else:
             newtokens.append(tokens[i].upper())
 
@@ -819,23 +2179,190 @@ def condition(table, expression, exactMatch=False):
 
     # evaluate the expression
     try:
-        newtab = tab.query(''.join(newtokens))
+        mask = np.asarray(table.eval(''.join(newtokens), local_dict=localdict),
+                          dtype=bool)
     except RuntimeError:
         raise RuntimeError("Could not parse the query")
 
+    exprcache[key] = mask
+
+    return mask
+
+
+def batch_condition(table, expressions, exactMatch=False, counts=False):
+    """
+    Evaluate many logical expressions against the same table of values. Any
+    string columns used by ``TYPE(...)``, ``ASSOC(...)`` and ``BINCOMP(...)``
+    terms, and the results of those terms, are shared between all the
+    expressions, as are the results of any repeated expressions.
+
+    Args:
+        table (:class:`astropy.table.Table` or :class:`pandas.DataFrame`): a
+            table of pulsar data
+        expressions (list): a list of condition strings (see
+            :func:`~psrqpy.utils.condition`).
+        exactMatch (bool): set to true to exactly match some string comparison
+            expressions.
+        counts (bool): if True return the number of rows satisfying each
+            expression rather than the full boolean array.
+
+    Returns:
+        :class:`~numpy.ndarray`: a two-dimensional boolean array of shape
+        (number of expressions, number of rows), or, if `counts` is True, an
+        array of the number of rows satisfying each expression.
+
+    Example:
+        Find the number of pulsars with frequencies above a set of values
+
+        >>> thresholds = [1, 10, 100]
+        >>> batch_condition(psrtable, ['F0 > {}'.format(f) for f in thresholds], counts=True)
+    """
+
+    from astropy.table import Table
+    from pandas import DataFrame
+
+    if isinstance(expressions, string_types):
+        expressions = [expressions]
+
     if isinstance(table, Table):
-        # convert back to an astropy table
-        newtab = Table.from_pandas(newtab)
+        tab = table.to_pandas()
+    elif not isinstance(table, DataFrame):
+        raise TypeError("Table must be a pandas DataFrame or astropy Table")
+    else:
+        tab = table
 
-        # re-add any units/types
-        for key in table.colnames:
-            newtab.columns[key].unit = table.columns[key].unit
-            newtab[key] = newtab[key].astype(table[key].dtype)
+    cache = {}
+    masks = np.zeros((len(expressions), len(tab)), dtype=bool)
+    for i, expression in enumerate(expressions):
+        if expression is None or len(expression) == 0:
+            masks[i] = True
+            continue
 
-    return newtab
+        if not isinstance(expression, string_types):
+            raise TypeError("Expressions must be strings")
+
+        mask = condition_mask(tab, expression, exactMatch=exactMatch,
+                              cache=cache)
+        if mask is not None:
+            masks[i] = mask
+
+    if counts:
+        return masks.sum(axis=1)
+
+    return masks
+
+
+#: the number of seconds in a Julian year
+YEAR_SECONDS = 365.25*86400.
+
+
+def _kernel_array(value, unit=None):
+    """
+    Convert an input to a kernel function into a float array without copying
+    it if possible. Values of :class:`pandas.Series` are used directly,
+    :class:`astropy.units.Quantity` values are converted to the given unit,
+    and any masked values are set to NaN.
+    """
+
+    # Quantity and Series values can only exist if astropy and pandas have
+    # already been imported, so there is no need to import them here
+    aunits = sys.modules.get('astropy.units')
+    pandas = sys.modules.get('pandas')
+
+    if aunits is not None and isinstance(value, aunits.Quantity):
+        value = value.to_value(aunits.dimensionless_unscaled if unit is None else unit)
+    elif pandas is not None and isinstance(value, pandas.Series):
+        value = value.values
+
+    if np.ma.isMaskedArray(value):
+        value = np.ma.filled(np.ma.asarray(value, dtype=float), np.nan)
+
+    try:
+        return np.asarray(value, dtype=float)
+    except Exception as e:
+        raise ValueError("Could not convert input to a float "
+                         "array: {}".format(str(e)))
+
+
+def _kernel_output(out, *arrays):
+    """
+    Return the output array for a kernel function, checking the shape of
+    any supplied output array.
+    """
+
+    shape = np.broadcast(*arrays).shape
+
+    if out is None:
+        return np.empty(shape)
+
+    if not isinstance(out, np.ndarray) or out.shape != shape or out.dtype != float:
+        raise ValueError("Output array must be a float array of shape "
+                         "{}".format(shape))
+
+    return out
+
+
+def _kernel_numexpr(usenumexpr):
+    """
+    Return the :mod:`numexpr` module if it is requested and available.
+    """
+
+    if not usenumexpr:
+        return None
+
+    try:
+        import numexpr
+    except ImportError:
+        warnings.warn("numexpr is not available, so numpy will be used",
+                      UserWarning)
+        return None
+
+    return numexpr
+
+
+def _kernel(nexpr, validexpr, npfunc, npvalid, arrays, out, usenumexpr,
+            constants={}):
+    """
+    Evaluate a kernel function. Values are calculated into the output array,
+    and any invalid values are set to NaN.
+
+    Args:
+        nexpr (str): the expression to evaluate with :mod:`numexpr`.
+        validexpr (str): the expression for valid values for :mod:`numexpr`.
+        npfunc (callable): a function taking the input arrays and output
+            array that evaluates the expression with numpy.
+        npvalid (callable): a function taking the input arrays and returning
+            a boolean array of the valid values.
+        arrays (dict): an ordered dictionary of the input arrays.
+        out (:class:`~numpy.ndarray`): the output array (or None).
+        usenumexpr (bool): evaluate the expression with :mod:`numexpr`.
+        constants (dict): any other constants used in the expressions.
+
+    Returns:
+        :class:`numpy.ndarray` or float: the output values, or a float if all
+        the inputs were scalars and no output array was given.
+    """
+
+    scalar = out is None and all(np.ndim(a) == 0 for a in arrays.values())
+    out = _kernel_output(out, *arrays.values())
+
+    numexpr = _kernel_numexpr(usenumexpr)
 
+    if numexpr is not None:
+        localdict = dict(arrays)
+        localdict.update(constants)
+        localdict.update({'nan': np.nan, 'inf': np.inf})
+        numexpr.evaluate('where({}, {}, nan)'.format(validexpr, nexpr),
+                         local_dict=localdict, out=out, casting='unsafe')
+    else:
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            npfunc(*(list(arrays.values()) + [out]))
+            np.copyto(out, np.nan, where=~npvalid(*arrays.values()))
+
+    return out[()] if scalar else out
 
-def characteristic_age(period, pdot, braking_idx=3.):
+
+def characteristic_age(period, pdot, braking_idx=3., out=None, usenumexpr=False):
     """
     Function defining the characteristic age of a pulsar. Returns the
     characteristic age in years using
@@ -850,40 +2377,37 @@ def characteristic_age(period, pdot, braking_idx=3.):
         period (float, array_like): the pulsar period in seconds
         pdot (float, array_like): the pulsar period derivative
         braking_idx (float): the pulsar braking index (defaults to :math:`n=3`)
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
 
     Returns:
         float: the characteristic age in years
     """
 
-    # try converting period and pdot to numpy arrays
-    try:
-        periodarr = np.array(period).flatten()
-        pdotarr = np.array(pdot).flatten()
-    except Exception as e:
-        raise ValueError("Could not convert period/pdot to "
-                         "array: {}".format(str(e)))
+    if braking_idx <= 1.:
+        raise ValueError("Braking index must be greater than 1")
 
-    assert periodarr.dtype == np.float, "Periods must be floats"
-    assert pdotarr.dtype == np.float, "Period derivatives must be floats"
-    assert len(periodarr) == len(pdotarr), "Period and derivative arrays must be equal lengths"
-    assert braking_idx > 1., "Braking index must be greater than 1"
+    factor = 1./((braking_idx - 1.)*YEAR_SECONDS)
 
-    # check everything is positive, otherwise return NaN
-    age = np.full(len(periodarr), np.nan)
-    with np.errstate(invalid='ignore'):
-        idx = np.isfinite(pdotarr) & np.isfinite(periodarr) & (pdotarr > 0.)
+    def npfunc(period, pdot, out):
+        np.divide(period, pdot, out=out)
+        np.multiply(out, factor, out=out)
 
-    age[idx] = (periodarr[idx]/(pdotarr[idx] * (braking_idx - 1.))) / (365.25*86400.)
+    def npvalid(period, pdot):
+        return (pdot > 0.) & np.isfinite(pdot) & np.isfinite(period)
 
-    # if period and period derivates were just floats return values rather
-    # than arrays
-    if isinstance(pdot, float) and isinstance(period, float):
-        return age[0]
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('pdot', _kernel_array(pdot))])
 
-    return age
+    return _kernel('period / pdot * factor',
+                   '(pdot > 0) & (pdot < inf) & (abs(period) < inf)',
+                   npfunc, npvalid, arrays, out, usenumexpr,
+                   constants={'factor': factor})
 
 
-def age_pdot(period, tau=1e6, braking_idx=3.):
+def age_pdot(period, tau=1e6, braking_idx=3., out=None, usenumexpr=False):
     """
     Function returning the period derivative for a pulsar with a given period
     and characteristic age, using
@@ -896,24 +2420,33 @@ def age_pdot(period, tau=1e6, braking_idx=3.):
         period (list, :class:`numpy.ndarray`): the pulsar period in seconds
         tau (float): the characteristic age in years
         braking_idx (float): the pulsar braking index (defaults to :math:`n=3`)
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
 
     Returns:
         :class:`numpy.ndarray`: an array of period derivatives.
     """
 
-    periods = period
-    if not isinstance(periods, np.ndarray):
-        periods = np.array(periods)
+    def npfunc(period, tau, out):
+        np.multiply(tau, YEAR_SECONDS*(braking_idx - 1.), out=out)
+        np.divide(period, out, out=out)
 
-    taus = tau*365.25*86400.  # tau in seconds
+    def npvalid(period, tau):
+        # set any negative values to NaN
+        with np.errstate(invalid='ignore'):
+            return ~(np.divide(period, tau) < 0.)
 
-    pdots = (periods/(taus * (braking_idx - 1.)))
-    pdots[pdots < 0] = np.nan  # set any non zero values to NaN
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('tau', _kernel_array(tau, 'yr'))])
 
-    return pdots
+    return _kernel('period / (tau * factor)', '(period / tau) >= 0',
+                   npfunc, npvalid, arrays, out, usenumexpr,
+                   constants={'factor': YEAR_SECONDS*(braking_idx - 1.)})
 
 
-def B_field(period, pdot):
+def B_field(period, pdot, out=None, usenumexpr=False):
     """
     Function defining the polar magnetic field strength at the surface of the
     pulsar in gauss (Equation 5.12 of Lyne & Graham-Smith, Pulsar Astronmy, 2nd
@@ -928,38 +2461,32 @@ def B_field(period, pdot):
     Args:
         period (float): a pulsar period (s)
         pdot (float): a period derivative
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
 
     Returns:
         float: the magnetic field strength in gauss.
     """
 
-    # try converting period and pdot to numpy arrays
-    try:
-        periodarr = np.array(period).flatten()
-        pdotarr = np.array(pdot).flatten()
-    except Exception as e:
-        raise ValueError("Could not convert period/pdot to "
-                         "array: {}".format(str(e)))
-
-    assert periodarr.dtype == np.float, "Periods must be floats"
-    assert pdotarr.dtype == np.float, "Period derivatives must be floats"
-    assert len(periodarr) == len(pdotarr), "Period and derivative arrays must be equal lengths"
+    def npfunc(period, pdot, out):
+        np.multiply(period, pdot, out=out)
+        np.sqrt(out, out=out)
+        np.multiply(out, 3.2e19, out=out)
 
-    # check pdot is positive, otherwise return NaN
-    bfield = np.full(len(periodarr), np.nan)
-    with np.errstate(invalid='ignore'):
-        idx = np.isfinite(pdotarr) & np.isfinite(periodarr) & (pdotarr > 0.)
-    bfield[idx] = 3.2e19 * np.sqrt(periodarr[idx] * pdotarr[idx])
+    def npvalid(period, pdot):
+        return (pdot > 0.) & np.isfinite(pdot) & np.isfinite(period)
 
-    # if period and period derivates were just floats return values rather
-    # than arrays
-    if isinstance(pdot, float) and isinstance(period, float):
-        return bfield[0]
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('pdot', _kernel_array(pdot))])
 
-    return bfield
+    return _kernel('3.2e19 * sqrt(period * pdot)',
+                   '(pdot > 0) & (pdot < inf) & (abs(period) < inf)',
+                   npfunc, npvalid, arrays, out, usenumexpr)
 
 
-def B_field_pdot(period, Bfield=1e10):
+def B_field_pdot(period, Bfield=1e10, out=None, usenumexpr=False):
     """
     Function to get the period derivative from a given pulsar period and
     magnetic field strength using
@@ -972,19 +2499,514 @@ def B_field_pdot(period, Bfield=1e10):
         period (list, :class:`~numpy.ndarray`): a list of period values
         Bfield (float): the polar magnetic field strength (Defaults to
             :math:`10^{10}` G)
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
 
     Returns:
         :class:`numpy.ndarray`: an array of period derivatives
     """
 
-    periods = period
-    if not isinstance(periods, np.ndarray):
-        periods = np.array(periods)
+    def npfunc(period, Bfield, out):
+        np.divide(Bfield, 3.2e19, out=out)
+        np.square(out, out=out)
+        np.divide(out, period, out=out)
+
+    def npvalid(period, Bfield):
+        # set any negative values to NaN
+        return ~(period < 0.)
+
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('Bfield', _kernel_array(Bfield, 'G'))])
+
+    return _kernel('(Bfield / 3.2e19)**2 / period', 'period >= 0',
+                   npfunc, npvalid, arrays, out, usenumexpr)
+
+
+def spin_down_luminosity(period, pdot, out=None, usenumexpr=False):
+    """
+    Function defining the spin-down luminosity of a pulsar in erg/s, assuming
+    a moment of inertia of :math:`10^{45}\\,{\\rm g}\\,{\\rm cm}^2`, using
+
+    .. math::
+
+       \\dot{E} = \\frac{4\\pi^2 I \\dot{P}}{P^3}
+
+    NaNs are returned for any negative period derivates, or NaN imput values.
+
+    Args:
+        period (float, array_like): the pulsar period in seconds
+        pdot (float, array_like): the pulsar period derivative
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
+
+    Returns:
+        float: the spin-down luminosity in erg/s
+    """
+
+    def npfunc(period, pdot, out):
+        np.power(period, 3, out=out)
+        np.divide(pdot, out, out=out)
+        np.multiply(out, 4.0 * np.pi**2 * 1e45, out=out)
+
+    def npvalid(period, pdot):
+        return (pdot > 0.) & np.isfinite(pdot) & np.isfinite(period)
+
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('pdot', _kernel_array(pdot))])
+
+    return _kernel('edotfac * pdot / period**3',
+                   '(pdot > 0) & (pdot < inf) & (abs(period) < inf)',
+                   npfunc, npvalid, arrays, out, usenumexpr,
+                   constants={'edotfac': 4.0 * np.pi**2 * 1e45})
+
+
+def spin_down_flux(period, pdot, dist, out=None, usenumexpr=False):
+    """
+    Function defining the spin-down luminosity flux of a pulsar at the Sun in
+    erg/s/kpc\\ :sup:`2`, i.e., :math:`\\dot{E}/d^2` (see
+    :func:`~psrqpy.utils.spin_down_luminosity`).
+
+    NaNs are returned for any non-positive periods, or NaN imput values.
+
+    Args:
+        period (float, array_like): the pulsar period in seconds
+        pdot (float, array_like): the pulsar period derivative
+        dist (float, array_like): the pulsar distance in kpc
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
+
+    Returns:
+        float: the spin-down luminosity flux in erg/s/kpc\\ :sup:`2`
+    """
+
+    def npfunc(period, pdot, dist, out):
+        np.power(period, 3, out=out)
+        np.divide(pdot, out, out=out)
+        np.divide(out, np.square(dist), out=out)
+        np.multiply(out, 4.0 * np.pi**2 * 1e45, out=out)
+
+    def npvalid(period, pdot, dist):
+        return ((period > 0.) & np.isfinite(pdot) & np.isfinite(period) &
+                np.isfinite(dist))
+
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('pdot', _kernel_array(pdot)),
+                          ('dist', _kernel_array(dist, 'kpc'))])
+
+    return _kernel('edotfac * (pdot / period**3) / dist**2',
+                   '(period > 0) & (period < inf) & (abs(pdot) < inf) & (abs(dist) < inf)',
+                   npfunc, npvalid, arrays, out, usenumexpr,
+                   constants={'edotfac': 4.0 * np.pi**2 * 1e45})
+
+
+def B_field_lc(period, pdot, out=None, usenumexpr=False):
+    """
+    Function defining the magnetic field strength at the light cylinder of a
+    pulsar in gauss, using
+
+    .. math::
+
+       B_{\\rm LC} = 3\\!\\times\\!10^{8} \\dot{P}^{1/2} P^{-5/2}
+
+    NaNs are returned for any negative period derivates, or NaN imput values.
+
+    Args:
+        period (float, array_like): the pulsar period in seconds
+        pdot (float, array_like): the pulsar period derivative
+        out (:class:`~numpy.ndarray`): an array in which to place the output.
+            This must have the broadcast shape of the inputs.
+        usenumexpr (bool): evaluate using :mod:`numexpr` if available.
+            Defaults to False.
+
+    Returns:
+        float: the magnetic field strength at the light cylinder in gauss
+    """
+
+    def npfunc(period, pdot, out):
+        np.abs(period, out=out)
+        np.power(out, -5./2., out=out)
+        np.multiply(out, np.sqrt(pdot), out=out)
+        np.multiply(out, 3.0e8, out=out)
+
+    def npvalid(period, pdot):
+        return (pdot > 0.) & np.isfinite(pdot) & np.isfinite(period)
+
+    arrays = OrderedDict([('period', _kernel_array(period, 's')),
+                          ('pdot', _kernel_array(pdot))])
+
+    return _kernel('3.0e8 * sqrt(pdot) * abs(period)**(-2.5)',
+                   '(pdot > 0) & (pdot < inf) & (abs(period) < inf)',
+                   npfunc, npvalid, arrays, out, usenumexpr)
+
+
+def companion_mass(massfn, sini=1., mpsr=1.35, tol=1e-12, maxiter=100):
+    """
+    Function returning the companion mass (in solar masses) for binary
+    systems with given mass functions, by solving
+
+    .. math::
+
+       (m_p + m_c)^2 = \\frac{(m_c \\sin{i})^3}{f(m)}
+
+    for all the systems at once.
+
+    NaNs are returned for any NaN or non-positive input values.
+
+    Args:
+        massfn (float, array_like): the mass function in solar masses
+        sini (float): the sine of the orbital inclination. Defaults to 1,
+            i.e., the minimum companion mass.
+        mpsr (float): the pulsar mass in solar masses. Defaults to 1.35.
+        tol (float): the relative tolerance of the solutions. Defaults to
+            :math:`10^{-12}`.
+        maxiter (int): the maximum number of iterations. Defaults to 100.
+
+    Returns:
+        :class:`numpy.ndarray`: the companion masses in solar masses
+    """
+
+    massfn = _kernel_array(massfn, 'M_sun')
+    mass = np.full(massfn.shape, np.nan)
+
+    idx = np.isfinite(massfn) & (massfn > 0.)
+    if not np.any(idx):
+        return mass
+
+    # solve h(m_c) = m_c sin(i) / f(m)^(1/3) - (m_p + m_c)^(2/3) = 0, which is
+    # convex with a single positive root, so Newton's method converges
+    # monotonically when starting from a value above the root
+    scale = sini/np.cbrt(massfn[idx])
+    mc = 2.*np.maximum(mpsr, 4.*massfn[idx]/sini**3)
+
+    for _ in range(maxiter):
+        root = np.cbrt(mpsr + mc)
+        step = (mc*scale - root**2)/(scale - (2./3.)/root)
+        mc -= step
+
+        if np.all(np.abs(step) <= tol*mc):
+            break
+
+    mass[idx] = mc
+
+    return mass
+
+
+#: the derived parameters for which uncertainties can be propagated using
+#: :func:`~psrqpy.utils.propagate_uncertainties`, and the parameters that they
+#: depend on
+MC_DERIVED = OrderedDict([('DIST', ['PX']),
+                          ('PMTOT', ['PMLONG', 'PMLAT']),
+                          ('VTRANS', ['PMTOT', 'DIST']),
+                          ('AGE', ['P0', 'P1']),
+                          ('BSURF', ['P0', 'P1']),
+                          ('B_LC', ['P0', 'P1']),
+                          ('EDOT', ['P0', 'P1']),
+                          ('EDOTD2', ['P0', 'P1', 'DIST']),
+                          ('P1_I', ['P0', 'P1', 'VTRANS', 'DIST']),
+                          ('AGE_I', ['P0', 'P1_I']),
+                          ('BSURF_I', ['P0', 'P1_I']),
+                          ('EDOT_I', ['P0', 'P1_I']),
+                          ('MASSFN', ['A1', 'PB']),
+                          ('MINMASS', ['MASSFN']),
+                          ('MEDMASS', ['MASSFN']),
+                          ('UPRMASS', ['MASSFN'])])
+
+# the parameters that are sampled from their values and uncertainties
+MC_INPUTS = ['P0', 'P1', 'PX', 'PMLONG', 'PMLAT', 'A1', 'PB']
+
+
+def _mc_derive(name, samples, dist):
+    """
+    Calculate a derived parameter from arrays of samples (following the
+    equivalent ``derived_`` methods of :class:`~psrqpy.search.QueryATNF`).
+    """
+
+    from astropy.constants import c, GM_sun
+
+    s = samples
+
+    if name == 'DIST':
+        # distances are only derived from parallaxes for some pulsars
+        value = np.empty(s['PX'].shape)
+        value[...] = dist['DIST'][:, np.newaxis]
+        pxdist = dist['PXDIST']
+        value[pxdist] = (149597870./30.857e12)*(60.*60.*180)/(s['PX'][pxdist]*np.pi)
+        return value
+    elif name == 'PMTOT':
+        return np.hypot(s['PMLONG'], s['PMLAT'])
+    elif name == 'VTRANS':
+        return (s['PMTOT'] * np.pi / (1000.0*3600.0*180.0*365.25*86400.0))*3.086e16*s['DIST']
+    elif name in ['AGE', 'AGE_I']:
+        return characteristic_age(s['P0'], s['P1' if name == 'AGE' else 'P1_I'])
+    elif name in ['BSURF', 'BSURF_I']:
+        return B_field(s['P0'], s['P1' if name == 'BSURF' else 'P1_I'])
+    elif name == 'B_LC':
+        return B_field_lc(s['P0'], s['P1'])
+    elif name in ['EDOT', 'EDOT_I']:
+        return spin_down_luminosity(s['P0'], s['P1' if name == 'EDOT' else 'P1_I'])
+    elif name == 'EDOTD2':
+        return spin_down_flux(s['P0'], s['P1'], s['DIST'])
+    elif name == 'P1_I':
+        return ((s['P1']/1.0e-15) - s['VTRANS']**2 * 1.0e10 * s['P0'] /
+                (s['DIST'] * 3.086e6)/2.9979e10) * 1.0e-15
+    elif name == 'MASSFN':
+        return ((4.*np.pi**2/GM_sun.value)*(s['A1']*c.value)**3 /
+                (s['PB']*86400.)**2)
+    else:
+        sini = {'MINMASS': 1.0, 'MEDMASS': 0.866025403,
+                'UPRMASS': 0.438371146}[name]
+        return companion_mass(s['MASSFN'], sini=sini)
+
+
+def _mc_chunk(args):
+    """
+    Propagate the uncertainties for a chunk of pulsars (see
+    :func:`~psrqpy.utils.propagate_uncertainties`). This takes a single tuple
+    of arguments so that it can be used with a process pool.
+    """
+
+    values, errors, dist, params, nsamples, quantiles, seed = args
+
+    rng = np.random.default_rng(seed)
+
+    samples = {}
+    haserr = {}
+
+    def derive(name):
+        if name in samples:
+            return
+
+        if name in MC_DERIVED:
+            for dep in MC_DERIVED[name]:
+                derive(dep)
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                samples[name] = _mc_derive(name, samples, dist)
+
+            haserr[name] = np.zeros(len(dist['DIST']), dtype=bool)
+            for dep in MC_DERIVED[name]:
+                haserr[name] |= haserr[dep]
+
+            if name == 'DIST':
+                haserr[name] &= dist['PXDIST']
+        else:
+            value = values[name]
+            error = errors[name]
+            haserr[name] = np.isfinite(error)
+            scale = np.where(haserr[name], error, 0.)
+            samples[name] = (value[:, np.newaxis] + scale[:, np.newaxis] *
+                             rng.standard_normal((len(value), nsamples)))
+
+    output = OrderedDict()
+    for name in params:
+        derive(name)
+
+        with warnings.catch_warnings():
+            # ignore warnings about pulsars with no valid samples
+            warnings.simplefilter('ignore', RuntimeWarning)
+            std = np.nanstd(samples[name], axis=1)
+            std[~haserr[name]] = np.nan
+            output[name+'_ERR'] = std
+
+            if len(quantiles) > 0:
+                qvalues = _mc_quantiles(samples[name], quantiles)
+                for q, qvalue in zip(quantiles, qvalues):
+                    qvalue[~haserr[name]] = np.nan
+                    output[_mc_quantile_name(name, q)] = qvalue
+
+    return output
+
+
+def _mc_quantiles(samples, quantiles):
+    """
+    Calculate quantiles of each row of a two-dimensional array of samples,
+    ignoring NaNs, with linear interpolation (the same as
+    :func:`numpy.nanpercentile`, but ordering all the rows at once).
+    """
+
+    nsamples = samples.shape[1]
+    nvalid = np.count_nonzero(~np.isnan(samples), axis=1)
+
+    # rows without NaNs only need partitioning about the required positions,
+    # while other rows are sorted (with NaNs sorted to the end)
+    full = nvalid == nsamples
+    kth = set()
+    for q in quantiles:
+        lower = int(np.floor(q*(nsamples - 1)))
+        kth.update([lower, min(lower + 1, nsamples - 1)])
+
+    ordered = np.empty(samples.shape)
+    ordered[full] = np.partition(samples[full], sorted(kth), axis=1)
+    ordered[~full] = np.sort(samples[~full], axis=1)
+
+    qvalues = np.full((len(quantiles), len(samples)), np.nan)
+    rows = np.flatnonzero(nvalid > 0)
+    ordered = ordered[rows]
+
+    for i, q in enumerate(quantiles):
+        position = q*(nvalid[rows] - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, nvalid[rows] - 1)
+        frac = position - lower
+
+        low = np.take_along_axis(ordered, lower[:, np.newaxis], axis=1)[:, 0]
+        high = np.take_along_axis(ordered, upper[:, np.newaxis], axis=1)[:, 0]
+        qvalues[i, rows] = low + frac*(high - low)
+
+    return qvalues
+
+
+def _mc_quantile_name(name, quantile):
+    """
+    The column name for a quantile of a parameter, e.g., ``AGE_Q2_5`` for
+    the 2.5% quantile of ``AGE``.
+    """
+
+    return '{}_Q{}'.format(name, '{:g}'.format(100.*quantile).replace('.', '_'))
+
+
+def propagate_uncertainties(table, params=None, nsamples=1000, quantiles=None,
+                            chunksize=256, nprocs=None, seed=None):
+    """
+    Propagate the uncertainties on catalogue parameters through to the
+    derived parameters (see :data:`~psrqpy.utils.MC_DERIVED`) using Monte
+    Carlo sampling. For each pulsar, samples of the period, period derivative,
+    parallax, proper motion, projected semi-major axis and binary period are
+    drawn from normal distributions with the catalogue values and their
+    uncertainties (any parameters without an uncertainty are held fixed).
+    The samples for all pulsars are passed through the derived parameter
+    calculations as (pulsars x samples) arrays, and their standard deviation
+    (and any requested quantiles) are returned. Samples that give invalid
+    values, e.g., a negative period derivative for the characteristic age, are
+    ignored.
+
+    The pulsars are processed in chunks, so that memory use is bounded by
+    the chunk size and number of samples, and the chunks can be processed in
+    parallel by a pool of processes.
+
+    Args:
+        table (:class:`pandas.DataFrame`): a table of pulsar data including
+            the parameter uncertainties.
+        params (str, list): the derived parameter(s) for which to propagate
+            the uncertainties. Defaults to None, in which case all the
+            parameters in :data:`~psrqpy.utils.MC_DERIVED` are used.
+        nsamples (int): the number of samples per pulsar. Defaults to 1000.
+        quantiles (list): a list of quantiles (between 0 and 1) to return,
+            e.g., ``[0.16, 0.5, 0.84]``. Defaults to None.
+        chunksize (int): the number of pulsars to sample at once. Defaults to
+            256.
+        nprocs (int): the number of processes with which to process the
+            chunks. Defaults to None, in which case the chunks are processed
+            in the current process.
+        seed (int): a seed for the random number generator. Defaults to
+            None. Results for a given seed do not depend on the number of
+            processes.
+
+    Returns:
+        :class:`pandas.DataFrame`: a table with the same index as `table`
+        with a ``PARAM_ERR`` column of the standard deviation for each
+        parameter, and, if requested, ``PARAM_Q<percent>`` columns (e.g.,
+        ``AGE_Q16`` or ``AGE_Q2_5``) for each quantile. Values are NaN for
+        pulsars where none of the parameters used have an uncertainty.
+
+    Example:
+        Get the 68% credible intervals on the characteristic age
+
+        >>> errs = propagate_uncertainties(table, 'AGE', quantiles=[0.16, 0.84])
+    """
+
+    from pandas import DataFrame
+
+    if params is None:
+        params = list(MC_DERIVED.keys())
+    elif isinstance(params, string_types):
+        params = [params]
+
+    params = [p.upper() for p in params]
+    for p in params:
+        if p not in MC_DERIVED:
+            raise KeyError("Uncertainties cannot be propagated for "
+                           "'{}'".format(p))
+
+    quantiles = [] if quantiles is None else list(quantiles)
+    for q in quantiles:
+        if not 0. <= q <= 1.:
+            raise ValueError("Quantiles must be between 0 and 1")
+
+    if nsamples < 2:
+        raise ValueError("At least two samples are required")
+
+    nrows = len(table)
+
+    def column(name):
+        if name in table.columns:
+            return np.asarray(table[name].values, dtype=float)
+        return np.full(nrows, np.nan)
+
+    values = {}
+    errors = {}
+    for name in ['P0', 'P1', 'PX', 'A1', 'PB']:
+        values[name] = column(name)
+        errors[name] = column(name+'_ERR')
+
+    # use the proper motion in equatorial coordinates, or ecliptic
+    # coordinates if not available (as in derived_pmtot)
+    for name, equatorial, ecliptic in [('PMLONG', 'PMRA', 'PMELONG'),
+                                       ('PMLAT', 'PMDEC', 'PMELAT')]:
+        values[name] = column(equatorial)
+        errors[name] = column(equatorial+'_ERR')
+        useecl = ~np.isfinite(values[name])
+        values[name][useecl] = column(ecliptic)[useecl]
+        errors[name][useecl] = column(ecliptic+'_ERR')[useecl]
+
+    # distances that are derived from parallaxes (as in define_dist)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pxsigma = np.abs(values['PX'])/errors['PX']
+    dist = {'DIST': column('DIST'),
+            'PXDIST': (pxsigma > 3.) & ~np.isfinite(column('DIST_A'))}
+
+    # each chunk has an independent random number stream
+    starts = list(range(0, nrows, chunksize))
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+
+    def tasks():
+        for start, chunkseed in zip(starts, seeds):
+            chunk = slice(start, start + chunksize)
+            yield ({name: values[name][chunk] for name in MC_INPUTS},
+                   {name: errors[name][chunk] for name in MC_INPUTS},
+                   {name: dist[name][chunk] for name in dist},
+                   params, nsamples, quantiles, chunkseed)
+
+    if nprocs is not None and nprocs > 1 and len(starts) > 1:
+        from multiprocessing import Pool
+
+        pool = Pool(min(nprocs, len(starts)))
+        try:
+            results = pool.map(_mc_chunk, tasks())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_mc_chunk(task) for task in tasks()]
 
-    pdots = (Bfield/3.2e19)**2/periods
-    pdots[pdots < 0] = np.nan  # set any non zero values to NaN
+    colnames = []
+    for name in params:
+        colnames.append(name+'_ERR')
+        colnames.extend([_mc_quantile_name(name, q) for q in quantiles])
+
+    output = OrderedDict()
+    for colname in colnames:
+        if len(results) > 0:
+            output[colname] = np.concatenate([r[colname] for r in results])
+        else:
+            output[colname] = np.array([], dtype=float)
 
-    return pdots
+    return DataFrame(output, index=table.index)
 
 
 def death_line(logP, linemodel='Ip', rho6=1.):
@@ -1120,3 +3142,194 @@ def label_line(ax, line, label, color='k', fs=14, frachoffset=0.1):
     text.set_rotation(slope_degrees)
     ax.set_ylim(ylim)
     return text
+
+
+class PPdotTemplate(object):
+    """
+    A template for period vs. period derivative diagrams (see
+    :meth:`~psrqpy.search.QueryATNF.ppdot`). This creates the static
+    background of the diagram (the death line, lines of constant
+    characteristic age and magnetic field strength, and their labels) for
+    given axis limits once. Each call to
+    :meth:`~psrqpy.utils.PPdotTemplate.figure` returns a new copy of the
+    background figure onto which pulsars can be plotted, so making many
+    diagrams only requires drawing the pulsars themselves.
+
+    Args:
+        periodlims (array_like): the [min, max] period limits.
+        pdotlims (array_like): the [min, max] period derivative limits.
+        deathline (bool): draw the pulsar death line. Defaults to True.
+        deathmodel (str): the type of death line to draw based on the
+            models in :func:`psrqpy.utils.death_line`. Defaults to ``'Ip'``.
+        filldeath (bool): set whether to fill the pulsar graveyard under the
+            death line. Defaults to True.
+        filldeathtype (dict): a dictionary of keyword arguments for the fill
+            style of the pulsar graveyard.
+        showtau (bool): show lines for a selection of characteritic ages.
+            Defaults to True.
+        brakingidx (int): a braking index to use for the calculation of the
+            characteristic age lines. Defaults to 3.
+        tau (list): a list of characteristic ages to show on the plot.
+        showB (bool): show lines of constant magnetic field strength.
+            Defaults to True.
+        Bfield (list): a list of magnetic field strengths to plot.
+        rcparams (dict): a dictionary of :py:obj:`matplotlib.rcParams` setup
+            parameters for the plot. These are only applied while the figure
+            is being created, so the global parameters are not changed.
+
+    Example:
+        Create diagrams for pulsars in and outside of globular clusters with
+        the same background
+
+        >>> from psrqpy import QueryATNF
+        >>> from psrqpy.utils import PPdotTemplate
+        >>> template = PPdotTemplate([1e-3, 1e2], [1e-22, 1e-9])
+        >>> gcs = QueryATNF(assoc='GC')
+        >>> fig1 = gcs.ppdot(template=template)
+        >>> nongcs = QueryATNF(condition='!ASSOC(GC)')
+        >>> fig2 = nongcs.ppdot(template=template)
+    """
+
+    #: default :py:obj:`matplotlib.rcParams` for the diagram
+    RCPARAMS = {'figure.figsize': (9, 9.5),
+                'figure.dpi': 250,
+                'text.usetex': True,
+                'axes.linewidth': 0.5,
+                'axes.grid': False,
+                'font.family': 'sans-serif',
+                'font.sans-serif': 'Avant Garde, Helvetica, Computer Modern Sans serif',
+                'font.size': 20,
+                'legend.fontsize': 16,
+                'legend.frameon': False}
+
+    def __init__(self, periodlims, pdotlims, deathline=True, deathmodel='Ip',
+                 filldeath=True, filldeathtype=None, showtau=True,
+                 brakingidx=3, tau=None, showB=True, Bfield=None,
+                 rcparams=None):
+        self.periodlims = list(periodlims)
+        self.pdotlims = list(pdotlims)
+
+        self.rcparams = dict(self.RCPARAMS)
+        if rcparams:
+            self.rcparams.update(rcparams)
+
+        # death line
+        self.deathpdots = None
+        self.filldeathtype = None
+        if deathline:
+            self.deathpdots = 10**death_line(np.log10(self.periodlims),
+                                             linemodel=deathmodel)
+
+            if filldeath:
+                self.filldeathtype = {'linestyle': '-', 'alpha': 0.15,
+                                      'facecolor': 'darkorange', 'hatch': ''}
+                if filldeathtype:
+                    self.filldeathtype.update(filldeathtype)
+
+        # characteristic age lines
+        self.taulines = []
+        if showtau:
+            taus = [1e5, 1e6, 1e7, 1e8, 1e9] if tau is None else tau
+            for tauv in taus:
+                pdots_tc = age_pdot(self.periodlims, tau=tauv,
+                                    braking_idx=brakingidx)
+                self.taulines.append((pdots_tc, self._label(tauv, r'yr')))
+
+        # magnetic field lines
+        self.Blines = []
+        if showB:
+            Bs = [1e10, 1e11, 1e12, 1e13, 1e14] if Bfield is None else Bfield
+            for B in Bs:
+                pdots_B = B_field_pdot(self.periodlims, Bfield=B)
+                self.Blines.append((pdots_B, self._label(B, r'G')))
+
+        self._figure = None  # pickled background figure
+
+    @staticmethod
+    def _label(value, unit):
+        """
+        Create the label for a line of constant characteristic age or
+        magnetic field.
+        """
+
+        # check if values are powers of 10
+        power = int(np.floor(np.log10(value)))
+        numv = value/10**power
+        if numv == 1.:
+            return r'$10^{{{0:d}}}\,{{\rm {1}}}$'.format(power, unit)
+        else:
+            return r'${{{0:.1f}}}\!\times\!10^{{{1:d}}}\,{{\rm {2}}}$'.format(numv, power, unit)
+
+    def _draw(self):
+        """
+        Create the background figure.
+        """
+
+        from matplotlib import pyplot as pl
+
+        fig, ax = pl.subplots()
+
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel(r'Period (s)')
+        ax.set_ylabel(r'Period Derivative')
+        ax.set_xlim(self.periodlims)
+        ax.set_ylim(self.pdotlims)
+
+        if self.deathpdots is not None:
+            ax.loglog(self.periodlims, self.deathpdots, 'k--', linewidth=0.5)
+
+            if self.filldeathtype is not None:
+                ax.fill_between(self.periodlims, self.deathpdots,
+                                self.pdotlims[0], **self.filldeathtype)
+
+        tlines = [(ax.loglog(self.periodlims, pdots, 'k-.', linewidth=0.5)[0], label)
+                  for pdots, label in self.taulines]
+        Blines = [(ax.loglog(self.periodlims, pdots, 'k:', linewidth=0.5)[0], label)
+                  for pdots, label in self.Blines]
+
+        fig.tight_layout()
+
+        # add text for characteristic age lines and magnetic field strength lines
+        for line, label in tlines:
+            _ = label_line(ax, line, label, color='k', fs=18, frachoffset=0.05)
+
+        for line, label in Blines:
+            _ = label_line(ax, line, label, color='k', fs=18, frachoffset=0.90)
+
+        return fig, ax
+
+    def figure(self):
+        """
+        Return a new copy of the background figure.
+
+        Returns:
+            tuple: the :class:`matplotlib.figure.Figure` and its
+            :class:`matplotlib.axes.Axes`.
+        """
+
+        try:
+            import matplotlib as mpl
+            from matplotlib import pyplot as pl
+        except ImportError:
+            raise ImportError('Cannot produce P-Pdot plot as Matplotlib is '
+                              'not available')
+
+        from six.moves import cPickle as pickle
+
+        if self._figure is None:
+            with mpl.rc_context(self.rcparams):
+                fig, ax = self._draw()
+
+            # store the figure so that copies can be made from it
+            self._figure = pickle.dumps(fig, protocol=pickle.HIGHEST_PROTOCOL)
+            pl.close(fig)
+
+        fig = pickle.loads(self._figure)
+
+        return fig, fig.axes[0]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_figure'] = None  # the figure is recreated when required
+        return state
@@ -230,6 +230,42 @@ def test_condition(query):
     query.condition = None
 
 
+def test_batch_condition(query_derived):
+    """
+    Test evaluating multiple conditions at once.
+    """
+
+    from pandas import DataFrame
+    from psrqpy.utils import batch_condition, condition
+
+    table = DataFrame({'JNAME': ['A', 'B', 'C', 'D'],
+                       'F0': [1., 200., np.nan, 50.],
+                       'TYPE': ['HE', 'NRAD', np.nan, 'HE[abc+01]'],
+                       'ASSOC': ['GC:47Tuc', np.nan, 'SNR', 'GC'],
+                       'BINARY': [np.nan, 'BT', np.nan, 'ELL1']})
+
+    conds = ['type(HE)', 'type(HE) && type(binary)', 'assoc(GC) || F0 > 100',
+             'not type(HE)', 'F0 > 10']
+    masks = batch_condition(table, conds)
+
+    assert masks.shape == (len(conds), len(table))
+
+    # check against applying each condition individually
+    for cond, mask in zip(conds, masks):
+        assert np.all(table['JNAME'][mask] == condition(table, cond)['JNAME'])
+
+    counts = batch_condition(table, conds, counts=True)
+    assert np.all(counts == masks.sum(axis=1))
+
+    # non-existent parameters return no pulsars
+    assert not np.any(batch_condition(table, 'exist(PX)'))
+
+    # use the QueryATNF method
+    counts = query_derived.batch_condition(['F0 > 1', 'F0 > 100', 'exist(PB)'],
+                                           counts=True)
+    assert np.all(counts == [2, 1, 2])
+
+
 def test_num_pulsars(query):
     """
     Test that the number of pulsars returned is as expected.
@@ -769,3 +805,1265 @@ def test_sort_exception(query):
 
     # reset sort key
     query.sort_key = curkey
+
+
+def test_sort_multiple():
+    """
+    Test sorting on multiple parameters, the sort cache and top-k selection.
+    """
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0'], sort_attr='F0',
+                      sort_order='desc')
+
+    # sort attribute given on creation is used
+    assert query.sort_key == 'F0'
+    assert query.pandas['JNAME'].tolist() == ['TEST1', 'TEST2', 'TEST3',
+                                              'TEST4']
+
+    # missing values are placed last and ties sorted on second key
+    sortedtab = query.sort(['F0', 'JNAME'], ['asc', 'desc'])
+    assert sortedtab['JNAME'].tolist() == ['TEST2', 'TEST1', 'TEST4', 'TEST3']
+    assert query.sort_key == ['F0', 'JNAME']
+
+    # cached order is reused until the catalogue changes
+    order = query._sort_permutation(['F0', 'JNAME'], [True, False])
+    assert query._sort_permutation(['F0', 'JNAME'], [True, False]) is order
+    query.update(np.arange(query.catalogue_len), name='NEWCOL')
+    assert query._sort_permutation(['F0', 'JNAME'], [True, False]) is not order
+
+    top = query.top(1, 'F0')
+    assert len(top) == 1 and top['JNAME'][0] == 'TEST1'
+    assert len(query.top(np.int64(2), 'F0')) == 2
+
+    with pytest.raises(ValueError):
+        query.top(0)
+
+    # sort the stored catalogue in place
+    version = query.get_version
+    query.sort('F0', 'asc', inplace=True)
+    assert query.catalogue['JNAME'].tolist()[:2] == ['TEST2', 'TEST1']
+    assert query.get_version == version
+
+
+def test_iter_batches():
+    """
+    Test iterating over query results in batches and rows.
+    """
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db', condition='F0 > 1')
+
+    df = query.pandas
+    batches = list(query.iter_batches(chunksize=1))
+    assert len(batches) == len(df)
+    for i, batch in enumerate(batches):
+        assert batch.index[0] == i
+        assert batch['JNAME'].iloc[0] == df['JNAME'][i]
+
+    arrays = list(query.iter_batches(chunksize=5, astype='numpy'))
+    assert len(arrays) == 1
+    assert np.array_equal(arrays[0]['F0'], df['F0'].values)
+
+    rows = list(query.iter_rows(chunksize=1))
+    assert [row['JNAME'] for row in rows] == df['JNAME'].tolist()
+
+    with pytest.raises(ValueError):
+        query.iter_batches(chunksize=0)
+
+    # NumPy integer chunk sizes are allowed
+    batches = list(query.iter_batches(chunksize=np.int64(len(df) // 2)))
+    assert sum(len(batch) for batch in batches) == len(df)
+
+    # error columns missing from the catalogue raise the same error as pandas
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0', 'S400'])
+    assert 'S400_ERR' not in query.columns
+
+    with pytest.raises(KeyError):
+        query.pandas
+
+    for astype in ['pandas', 'numpy']:
+        with pytest.raises(KeyError):
+            query.iter_batches(astype=astype)
+
+
+def test_as_array():
+    """
+    Test exporting the query as arrays.
+    """
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0'], psrs=['TEST2', 'TEST3'])
+
+    array = query.as_array()
+    assert isinstance(array, np.ma.MaskedArray)
+    assert array['JNAME'].tolist() == ['TEST2', 'TEST3']
+    assert array['F0'].mask.tolist() == [False, True]
+
+    array = query.as_array(masked=False)
+    assert not isinstance(array, np.ma.MaskedArray)
+    assert np.isnan(array['F0'][1])
+
+    # contiguous rows give views of the catalogue
+    arrays = query.as_dict()
+    assert np.shares_memory(arrays['F0'], query.catalogue['F0'].values)
+    assert arrays['F0'][0] == array['F0'][0]
+
+    query.sort_key = 'F0'
+    query.psrs = None
+    arrays = query.as_dict(masked=True)
+    assert arrays['JNAME'].tolist() == ['TEST2', 'TEST1', 'TEST3', 'TEST4']
+    assert arrays['F0'].mask.tolist() == [False, False, True, True]
+
+
+def test_arrow(tmp_path):
+    """
+    Test exporting to, and creating a query from, Arrow tables.
+    """
+
+    pa = pytest.importorskip('pyarrow')
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0'], condition='F0 > 1')
+
+    table = query.to_arrow()
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == 2
+    assert pa.types.is_dictionary(table.schema.field('JNAME').type)
+    assert table.column('F0').to_pylist() == query.pandas['F0'].tolist()
+
+    fname = str(tmp_path / 'catalogue.feather')
+    query.to_feather(fname, selected=False)
+
+    newquery = QueryATNF(fromarrow=fname)
+    assert newquery.catalogue.shape == query.catalogue.shape
+    assert newquery.catalogue['JNAME'].tolist() == query.catalogue['JNAME'].tolist()
+    assert np.array_equal(newquery.catalogue['F0'].values,
+                          query.catalogue['F0'].values, equal_nan=True)
+
+    # exports use the stored Arrow table until the catalogue changes
+    table = query.to_arrow(selected=False, dictionary=False)
+    newquery = QueryATNF(fromarrow=table, params=['JNAME', 'F0'], condition='F0 > 1')
+    exported = newquery.to_arrow(selected=False, dictionary=False)
+    assert exported.column('F0').chunk(0).buffers()[1].address == \
+        table.column('F0').chunk(0).buffers()[1].address
+    assert newquery.to_arrow().equals(query.to_arrow())
+
+    newquery.update(2 * newquery.catalogue['F0'], name='F0', overwrite=True)
+    exported = newquery.to_arrow(selected=False)
+    assert exported.column('F0').to_pylist()[0] == 2 * table.column('F0').to_pylist()[0]
+
+
+def test_pulsar_row_cache():
+    """
+    Test that a Pulsar fetches its catalogue row once.
+    """
+
+    from psrqpy.pulsar import Pulsar
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db')
+    psr = Pulsar('TEST2', query=query)
+
+    values = psr.prefetch(['F0', 'P0'])
+    assert values['F0'] == query.catalogue['F0'][1]
+
+    row = psr._row
+    assert psr['F0_ERR'] == query.catalogue['F0_ERR'][1]
+    assert psr.PB is np.ma.masked
+    assert psr._row is row  # no refetch
+
+    # a single row table keeps masked columns for missing values
+    psrrow = query.get_pulsar('TEST2')
+    assert psrrow['PB'].mask[0]
+
+    # changes to the catalogue cause a refetch
+    query.update(2 * query.catalogue['F0'], name='F0', overwrite=True)
+    assert psr.F0 == 2 * values['F0']
+
+    with pytest.raises(Exception):
+        Pulsar('TEST5', query=query)['F0']
+
+
+def test_pulsars_columns():
+    """
+    Test the column backed Pulsars object.
+    """
+
+    from psrqpy.pulsar import Pulsar, PulsarRow
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0'], condition='F0 > 1')
+    psrs = query.get_pulsars()
+
+    assert len(psrs) == 2
+    assert sorted(query.query_params) == ['F0', 'JNAME']  # query is unchanged
+    assert np.array_equal(psrs['F0'], query.pandas['F0'].values)
+
+    psr = psrs['TEST2']
+    assert isinstance(psr, PulsarRow)
+    assert psr == Pulsar('TEST2')
+    assert psr.F0 == query.catalogue['F0'][1]
+    assert psr.PB is np.ma.masked
+
+    # rows are found again after the catalogue is re-sorted
+    query.sort('F0', 'asc', inplace=True)
+    assert psrs['JNAME'].tolist() == ['TEST1', 'TEST2']
+    assert psr.F0 == query.pandas['F0'][0]
+
+    psrs.add_pulsar(Pulsar('TEST5', F0=1.))
+    assert psrs['F0'][-1] == 1.
+
+    popped = psrs.pop('TEST1')
+    assert popped.F0 > 100. and len(psrs) == 2
+
+
+def test_shared_catalogue():
+    """
+    Test the process-wide shared catalogue.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    from psrqpy import shared_catalogue, evict_shared_catalogue
+
+    dbfile = 'test/test_catalogue.db'
+
+    with ThreadPoolExecutor(4) as executor:
+        queries = list(executor.map(lambda i: shared_catalogue(dbfile),
+                                    range(8)))
+
+    assert all([q is queries[0] for q in queries])
+
+    query = QueryATNF(loadfromdb=dbfile, shared=True, condition='F0 > 1')
+    assert query.catalogue is queries[0].catalogue
+    assert len(query) == 2
+
+    # updating the catalogue does not change the shared catalogue
+    query.update(np.ones(query.catalogue_len), name='NEWCOL')
+    assert 'NEWCOL' not in queries[0].columns
+    assert query.catalogue is not queries[0].catalogue
+
+    # the catalogue lock is kept when the catalogue is evicted
+    from psrqpy.search import _SHARED_LOCKS, _shared_key
+    lock = _SHARED_LOCKS[_shared_key(dbfile)]
+
+    evict_shared_catalogue(dbfile)
+    assert shared_catalogue(dbfile) is not queries[0]
+    evict_shared_catalogue(everything=True)
+    assert _SHARED_LOCKS[_shared_key(dbfile)] is lock
+
+    # no lock is kept for a catalogue that fails to load
+    nlocks = len(_SHARED_LOCKS)
+    with pytest.raises(IOError):
+        shared_catalogue('test/no_catalogue.db')
+    assert len(_SHARED_LOCKS) == nlocks
+
+
+def test_write_ephemerides(tmp_path):
+    """
+    Test writing out ephemerides for multiple pulsars.
+    """
+
+    import tarfile
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db', condition='F0 > 1')
+
+    ephem = query.get_ephemeris('TEST1', precision=5)
+    assert 'F0        327.84702      \t7.00000e-13\n' in ephem
+    assert 'DM        14.32810       \t0.00004\n' in ephem
+    assert 'BINARY    ELL1\n' in ephem
+
+    outdir = str(tmp_path / 'pars')
+    files = query.write_ephemerides(outdir=outdir, precision=5, nthreads=2)
+    assert [os.path.basename(f) for f in files] == ['TEST1.par', 'TEST2.par']
+    with open(files[0], 'r') as fp:
+        assert fp.read() == ephem
+
+    archive = str(tmp_path / 'pars.tar.gz')
+    names = query.write_ephemerides(archive=archive, chunksize=1)
+    with tarfile.open(archive) as tar:
+        assert tar.getnames() == names
+        assert tar.extractfile('TEST2.par').read().decode() == query.get_ephemeris('TEST2')
+
+    with pytest.raises(ValueError):
+        query.write_ephemerides()
+
+
+def test_save_load_columns(tmp_path):
+    """
+    Test saving and loading a query with the columnar file format.
+    """
+
+    from pandas.testing import assert_frame_equal
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                      params=['JNAME', 'F0'], condition='F0 > 1',
+                      sort_attr='F0', sort_order='desc')
+    psrs = query.get_pulsars()
+
+    testfile = str(tmp_path / 'query.psrqpy')
+    query.save(testfile)
+    assert query.get_pulsars() is psrs  # saving does not change the query
+
+    querynew = QueryATNF(loadquery=testfile)
+    assert_frame_equal(querynew.catalogue, query.catalogue)
+    assert_frame_equal(querynew.pandas, query.pandas)
+    assert querynew.sort_key == 'F0' and querynew.condition == 'F0 > 1'
+    assert querynew._pulsars is None  # pulsars are created when required
+    assert len(querynew.get_pulsars()) == 2
+
+    # old pickle files can still be loaded
+    testfile = str(tmp_path / 'query.pkl')
+    query.save(testfile, legacy=True)
+    querynew = QueryATNF(loadquery=testfile)
+    assert_frame_equal(querynew.pandas, query.pandas)
+
+
+def test_catalogue_bundle(tmp_path, monkeypatch):
+    """
+    Test that the catalogue tarball is only extracted once.
+    """
+
+    import io
+    import shutil
+    import tarfile
+    import psrqpy.utils
+
+    # create a fake catalogue tarball
+    tarball = str(tmp_path / 'psrcat_pkg.tar.gz')
+    refs = (b'***abc+01 Author, A., 2001: ApJ, 1, 1\n'
+            b'***def+02 Author, B., 2002: ApJ, 2, 2\n')
+    with open('test/test_catalogue.db', 'rb') as fp:
+        db = fp.read()
+
+    with tarfile.open(tarball, 'w:gz') as tar:
+        for name, data in [('psrcat_tar/psrcat.db', db),
+                           ('psrcat_tar/psrcat_ref', refs)]:
+            info = tarfile.TarInfo(name=name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    monkeypatch.setenv('PSRQPY_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(psrqpy.utils, 'download_file',
+                        lambda url, cache=True, stats=None: tarball)
+
+    opened = []
+    tarfileopen = tarfile.open
+
+    def countopen(*args, **kwargs):
+        opened.append(args[0])
+        return tarfileopen(*args, **kwargs)
+
+    monkeypatch.setattr(tarfile, 'open', countopen)
+
+    catalogue = psrqpy.utils.get_catalogue(pandas=True)
+    refs = psrqpy.utils.get_references()
+    catalogue2 = psrqpy.utils.get_catalogue(pandas=True)
+
+    assert len(opened) == 1
+    assert len(catalogue) == len(catalogue2) == 4
+    assert refs['abc+01'].strip() == 'ApJ, 1, 1'
+    assert os.path.isfile(psrqpy.utils.extract_bundle(tarball)['psrcat.db'])
+
+    # in-flight extractions of other processes, and recently used versions,
+    # are kept when a new version is extracted
+    bundlesdir = tmp_path / 'cache' / 'bundles'
+    (bundlesdir / 'tmpinflight').mkdir()
+    stale = bundlesdir / ('a' * 40)
+    recent = bundlesdir / ('b' * 40)
+    stale.mkdir()
+    recent.mkdir()
+    os.utime(str(stale), (0, 0))
+
+    olddir = os.path.dirname(psrqpy.utils.extract_bundle(tarball)['psrcat.db'])
+    newtarball = str(tmp_path / 'psrcat_pkg_new.tar.gz')
+    shutil.copy(tarball, newtarball)
+    paths = psrqpy.utils.extract_bundle(newtarball)
+    newdir = os.path.dirname(paths['psrcat.db'])
+    assert os.path.isfile(paths['psrcat.db'])
+    assert sorted(os.listdir(str(bundlesdir))) == sorted(
+        [os.path.basename(olddir), os.path.basename(newdir), 'b' * 40, 'tmpinflight'])
+
+    # losing the race to move the files into place uses the winner's files
+    names = list(paths)
+    tmpdir = bundlesdir / 'tmplost'
+    tmpdir.mkdir()
+    psrqpy.utils._move_bundle(str(tmpdir), newdir, names)
+    assert not tmpdir.exists() and os.path.isfile(paths['psrcat.db'])
+
+    # without caching a single temporary directory is used and removed on exit
+    registered = []
+    monkeypatch.setattr(psrqpy.utils.atexit, 'register',
+                        lambda func, *args: registered.append(args[0]))
+    shutil.copy(tarball, str(tmp_path / 'psrcat_pkg_tmp.tar.gz'))
+    paths = psrqpy.utils.extract_bundle(str(tmp_path / 'psrcat_pkg_tmp.tar.gz'), cache=False)
+    assert len(registered) == 1
+    assert all([os.path.dirname(path) == registered[0] for path in paths.values()])
+    shutil.rmtree(registered[0])
+
+
+def test_resolve_ads_references(tmp_path):
+    """
+    Test concurrent ADS reference resolution with a persistent cache, using a
+    local server in place of the ADS API.
+    """
+
+    import json
+    import threading
+    from six.moves import BaseHTTPServer
+    from psrqpy.utils import ADSSearch, resolve_ads_references
+    from psrqpy.config import ADS_URL
+
+    pytest.importorskip('ads')
+
+    requested = []
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            if len(requested) == 1:
+                # fail the first request to check it is retried
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            docs = [] if 'Nobody' in self.path else [{'bibcode': '2001ApJ...1....1A'}]
+            body = json.dumps({'responseHeader': {'status': 0, 'params': {'rows': '1'}},
+                               'response': {'numFound': len(docs), 'start': 0,
+                                            'docs': docs}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        searcher = ADSSearch(url='http://127.0.0.1:{}/search'.format(server.server_port),
+                             token='dummy')
+        refdic = {'abc+01': 'Author, A., Other, B. & Third, C., 2001. A title. ApJ, 1, 1',
+                  'nob+02': 'Nobody, N., 2002. Missing paper. ApJ, 2, 2'}
+        cachefile = str(tmp_path / 'ads.json')
+
+        adsrefs = resolve_ads_references(refdic, searcher=searcher, rate=None,
+                                         backoff=0.01, cachefile=cachefile)
+        assert adsrefs == {'abc+01': ADS_URL.format('2001ApJ...1....1A')}
+        assert len(requested) == 3
+
+        # cached entries (including those not found) are not searched again
+        refdic['ghi+03'] = 'Author, A., 2003. Another title. ApJ, 3, 3'
+        adsrefs = resolve_ads_references(refdic, searcher=searcher, rate=None,
+                                         cachefile=cachefile)
+        assert len(requested) == 4
+        assert sorted(adsrefs.keys()) == ['abc+01', 'ghi+03']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # searches that keep failing give a warning, and other errors are raised
+    import requests
+
+    def failing(year, author, title):
+        raise requests.ConnectionError('no connection')
+
+    def broken(year, author, title):
+        raise ValueError('bad search')
+
+    refdic['jkl+04'] = 'Author, A., 2004. A new title. ApJ, 4, 4'
+    with pytest.warns(UserWarning, match='jkl\\+04'):
+        adsrefs = resolve_ads_references(refdic, searcher=failing, rate=None,
+                                         backoff=0.001, cachefile=cachefile)
+    assert 'jkl+04' not in adsrefs
+
+    with pytest.raises(ValueError):
+        resolve_ads_references(refdic, searcher=broken, rate=None,
+                               cachefile=cachefile)
+
+
+def test_resolve_refs(tmp_path):
+    """
+    Test converting reference tag columns into reference strings.
+    """
+
+    dbfile = tmp_path / 'refs.db'
+    dbfile.write_text(u'PSRJ     TEST1\n'
+                      u'F0       327.8      7     abc+01\n'
+                      u'F1       -1.2E-15   4     def+02\n'
+                      u'@-----------------------------------------------------------------\n'
+                      u'PSRJ     TEST2\n'
+                      u'F0       3.1        3     ghi+03\n'
+                      u'F1       -1.4E-16   4     abc+01\n'
+                      u'@-----------------------------------------------------------------\n'
+                      u'PSRJ     TEST3\n'
+                      u'F0       1.2        5     xyz+99\n'
+                      u'@-----------------------------------------------------------------\n')
+
+    query = QueryATNF(params=['F0', 'F1'], include_refs=True,
+                      loadfromdb=str(dbfile))
+
+    # set dummy references (not including xyz+99)
+    query._refs = {'abc+01': 'Ref A', 'def+02': 'Ref D', 'ghi+03': 'Ref G'}
+    query._adsrefs = {'abc+01': 'https://ads/A'}
+
+    refs = query.resolve_refs(useads=True)
+
+    assert sorted(refs.columns) == ['F0_REFSTR', 'F0_REFURL', 'F1_REFSTR', 'F1_REFURL']
+    assert list(refs['F0_REFSTR']) == ['Ref A', 'Ref G', None]
+    assert list(refs['F1_REFSTR']) == ['Ref D', 'Ref A', None]
+    assert list(refs['F1_REFURL']) == [None, 'https://ads/A', None]
+
+    tags = query.pandas['F0_REF']
+    assert list(zip(refs['F0_REFSTR'], refs['F0_REFURL'])) == query.parse_ref(tags, useads=True)
+
+    refs = query.resolve_refs('F1', selected=False)
+    assert list(refs.columns) == ['F1_REFSTR']
+    assert len(refs) == query.catalogue_len
+
+    # replacing the references gives a new lookup table
+    query._refs = {'abc+01': 'New A', 'ghi+03': 'New G'}
+    query._adsrefs = None
+    refs = query.resolve_refs('F0')
+    assert list(refs['F0_REFSTR']) == ['New A', 'New G', None]
+
+    with pytest.raises(KeyError):
+        query.resolve_refs('PB')
+
+
+def test_reference_index(tmp_path):
+    """
+    Test the inverted index of references.
+    """
+
+    from psrqpy.utils import ReferenceIndex
+
+    dbfile = tmp_path / 'refs.db'
+    dbfile.write_text(u'PSRJ     TEST1\n'
+                      u'F0       327.8      7     hlk+04\n'
+                      u'F1       -1.2E-15   4     mnm+10\n'
+                      u'@-----------------------------------------------------------------\n'
+                      u'PSRJ     TEST2\n'
+                      u'F0       3.1        3     mnm+10\n'
+                      u'F1       -1.4E-16   4     hlk+04\n'
+                      u'@-----------------------------------------------------------------\n'
+                      u'PSRJ     TEST3\n'
+                      u'F0       1.2        5     lm04\n'
+                      u'@-----------------------------------------------------------------\n')
+
+    query = QueryATNF(loadfromdb=str(dbfile))
+    query._refs = {'hlk+04': ('Hobbs, G., Lyne, A. G., Kramer, M., Martin, C. E. & Jordan, C., '
+                              '2004. Long-term timing observations of 374 pulsars. MNRAS, 353, '
+                              '1311-1344.'),
+                   'mnm+10': ('Müller, A., Ng, C. & Hobbs, G., 2010a. Timing noise in young '
+                              'pulsars. ApJ, 1, 1.'),
+                   'lm04': ('Lorimer, D. R. & Kramer, M., 2004. Handbook of pulsar astronomy. '
+                            'Cambridge University Press.')}
+
+    index = query.get_reference_index()
+    assert query.get_reference_index() is index
+
+    assert index.search(author='Hobbs') == ['hlk+04', 'mnm+10']
+    assert index.search(author='hobbs', firstauthor=True) == ['hlk+04']
+    assert index.search(author='Muller', year=2010) == ['mnm+10']
+    assert index.search(author='Ng') == ['mnm+10']
+    assert index.search(author=['Kramer', 'Lyne']) == ['hlk+04']
+    assert index.search(year='2004') == ['hlk+04', 'lm04']
+    assert index.search(title='timing pulsars') == ['hlk+04', 'mnm+10']
+    assert index.search(author='Nobody') == []
+
+    cites = index.citations(author='Hobbs', year=2004)
+    # derived parameters (P0 and P1) share the references
+    assert sorted(zip(cites['NAME'], cites['PARAM'])) == [('TEST1', 'F0'), ('TEST1', 'P0'),
+                                                          ('TEST2', 'F1'), ('TEST2', 'P1')]
+    assert set(cites['REF']) == {'hlk+04'}
+
+    assert index.pulsars(author='Kramer', year=2004) == ['TEST1', 'TEST2', 'TEST3']
+    assert index.pulsars('lm04') == ['TEST3']
+    assert index.pulsars('notatag') == []
+
+    assert isinstance(index, ReferenceIndex)
+
+    # replacing the references gives a new index
+    query._refs = {'lm04': query._refs['lm04']}
+    newindex = query.get_reference_index()
+    assert newindex is not index
+    assert newindex.search(author='Hobbs') == []
+
+
+def test_glitch_table_cache(tmp_path, monkeypatch):
+    """
+    Test parsing and caching the glitch table from a local server.
+    """
+
+    import threading
+    from six.moves import BaseHTTPServer
+    from psrqpy.utils import get_glitch_catalogue
+
+    monkeypatch.setenv('PSRQPY_CACHE_DIR', str(tmp_path))
+
+    with open(os.path.join(os.path.dirname(__file__), 'glitch_table.html'), 'rb') as fp:
+        html = fp.read()
+
+    responses = []
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if len(responses) > 2:
+                responses.append(500)
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            if self.headers.get('If-None-Match') == '"v1"':
+                responses.append(304)
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            responses.append(200)
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(html)))
+            self.end_headers()
+            self.wfile.write(html)
+
+        def log_message(self, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = 'http://127.0.0.1:{}/gTable.html'.format(server.server_port)
+
+    try:
+        table = get_glitch_catalogue(url=url, maxage=0)
+
+        assert len(table) == 3
+        assert list(table['JNAME']) == ['J0534+2200', 'J0534+2200', 'J0835-4510']
+        assert list(table['Glitch number']) == [1, 2, 1]
+        assert np.isnan(table['DeltaF1/F1_ERR'][1])
+        assert table['DeltaF/F'][2] == pytest.approx(2338e-9)
+        assert table['Reference'][1] == 'Lohsen 1981'
+        assert table['Reference'][2].endswith('1969Natur.222..228R')
+        assert table['MJD'].unit == 'd'
+
+        # the server is checked, but the page is not downloaded again
+        crab = get_glitch_catalogue(psr='B0531+21', url=url, maxage=0)
+        assert responses == [200, 304]
+        assert len(crab) == 2
+        assert np.array_equal(crab['MJD'], table['MJD'][:2])
+
+        # within the maximum age the server is not checked
+        vela = get_glitch_catalogue(psr='J0835-4510', url=url)
+        assert responses == [200, 304]
+        assert len(vela) == 1
+
+        # a read-only cache file is still used
+        def utime(*args, **kwargs):
+            raise OSError("Read-only file system")
+
+        with monkeypatch.context() as m:
+            m.setattr(os, 'utime', utime)
+            crab = get_glitch_catalogue(psr='B0531+21', url=url, maxage=0)
+        assert responses == [200, 304, 304]
+        assert len(crab) == 2
+
+        # the cached table is used if the server returns an error
+        with pytest.warns(UserWarning):
+            crab = get_glitch_catalogue(psr='B0531+21', url=url, maxage=0)
+        assert responses == [200, 304, 304, 500]
+        assert len(crab) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # the cached table is used if the server cannot be reached
+    with pytest.warns(UserWarning):
+        vela = get_glitch_catalogue(psr='J0835-4510', url=url, maxage=0)
+    assert len(vela) == 1
+
+    # without a cached table the error is raised
+    with pytest.raises(RuntimeError):
+        get_glitch_catalogue(url=url, cache=False)
+
+
+def test_add_glitches():
+    """
+    Test adding glitch catalogue aggregates to the catalogue.
+    """
+
+    from astropy.table import Table
+    from psrqpy.utils import glitch_aggregates
+
+    glitches = Table({'NAME': ['TEST1', 'TEST1', 'TEST1', 'B0000+00'],
+                      'JNAME': ['TEST1', 'TEST1', 'TEST1', 'J9999+9999'],
+                      'Glitch number': [1, 2, 3, 1],
+                      'MJD': [50000., 51000., 53000., 52000.],
+                      'DeltaF/F': [1e-9, 2e-9, np.nan, 5e-6],
+                      'DeltaF1/F1': [1e-3, 1e-3, 1e-3, 2e-3]})
+
+    aggregates = glitch_aggregates(glitches)
+    assert list(aggregates['GLITCH_N']) == [3, 1]
+    assert aggregates['GLITCH_INTERVAL'][0] == 1500.
+    assert np.isnan(aggregates['GLITCH_INTERVAL'][1])
+
+    query = QueryATNF(params=['JNAME', 'GLITCH_N', 'GLITCH_LAST'],
+                      loadfromdb='test/test_catalogue.db')
+
+    with pytest.raises(KeyError, match='add_glitches'):
+        query.pandas
+
+    query.add_glitches(glitches)
+
+    # glitch values are not catalogue parameters, so are not in ephemerides
+    assert 'GLITCH' not in query.get_ephemeris('TEST1')
+
+    table = query.table
+    assert table['GLITCH_LAST'].unit == 'd'
+    assert list(table['GLITCH_N']) == [3, 0, 0, 0]
+    assert table['GLITCH_LAST'][0] == 53000.
+    assert query.catalogue['GLITCH_DF'][0] == pytest.approx(3e-9)
+    assert query.catalogue['GLITCH_MAXDF'][0] == pytest.approx(2e-9)
+    assert np.isnan(query.catalogue['GLITCH_FIRST'][1])
+
+    # aggregates can be used in conditions
+    query.condition = 'GLITCH_N > 1 && GLITCH_LAST > 52000'
+    assert list(query.table['JNAME']) == ['TEST1']
+
+    # adding again replaces the values
+    query.add_glitches(glitches[:2])
+    assert query.catalogue['GLITCH_N'][0] == 2
+    assert query.catalogue['GLITCH_LAST'][0] == 51000.
+    assert len(query) == 0  # last glitch is now before MJD 52000
+
+
+def test_ppdot_density():
+    """
+    Test the density mode of the P-Pdot diagram.
+    """
+
+    pytest.importorskip('matplotlib')
+    from matplotlib.collections import QuadMesh
+    from matplotlib.figure import Figure
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db')
+
+    rcparams = {'text.usetex': False, 'figure.dpi': 50}
+    fig = query.ppdot(density=True, bins=[20, 30], showtypes=['BINARY'],
+                      typedensity=True, rcparams=rcparams)
+    assert isinstance(fig, Figure)
+
+    ax = fig.axes[0]
+    meshes = [c for c in ax.collections if isinstance(c, QuadMesh)]
+    assert len(meshes) == 1
+    assert meshes[0].get_rasterized()
+    assert meshes[0].get_array().size == 30 * 20
+    assert meshes[0].get_array().sum() == np.sum(query.catalogue['P1'] > 0)
+    assert ax.get_xscale() == 'log'
+    assert ax.get_legend() is not None
+
+    fig = query.ppdot(showtypes=['BINARY'], rasterized=True, rcparams=rcparams)
+    assert all(line.get_rasterized() for line in fig.axes[0].lines if line.get_marker() != 'None')
+
+
+def test_ppdot_template():
+    """
+    Test reusing a P-Pdot diagram background template.
+    """
+
+    pytest.importorskip('matplotlib')
+    import matplotlib as mpl
+    from psrqpy.utils import PPdotTemplate
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db')
+
+    usetex = mpl.rcParams['text.usetex']
+    template = PPdotTemplate([1e-3, 10.], [1e-21, 1e-10], tau=[1e6, 5e7],
+                             rcparams={'text.usetex': False, 'figure.dpi': 50,
+                                       'font.size': 11})
+    assert len(template.taulines) == 2
+    assert len(template.Blines) == 5
+
+    fig1 = query.ppdot(template=template)
+    fig2 = query.ppdot(template=template, showtypes=['BINARY'])
+
+    # global rcparams are unchanged
+    assert mpl.rcParams['text.usetex'] == usetex
+
+    assert fig1 is not fig2
+    ax1, ax2 = fig1.axes[0], fig2.axes[0]
+    assert ax1.get_xlim() == pytest.approx((1e-3, 10.))
+    assert ax1.get_ylim() == pytest.approx((1e-21, 1e-10))
+    assert fig1.get_dpi() == 50
+
+    # background lines and labels are in both, with only pulsars added
+    assert len(ax1.texts) == len(ax2.texts) == 7
+    assert len(ax2.lines) == len(ax1.lines) + 1
+    assert ax1.get_legend() is None and ax2.get_legend() is not None
+
+    # non-power of ten values have a multiplication sign in their labels
+    assert PPdotTemplate._label(5e7, 'yr') == r'${5.0}\!\times\!10^{7}\,{\rm yr}$'
+    assert PPdotTemplate._label(1e6, 'yr') == r'$10^{6}\,{\rm yr}$'
+
+
+def test_kernels():
+    """
+    Test the broadcasting physical formula functions.
+    """
+
+    import astropy.units as u
+    from psrqpy.utils import (characteristic_age, B_field, B_field_lc,
+                              spin_down_luminosity, spin_down_flux, age_pdot,
+                              B_field_pdot)
+
+    periods = np.array([0.089, 0.0016, 1.2, np.nan, 2.])
+    pdots = np.array([1.25e-13, 1e-20, -1e-15, 1e-15, np.inf])
+
+    age = characteristic_age(periods, pdots)
+    assert age[0] == pytest.approx(0.089/(2*1.25e-13)/(365.25*86400))
+    assert np.all(np.isnan(age[2:]))
+
+    # scalar inputs return scalars
+    assert isinstance(B_field(0.089, 1.25e-13), float)
+    assert B_field(0.089, 1.25e-13) == pytest.approx(3.2e19*np.sqrt(0.089*1.25e-13))
+
+    # Series, Quantity and lists give the same values
+    assert np.array_equal(B_field(Series(periods), list(pdots)), B_field(periods, pdots),
+                          equal_nan=True)
+    assert np.array_equal(spin_down_luminosity(periods*1e3*u.ms, pdots),
+                          spin_down_luminosity(periods, pdots), equal_nan=True)
+    assert B_field_lc(0.089, 1.25e-13) == pytest.approx(3e8*np.sqrt(1.25e-13)*0.089**-2.5)
+    assert spin_down_flux(0.089, 1.25e-13, 2.) == pytest.approx(
+        spin_down_luminosity(0.089, 1.25e-13)/4.)
+
+    # output buffer is used
+    out = np.empty(5)
+    res = spin_down_luminosity(periods, pdots, out=out)
+    assert res is out
+    assert out[1] == pytest.approx(4*np.pi**2*1e45*1e-20/0.0016**3)
+
+    with pytest.raises(ValueError):
+        spin_down_luminosity(periods, pdots, out=np.empty(3))
+
+    # broadcasting
+    grid = characteristic_age(periods[:3, np.newaxis], pdots[np.newaxis, :2])
+    assert grid.shape == (3, 2)
+    assert grid[1, 0] == pytest.approx(characteristic_age(0.0016, 1.25e-13))
+
+    assert age_pdot([0.1, 1.], tau=1e6)[1] == pytest.approx(1./(2e6*365.25*86400))
+    assert B_field_pdot(np.array([1., -1.]), Bfield=3.2e19*u.G)[0] == 1.
+    assert np.isnan(B_field_pdot(np.array([1., -1.]))[1])
+
+    with pytest.raises(ValueError):
+        characteristic_age(1., 1e-15, braking_idx=1.)
+
+    try:
+        import numexpr  # noqa: F401
+    except ImportError:
+        with pytest.warns(UserWarning):
+            characteristic_age(periods, pdots, usenumexpr=True)
+    else:
+        assert np.allclose(characteristic_age(periods, pdots, usenumexpr=True), age,
+                           equal_nan=True)
+
+
+def test_propagate_uncertainties():
+    """
+    Test the Monte Carlo propagation of uncertainties to derived parameters.
+    """
+
+    from pandas import DataFrame
+    from astropy.constants import c, GM_sun
+    from psrqpy.utils import propagate_uncertainties, companion_mass
+
+    rng = np.random.default_rng(0)
+    npsr = 200
+    table = DataFrame({'P0': 10**rng.uniform(-2.5, 0.5, npsr),
+                       'P1': 10**rng.uniform(-19, -13, npsr),
+                       'A1': rng.uniform(1., 30., npsr),
+                       'PB': rng.uniform(0.5, 100., npsr)})
+    for par in ['P0', 'P1', 'A1', 'PB']:
+        table[par + '_ERR'] = 0.01*table[par]
+    table.loc[0, 'P1_ERR'] = np.nan  # no uncertainties for the first pulsar
+    table.loc[0, 'P0_ERR'] = np.nan
+
+    errs = propagate_uncertainties(table, ['AGE', 'MASSFN', 'MINMASS'],
+                                   nsamples=2000, quantiles=[0.025, 0.5],
+                                   chunksize=64, seed=1)
+
+    assert list(errs.columns) == ['AGE_ERR', 'AGE_Q2_5', 'AGE_Q50',
+                                  'MASSFN_ERR', 'MASSFN_Q2_5', 'MASSFN_Q50',
+                                  'MINMASS_ERR', 'MINMASS_Q2_5', 'MINMASS_Q50']
+    assert np.isnan(errs['AGE_ERR'][0])
+    assert np.isfinite(errs['MASSFN_ERR'][0])
+
+    # compare to the analytic uncertainties
+    age = table['P0']/(2.*table['P1']*365.25*86400.)
+    assert np.median(errs['AGE_ERR'][1:]/(age[1:]*np.sqrt(2.)*0.01)) == pytest.approx(1., abs=0.05)
+    assert np.median(errs['AGE_Q50'][1:]/age[1:]) == pytest.approx(1., abs=0.01)
+
+    massfn = (4.*np.pi**2/GM_sun.value)*(table['A1']*c.value)**3/(table['PB']*86400.)**2
+    assert np.median(errs['MASSFN_ERR']/(massfn*np.sqrt(0.03**2 + 0.02**2))) == pytest.approx(
+        1., abs=0.05)
+
+    # companion masses solve the mass function equation
+    minmass = companion_mass(massfn.values)
+    assert np.allclose((1.35 + minmass)**2, minmass**3/massfn.values)
+    assert np.median(errs['MINMASS_Q50']/minmass) == pytest.approx(1., abs=0.01)
+
+    # results do not depend on the number of processes
+    errspool = propagate_uncertainties(table, ['AGE', 'MASSFN', 'MINMASS'],
+                                       nsamples=2000, quantiles=[0.025, 0.5],
+                                       chunksize=64, seed=1, nprocs=2)
+    assert errs.equals(errspool)
+
+    with pytest.raises(KeyError):
+        propagate_uncertainties(table, 'F0')
+
+    with pytest.raises(ValueError):
+        propagate_uncertainties(table, 'AGE', quantiles=[50])
+
+    # add values to the catalogue
+    query = QueryATNF(loadfromdb='test/test_catalogue.db')
+    qerrs = query.propagate_uncertainties(['AGE', 'EDOT'], nsamples=100, seed=1)
+    assert len(qerrs) == len(query)
+    assert 'EDOT_ERR' in query.columns
+    assert np.array_equal(query.catalogue['AGE_ERR'].values[query._query_indices()],
+                          qerrs['AGE_ERR'].values, equal_nan=True)
+
+
+def test_load_stats():
+    """
+    Test recording statistics for each stage of loading the catalogue.
+    """
+
+    from psrqpy.utils import LoadStats
+
+    events = []
+
+    def hook(event, stage, stats):
+        events.append((event, stage))
+
+    query = QueryATNF(loadfromdb='test/test_catalogue.db', stats=True)
+    stats = query.load_stats
+
+    for stage in ['parse', 'coordinates', 'dataframe', 'set_derived',
+                  'set_derived/derived_age', 'set_derived/define_dist', 'parse_types']:
+        assert stage in stats
+        assert stats[stage]['calls'] == 1
+        assert stats[stage]['wall'] >= 0.
+
+    assert stats['set_derived']['wall'] >= stats['set_derived/derived_age']['wall']
+    assert stats.wall >= stats['parse']['wall']
+    assert '  derived_age' in str(stats)
+    assert len(stats.as_dataframe()) == len(stats)
+
+    # sorting is recorded the first time it is calculated
+    query.sort('P0')
+    query.table
+    assert stats['sort']['calls'] == 1
+
+    # no statistics are recorded by default
+    query = QueryATNF(loadfromdb='test/test_catalogue.db')
+    assert len(query.load_stats) == 0
+
+    # use a hook
+    LoadStats.add_hook(hook)
+    try:
+        query = QueryATNF(loadfromdb='test/test_catalogue.db')
+    finally:
+        LoadStats.remove_hook(hook)
+
+    assert ('start', 'parse') in events
+    assert ('end', 'set_derived/derived_age') in events
+    assert 'parse' in query.load_stats
+
+    # errors in hooks give warnings
+    def badhook(event, stage, stats):
+        raise RuntimeError('bad hook')
+
+    with pytest.warns(UserWarning):
+        query = QueryATNF(loadfromdb='test/test_catalogue.db',
+                          stats=LoadStats(hooks=[badhook]))
+    assert 'parse' in query.load_stats
+
+
+def test_lazy_imports():
+    """
+    Test that importing psrqpy does not import the heavy dependencies until
+    they are required.
+    """
+
+    import sys
+    import subprocess
+    import psrqpy
+    import psrqpy.utils
+
+    code = ("import sys\n"
+            "import psrqpy\n"
+            "heavy = ['astropy', 'pandas', 'requests', 'numpy']\n"
+            "assert not any(mod in sys.modules for mod in heavy)\n"
+            "from psrqpy import characteristic_age, ATNF_TARBALL\n"
+            "assert characteristic_age(1., 1e-15) > 0.\n"
+            "assert not any(mod in sys.modules for mod in heavy[:-1])\n"
+            "assert 'QueryATNF' in dir(psrqpy)\n"
+            "psrqpy.QueryATNF\n"
+            "assert 'astropy' in sys.modules\n")
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(psrqpy.__file__)),
+                                         env.get('PYTHONPATH', '')])
+    proc = subprocess.run([sys.executable, '-c', code], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.returncode == 0, proc.stderr.decode()
+
+    # all public objects are available from the package
+    for name, value in vars(psrqpy.utils).items():
+        if not name.startswith('_') and getattr(value, '__module__', None) == 'psrqpy.utils':
+            assert name in psrqpy.__all__
+            assert getattr(psrqpy, name) is value
+
+    assert psrqpy.QueryATNF is psrqpy.search.QueryATNF
+    assert psrqpy.PSR_ALL is psrqpy.config.PSR_ALL
+
+    with pytest.raises(AttributeError):
+        psrqpy.not_a_function
+
+
+def test_prefetch():
+    """
+    Test loading the catalogue in the background with a future, with
+    asyncio, and cancelling the loading.
+    """
+
+    import asyncio
+    import threading
+    from psrqpy.utils import LoadStats
+
+    events = []
+
+    def progress(event, stage, info):
+        events.append((event, stage))
+
+    future = QueryATNF.prefetch(progress=progress, loadfromdb='test/test_catalogue.db',
+                                params=['JNAME', 'F0'])
+    query = future.result(timeout=60)
+
+    assert isinstance(query, QueryATNF)
+    assert len(query) == 4
+    assert query.load_stats is future.load_stats
+    assert ('start', 'parse') in events
+    assert ('end', 'set_derived/derived_age') in events
+
+    # errors are passed to the future
+    future = QueryATNF.prefetch(loadfromdb='not_a_file.db')
+    with pytest.raises(RuntimeError):
+        future.result(timeout=60)
+
+    # cancel the loading while parsing
+    parsing = threading.Event()
+    cancelled = threading.Event()
+    events = []
+
+    def blocking(event, stage, info):
+        events.append((event, stage))
+        if event == 'start' and stage == 'parse':
+            parsing.set()
+            cancelled.wait(60)
+
+    future = QueryATNF.prefetch(progress=blocking, loadfromdb='test/test_catalogue.db')
+    assert parsing.wait(60)
+    assert future.cancel()
+    assert future.load_stats.cancelled
+    cancelled.set()
+
+    for thread in threading.enumerate():
+        if thread.name == 'psrqpy-prefetch':
+            thread.join(60)
+
+    assert future.cancelled()
+    assert ('end', 'parse') in events
+    assert ('start', 'set_derived') not in events
+
+    with pytest.raises(RuntimeError):
+        future.load_stats.stage('parse')
+
+    # asyncio, with progress callbacks in the event loop's thread
+    threads = set()
+
+    def asyncprogress(event, stage, info):
+        threads.add(threading.current_thread())
+
+    async def load():
+        return await QueryATNF.load_async(progress=asyncprogress,
+                                          loadfromdb='test/test_catalogue.db')
+
+    query = asyncio.run(load())
+    assert len(query) == 4
+    assert threads == {threading.main_thread()}
+
+    # legacy LoadStats objects can not be cancelled
+    stats = LoadStats()
+    del stats._cancelled
+    assert not stats.cancelled
+
+    # download with the thread's shared session from a local server
+    from six.moves import BaseHTTPServer
+    from psrqpy.utils import download_file, get_session
+
+    content = os.urandom(200000)
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = 'http://127.0.0.1:{}/psrcat_pkg.tar.gz'.format(server.server_port)
+    updates = []
+
+    def downloadprogress(event, stage, info):
+        updates.append(info)
+
+    try:
+        stats = LoadStats(hooks=[downloadprogress])
+        with stats.stage('download'):
+            fname = download_file(url, stats=stats)
+
+        with open(fname, 'rb') as fp:
+            assert fp.read() == content
+        os.remove(fname)
+
+        assert updates[-2] == {'bytes': len(content), 'total': len(content)}
+        assert get_session() is get_session()
+
+        # each thread has its own session
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(get_session()))
+        thread.start()
+        thread.join()
+        assert sessions[0] is not get_session()
+
+        # cancel the download
+        stats = LoadStats()
+        stats.cancel()
+        with pytest.raises(RuntimeError):
+            download_file(url, stats=stats)
+    finally:
+        server.shutdown()
+
+
+def test_catalogue_server(tmp_path, monkeypatch):
+    """
+    Test querying a catalogue kept in memory by a server.
+    """
+
+    import socket
+    import threading
+    import warnings
+    from psrqpy.serve import CatalogueServer, query_server, server_info
+
+    monkeypatch.setenv('PSRQPY_CACHE_DIR', str(tmp_path / 'cache'))
+
+    dbfile = 'test/test_catalogue.db'
+    kwargs = {'params': ['JNAME', 'F0', 'P0'], 'condition': 'F0 > 1',
+              'sort_attr': 'F0', 'sort_order': 'desc'}
+
+    local = QueryATNF(loadfromdb=dbfile, **kwargs)
+
+    with CatalogueServer(port=0, loadfromdb=dbfile) as server:
+        server.start()
+
+        info = server_info(server.address)
+        assert info['nrows'] == local.catalogue_nrows
+        assert info['ncols'] == local.catalogue_ncols
+
+        # query tables are the same as local queries
+        table = query_server(server.address, **kwargs)
+        assert len(table) == 2
+        assert table.equals(local.pandas[table.columns])
+
+        # warnings and errors are passed on (for every query)
+        for _ in range(2):
+            with pytest.warns(UserWarning):
+                assert len(query_server(server.address, psrs=['J9999+9999'])) == 0
+
+        # the warning filters are only changed while queries are running
+        filters = list(warnings.filters)
+        for _ in range(2):
+            assert len(server.query_table(psrs=['J9999+9999'])[2]) == 1
+        assert warnings.filters == filters
+
+        with pytest.raises(ValueError):
+            query_server(server.address, loadfromdb='another.db')
+
+        with pytest.raises(ValueError):
+            query_server(server.address, sort_attr='NOTAPARAM')
+
+        # the catalogue is only transferred once
+        query = QueryATNF(server=server.address, **kwargs)
+        assert query.pandas.equals(local.pandas)
+        assert query.catalogue.equals(local.catalogue)
+
+        query = QueryATNF(server=server.address, params='P0', condition='P0 < 0.01')
+        assert len(query) == 1
+        assert server.counts['/catalogue'] == 1
+
+        with pytest.raises(KeyError):
+            QueryATNF(server=server.address, sort_attr='NOTAPARAM')
+
+        # other requests are handled while a query is in progress
+        entered, release = threading.Event(), threading.Event()
+        released = []
+        query_indices = QueryATNF._query_indices
+
+        def blocked(self, *args, **kwargs):
+            entered.set()
+            released.append(release.wait(10))
+            return query_indices(self, *args, **kwargs)
+
+        monkeypatch.setattr(QueryATNF, '_query_indices', blocked)
+        thread = threading.Thread(target=query_server, args=(server.address,),
+                                  kwargs=kwargs)
+        thread.start()
+        assert entered.wait(10)
+        assert server_info(server.address)['token'] == info['token']
+        release.set()
+        thread.join()
+        assert released[0]
+
+        # reloading gives the same catalogue
+        server.reload()
+        assert server_info(server.address)['token'] == info['token']
+
+    with pytest.raises(IOError):
+        server_info(server.address)
+
+    # use a Unix socket
+    if hasattr(socket, 'AF_UNIX'):
+        socketpath = str(tmp_path / 'psrqpy.sock')
+        with CatalogueServer(unix_socket=socketpath, loadfromdb=dbfile) as server:
+            server.start()
+            assert server.address == 'unix:' + socketpath
+            assert query_server(server.address, **kwargs).equals(table)
+            assert len(QueryATNF(server=server.address)) == local.catalogue_nrows
+
+        assert not os.path.exists(socketpath)